@@ -4,13 +4,17 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Literal, Optional
+from typing import Literal, Optional, Sequence, Union
 
 import numpy as np
 import pandas as pd
 
+from backtest_engine import MetricsAccumulator
+
 
 Objective = Literal["求高", "求稳", "平衡"]
+# 默认候选阈值：训练集评分的 50%~98% 分位数
+DEFAULT_QUANTILES = np.linspace(0.5, 0.98, 25)
 
 
 @dataclass(frozen=True)
@@ -65,50 +69,117 @@ def perf_metrics(equity: pd.Series) -> dict:
     }
 
 
-def simulate_equity_from_eval_df(
-    eval_df: pd.DataFrame,
-    buy_threshold: float,
-    holding_days: int,
-    fee_bps: float = 10.0,
-) -> tuple[pd.Series, int]:
-    if eval_df is None or eval_df.empty:
-        return pd.Series(dtype=float), 0
-
+def _eval_columns(eval_df: pd.DataFrame) -> tuple[list, list, list]:
+    # 按日期排序后的 评分/未来收益/日期 列表，逐行扫描时避免 df.iloc
     df = eval_df.copy()
     df["日期"] = pd.to_datetime(df["日期"])
     df = df.sort_values("日期").reset_index(drop=True)
+    return df["评分"].astype(float).tolist(), df["未来收益"].astype(float).tolist(), df["日期"].tolist()
+
 
+def _eval_trades(scores: list, rets: list, buy_threshold: float, holding_days: int, fee_bps: float) -> list[tuple[int, float]]:
+    # 评分达阈值即按未来收益成交一笔并跳过持有期，返回 (行号, 成交后资金)
     capital = 1.0
     points = []
     i = 0
-    trades = 0
     fee = float(fee_bps) / 10000.0
-    while i < len(df):
-        row = df.iloc[i]
-        if float(row["评分"]) >= float(buy_threshold):
-            r = float(row["未来收益"]) / 100.0
-            capital *= (1 + r - fee)
-            points.append((row["日期"], capital))
-            trades += 1
-            i += max(1, int(holding_days))
+    th = float(buy_threshold)
+    step = max(1, int(holding_days))
+    while i < len(scores):
+        if scores[i] >= th:
+            capital *= (1 + rets[i] / 100.0 - fee)
+            points.append((i, capital))
+            i += step
         else:
             i += 1
+    return points
 
+
+def simulate_equity_from_eval_df(
+    eval_df: pd.DataFrame,
+    buy_threshold: float,
+    holding_days: int,
+    fee_bps: float = 10.0,
+) -> tuple[pd.Series, int]:
+    if eval_df is None or eval_df.empty:
+        return pd.Series(dtype=float), 0
+
+    scores, rets, dates = _eval_columns(eval_df)
+    points = _eval_trades(scores, rets, buy_threshold, holding_days, fee_bps)
     if not points:
         return pd.Series(dtype=float), 0
-    s = pd.Series([p[1] for p in points], index=pd.to_datetime([p[0] for p in points])).sort_index()
-    return s, trades
+    s = pd.Series([p[1] for p in points], index=pd.to_datetime([dates[p[0]] for p in points])).sort_index()
+    return s, len(points)
+
+
+def _eval_metrics(dates: list, points: list[tuple[int, float]]) -> dict:
+    # 等价于 perf_metrics(simulate_equity_from_eval_df(...)[0])，以 MetricsAccumulator 累计，不构造净值序列
+    valid = [(i, cap) for i, cap in points if cap == cap]
+    if not valid:
+        return perf_metrics(None)
+    acc = MetricsAccumulator.start(valid[0][1])
+    for _i, cap in valid[1:]:
+        acc.update(cap)
+    return acc.metrics(pd.Timestamp(dates[valid[0][0]]), pd.Timestamp(dates[valid[-1][0]]))
+
+
+def simulate_metrics_from_eval_df(
+    eval_df: pd.DataFrame,
+    buy_threshold: float,
+    holding_days: int,
+    fee_bps: float = 10.0,
+) -> tuple[dict, int]:
+    # 只需要指标时代替 simulate_equity_from_eval_df + perf_metrics
+    if eval_df is None or eval_df.empty:
+        return perf_metrics(None), 0
+    scores, rets, dates = _eval_columns(eval_df)
+    points = _eval_trades(scores, rets, buy_threshold, holding_days, fee_bps)
+    return _eval_metrics(dates, points), len(points)
+
+
+def threshold_sweep(
+    eval_df: pd.DataFrame,
+    thresholds: Union[None, str, Sequence[float]] = None,
+) -> pd.DataFrame:
+    # 评分降序排序一次，前缀累计和给出每个候选阈值下 评分>=阈值 的样本数、胜率与平均未来收益，O(N log N)
+    # thresholds: None 为默认分位数网格，"all" 为全部不同评分（完整曲线），或任意阈值序列
+    scores = eval_df["评分"].to_numpy(dtype=np.float64)
+    rets = eval_df["未来收益"].to_numpy(dtype=np.float64)
+    keep = ~np.isnan(scores)
+    scores, rets = scores[keep], rets[keep]
+    if thresholds is None:
+        grid = np.quantile(scores, DEFAULT_QUANTILES) if len(scores) else np.empty(0)
+    elif isinstance(thresholds, str):
+        if thresholds != "all":
+            raise ValueError(f"未知的阈值网格: {thresholds}")
+        grid = scores
+    else:
+        grid = np.asarray(thresholds, dtype=np.float64)
+    grid = np.unique(grid)
+
+    order = np.argsort(-scores, kind="stable")
+    desc = scores[order]
+    r = rets[order]
+    valid = ~np.isnan(r)
+    # top[c] 为评分最高的 c 个样本的累计量
+    top_win = np.concatenate([[0], np.cumsum(r > 0)])
+    top_valid = np.concatenate([[0], np.cumsum(valid)])
+    top_sum = np.concatenate([[0.0], np.cumsum(np.where(valid, r, 0.0))])
+    samples = np.searchsorted(-desc, -grid, side="right")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        win_rate = np.where(samples > 0, top_win[samples] / samples * 100, 0.0)
+        avg_return = np.where(top_valid[samples] > 0, top_sum[samples] / top_valid[samples], 0.0)
+    return pd.DataFrame({
+        "threshold": grid,
+        "samples": samples.astype(int),
+        "win_rate": win_rate,
+        "avg_return": avg_return,
+    })
 
 
 def _threshold_candidates(train_df: pd.DataFrame, min_samples: int) -> list[float]:
-    scores = train_df["评分"].astype(float)
-    qs = np.linspace(0.5, 0.98, 25)
-    cands = sorted(set(float(scores.quantile(q)) for q in qs))
-    out = []
-    for th in cands:
-        if int((train_df["评分"] >= th).sum()) >= int(min_samples):
-            out.append(float(th))
-    return out
+    curve = threshold_sweep(train_df)
+    return [float(th) for th in curve.loc[curve["samples"] >= int(min_samples), "threshold"]]
 
 
 def optimize_on_train_pick_on_val(
@@ -136,11 +207,13 @@ def optimize_on_train_pick_on_val(
         return res, pd.DataFrame()
 
     ths = _threshold_candidates(train_df, min_samples=max(10, int(min_samples)))
+    val_scores, val_rets, val_dates = _eval_columns(val_df)
     rows = []
     for hold in holding_grid:
         for th in ths:
-            eq, trades = simulate_equity_from_eval_df(val_df, th, hold, fee_bps=fee_bps)
-            m = perf_metrics(eq)
+            points = _eval_trades(val_scores, val_rets, th, hold, fee_bps)
+            m = _eval_metrics(val_dates, points)
+            trades = len(points)
             score = None
             if objective == "求高":
                 score = m["年化收益%"]
@@ -159,6 +232,7 @@ def optimize_on_train_pick_on_val(
             )
 
     grid = pd.DataFrame(rows)
+    grid.attrs["threshold_curve"] = threshold_sweep(train_df, "all")
     if grid.empty:
         eq, trades = simulate_equity_from_eval_df(val_df, 1000, 1, fee_bps=fee_bps)
         cfg = StrategyConfig(name=f"{objective}-fallback", buy_threshold=1000, holding_days=1, fee_bps=fee_bps)
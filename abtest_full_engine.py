@@ -3,16 +3,26 @@
 
 from __future__ import annotations
 
+import os
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Literal, Optional
+from multiprocessing import shared_memory
+from typing import Callable, Literal, Optional
 
 import numpy as np
 import pandas as pd
 
-from backtest_engine import BacktestParams, run_backtest
+from backtest_engine import (BacktestParams, run_backtest_grid, run_backtest_grid_columns,
+                             score_backtest_columns)
 
 
 Objective = Literal["求高", "求稳", "平衡"]
+ExecutorKind = Literal["serial", "thread", "process"]
+# grid: 全部组合在完整训练集上回测；halving: 逐次减半，先在训练集前段筛选再扩展到完整训练集
+SearchMode = Literal["grid", "halving"]
+# progress_callback(已完成任务数, 任务总数, {"fold", "side", "fold_done", "found"})
+ProgressCallback = Callable[[int, int, dict], None]
 
 
 @dataclass(frozen=True)
@@ -63,6 +73,52 @@ def _time_index(kline: pd.DataFrame) -> pd.DatetimeIndex:
     return pd.DatetimeIndex(kl.sort_index().index)
 
 
+def _successive_halving(
+    combos: list[BacktestParams],
+    run_many: Callable,
+    index: pd.DatetimeIndex,
+    train_start: pd.Timestamp,
+    train_end: pd.Timestamp,
+    objective: Objective,
+    min_trades: int,
+    top_k: int,
+    eta: int = 3,
+    min_bars: int = 120,
+) -> tuple[list[BacktestParams], list[dict]]:
+    # 逐次减半：全部组合先在训练集最短前段回测，按 _objective_score 保留前 1/eta，幸存者扩展到 eta 倍长的前段；
+    # 轮数取到最后一段前仍至少保留 top_k 个组合、最短前段不少于 min_bars 根为止。返回的幸存者（保持原顺序）
+    # 由调用方在完整训练集上按网格模式同样评分与过滤，train_score 与网格模式可直接比较。
+    # 同一轮次所有组合共用同一窗口，年化收益/夏普/回撤可直接比较；交易次数下限按窗口占比缩放
+    eta = max(2, int(eta))
+    train_idx = index[(index >= pd.to_datetime(train_start)) & (index <= pd.to_datetime(train_end))]
+    total = len(train_idx)
+    n_rungs = 0
+    while len(combos) / eta ** (n_rungs + 1) >= top_k and total / eta ** (n_rungs + 1) >= min_bars:
+        n_rungs += 1
+
+    survivors = list(combos)
+    rungs = []
+    for r in range(n_rungs, 0, -1):
+        bars = int(np.ceil(total / eta ** r))
+        window_end = train_idx[bars - 1]
+        need = int(np.ceil(int(min_trades) * bars / total))
+        results = run_many(survivors, train_start, window_end, with_equity=False)
+        ranked = []
+        for order, (params, res) in enumerate(zip(survivors, results)):
+            m = res.metrics
+            if int(m.get("交易次数", 0)) < need:
+                key = (0, 0.0, 0.0, 0.0)
+            else:
+                key = (1, _objective_score(m, objective), float(m.get("年化收益%", 0.0)), float(m.get("夏普", 0.0)))
+            ranked.append((key, order, params))
+        ranked.sort(key=lambda item: (item[0], -item[1]), reverse=True)
+        keep = max(int(top_k), int(np.ceil(len(survivors) / eta)))
+        rungs.append({"rung": n_rungs - r + 1, "train_end": window_end, "bars": bars,
+                      "candidates": len(survivors), "kept": min(keep, len(survivors))})
+        survivors = [params for _key, _order, params in sorted(ranked[:keep], key=lambda item: item[1])]
+    return survivors, rungs
+
+
 def _search_one_range(
     kline: pd.DataFrame,
     scorer,
@@ -75,12 +131,31 @@ def _search_one_range(
     min_trades: int,
     fee_bps: float,
     top_k: int = 20,
+    grid_runner: Optional[Callable] = None,
+    search: SearchMode = "grid",
+    halving_eta: int = 3,
+    halving_min_bars: int = 120,
+    index: Optional[pd.DatetimeIndex] = None,
 ) -> tuple[Optional[dict], pd.DataFrame]:
+    # index 为 grid_runner 所用K线的时间索引，逐次减半时据此划分训练集前段；默认取自 kline
     rows = []
     cache: dict = {}
-
-    def _run(params: BacktestParams, start_dt: pd.Timestamp, end_dt: pd.Timestamp):
-        key = (
+    if search not in ("grid", "halving"):
+        raise ValueError(f"未知的搜索方式: {search}")
+    if grid_runner is None and search == "halving":
+        # 各轮次窗口不同，全序列只评分一次后按区间截取
+        index, block = score_backtest_columns(kline, scorer)
+
+        def grid_runner(params_list, start_dt, end_dt, with_equity=True):
+            return run_backtest_grid_columns(index, block, params_list, start_date=start_dt, end_date=end_dt,
+                                             with_equity=with_equity)
+    elif grid_runner is None:
+        def grid_runner(params_list, start_dt, end_dt, with_equity=True):
+            return run_backtest_grid(kline, scorer, params_list, start_date=start_dt, end_date=end_dt,
+                                     with_equity=with_equity)
+
+    def _key(params: BacktestParams, start_dt: pd.Timestamp, end_dt: pd.Timestamp):
+        return (
             round(params.buy_threshold, 4),
             round(params.sell_threshold, 4),
             int(params.max_holding_days),
@@ -91,48 +166,76 @@ def _search_one_range(
             pd.to_datetime(start_dt),
             pd.to_datetime(end_dt),
         )
-        v = cache.get(key)
-        if v is not None:
-            return v
-        r = run_backtest(kline, scorer, params, start_date=start_dt, end_date=end_dt)
-        cache[key] = r
-        return r
 
+    def _run_many(params_list: list[BacktestParams], start_dt: pd.Timestamp, end_dt: pd.Timestamp,
+                  with_equity: bool = True):
+        # 同一区间只评分一次，未缓存的参数组合在一次网格模拟中同时回测；
+        # 训练集只比较指标，不构造净值序列（with_equity=False）
+        missing = {}
+        for params in params_list:
+            key = _key(params, start_dt, end_dt)
+            if key in missing:
+                continue
+            if key not in cache or (with_equity and cache[key].equity_curve is None):
+                missing[key] = params
+        if missing:
+            results = grid_runner(list(missing.values()), start_dt, end_dt, with_equity)
+            cache.update(zip(missing.keys(), results))
+        return [cache[_key(params, start_dt, end_dt)] for params in params_list]
+
+    def _run(params: BacktestParams, start_dt: pd.Timestamp, end_dt: pd.Timestamp):
+        return _run_many([params], start_dt, end_dt)[0]
+
+    combos = []
     for buy in space.buy_thresholds:
         sell = float(buy) - float(space.sell_gap)
         sell = max(0.0, min(100.0, sell))
         for hold in space.holding_days:
             for tp in space.take_profit_pcts:
                 for sl in space.stop_loss_pcts:
-                    params = BacktestParams(
-                        buy_threshold=float(buy),
-                        sell_threshold=float(sell),
-                        max_holding_days=int(hold),
-                        take_profit_pct=float(tp),
-                        stop_loss_pct=float(sl),
-                        fee_bps=float(fee_bps),
-                        price_filter_enabled=bool(space.price_filter_enabled),
-                    )
-                    train_res = _run(params, train_start, train_end)
-                    if int(train_res.metrics.get("交易次数", 0)) < int(min_trades):
-                        continue
-                    score = _objective_score(train_res.metrics, objective)
-                    rows.append(
-                        {
-                            "buy": float(buy),
-                            "sell": float(sell),
-                            "hold": int(hold),
-                            "tp": float(tp),
-                            "sl": float(sl),
-                            "train_score": float(score),
-                            "train_ann": float(train_res.metrics.get("年化收益%", 0.0)),
-                            "train_sharpe": float(train_res.metrics.get("夏普", 0.0)),
-                            "train_mdd": float(train_res.metrics.get("最大回撤%", 0.0)),
-                            "train_trades": int(train_res.metrics.get("交易次数", 0)),
-                        }
+                    combos.append(
+                        BacktestParams(
+                            buy_threshold=float(buy),
+                            sell_threshold=float(sell),
+                            max_holding_days=int(hold),
+                            take_profit_pct=float(tp),
+                            stop_loss_pct=float(sl),
+                            fee_bps=float(fee_bps),
+                            price_filter_enabled=bool(space.price_filter_enabled),
+                        )
                     )
 
+    rungs = []
+    if search == "halving":
+        if index is None:
+            index = _time_index(kline)
+        combos, rungs = _successive_halving(
+            combos, _run_many, index, train_start, train_end, objective, min_trades,
+            top_k=top_k, eta=halving_eta, min_bars=halving_min_bars,
+        )
+
+    for params, train_res in zip(combos, _run_many(combos, train_start, train_end, with_equity=False)):
+        if int(train_res.metrics.get("交易次数", 0)) < int(min_trades):
+            continue
+        score = _objective_score(train_res.metrics, objective)
+        rows.append(
+            {
+                "buy": float(params.buy_threshold),
+                "sell": float(params.sell_threshold),
+                "hold": int(params.max_holding_days),
+                "tp": float(params.take_profit_pct),
+                "sl": float(params.stop_loss_pct),
+                "train_score": float(score),
+                "train_ann": float(train_res.metrics.get("年化收益%", 0.0)),
+                "train_sharpe": float(train_res.metrics.get("夏普", 0.0)),
+                "train_mdd": float(train_res.metrics.get("最大回撤%", 0.0)),
+                "train_trades": int(train_res.metrics.get("交易次数", 0)),
+            }
+        )
+
     grid = pd.DataFrame(rows)
+    if rungs:
+        grid.attrs["halving"] = pd.DataFrame(rungs)
     if grid.empty:
         return None, grid
 
@@ -141,9 +244,9 @@ def _search_one_range(
     best = None
     best_val_res = None
     best_val_score = None
-    for i in range(top_k):
-        cand = grid.iloc[i].to_dict()
-        cand_params = BacktestParams(
+    candidates = [grid.iloc[i].to_dict() for i in range(top_k)]
+    cand_params_list = [
+        BacktestParams(
             buy_threshold=float(cand["buy"]),
             sell_threshold=float(cand["sell"]),
             max_holding_days=int(cand["hold"]),
@@ -152,7 +255,12 @@ def _search_one_range(
             fee_bps=float(fee_bps),
             price_filter_enabled=bool(space.price_filter_enabled),
         )
-        val_res = _run(cand_params, val_start, val_end)
+        for cand in candidates
+    ]
+    val_results = _run_many(cand_params_list, val_start, val_end)
+    for i in range(top_k):
+        cand = candidates[i]
+        val_res = val_results[i]
         if int(val_res.metrics.get("交易次数", 0)) < max(1, int(min_trades // 2)):
             continue
         val_score = _objective_score(val_res.metrics, objective)
@@ -189,7 +297,7 @@ def _search_one_range(
         fee_bps=float(fee_bps),
         price_filter_enabled=bool(space.price_filter_enabled),
     )
-    best_train_res = _run(best_params, train_start, train_end)
+    best_train_res = _run_many([best_params], train_start, train_end, with_equity=False)[0]
     out = {
         "params": best_params,
         "train": best_train_res.metrics,
@@ -210,6 +318,8 @@ def optimize_ab_full(
     objective_b: Objective = "求稳",
     space_a: Optional[CandidateSpace] = None,
     space_b: Optional[CandidateSpace] = None,
+    search: SearchMode = "grid",
+    halving_eta: int = 3,
 ) -> dict:
     if space_a is None:
         space_a = CandidateSpace(
@@ -242,6 +352,8 @@ def optimize_ab_full(
         objective=objective_a,
         min_trades=int(min_trades),
         fee_bps=float(fee_bps),
+        search=search,
+        halving_eta=int(halving_eta),
     )
     b, b_grid = _search_one_range(
         kline,
@@ -254,6 +366,8 @@ def optimize_ab_full(
         objective=objective_b,
         min_trades=int(min_trades),
         fee_bps=float(fee_bps),
+        search=search,
+        halving_eta=int(halving_eta),
     )
 
     def pick_winner(target: Objective) -> str:
@@ -279,6 +393,132 @@ def optimize_ab_full(
     }
 
 
+@dataclass(frozen=True)
+class _FoldTask:
+    fold_id: int
+    side: str
+    train_start: pd.Timestamp
+    train_end: pd.Timestamp
+    val_start: pd.Timestamp
+    val_end: pd.Timestamp
+    space: CandidateSpace
+    objective: Objective
+    min_trades: int
+    fee_bps: float
+    top_k: int
+    search: SearchMode = "grid"
+    halving_eta: int = 3
+
+
+# 进程池工作进程挂载的共享内存：(5, N) 块，前4行为 开盘/收盘/最低/评分，第5行按 int64 存时间戳(ns)
+_worker_shm = None
+_worker_columns = None
+
+
+def _columns_view(buf, total: int, index_meta: tuple) -> tuple[pd.DatetimeIndex, np.ndarray]:
+    # index_meta = (unit, tz, freq, name)，还原与主进程相同的时间索引
+    unit, tz, freq, name = index_meta
+    block = np.ndarray((5, total), dtype=np.float64, buffer=buf)
+    index = pd.DatetimeIndex(block[4].view(np.int64).view("M8[ns]")).as_unit(unit)
+    if tz is not None:
+        index = index.tz_localize("UTC").tz_convert(tz)
+    return pd.DatetimeIndex(index, freq=freq, name=name), block[:4]
+
+
+def _attach_columns(name: str, total: int, index_meta: tuple) -> None:
+    global _worker_shm, _worker_columns
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    _worker_columns = _columns_view(_worker_shm.buf, total, index_meta)
+
+
+def _run_fold_task(task: _FoldTask, columns: Optional[tuple[pd.DatetimeIndex, np.ndarray]] = None) -> Optional[dict]:
+    index, block = _worker_columns if columns is None else columns
+
+    def _grid_runner(params_list, start_dt, end_dt, with_equity=True):
+        return run_backtest_grid_columns(index, block, params_list, start_date=start_dt, end_date=end_dt,
+                                         with_equity=with_equity)
+
+    result, _ = _search_one_range(
+        None,
+        None,
+        train_start=task.train_start,
+        train_end=task.train_end,
+        val_start=task.val_start,
+        val_end=task.val_end,
+        space=task.space,
+        objective=task.objective,
+        min_trades=task.min_trades,
+        fee_bps=task.fee_bps,
+        top_k=task.top_k,
+        grid_runner=_grid_runner,
+        search=task.search,
+        halving_eta=task.halving_eta,
+        index=index,
+    )
+    return result
+
+
+def _run_fold_tasks(
+    kline: pd.DataFrame,
+    scorer,
+    tasks: list[_FoldTask],
+    executor: ExecutorKind | Executor = "serial",
+    max_workers: Optional[int] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> dict:
+    # 全序列只评分一次，各 (折, A/B) 任务在同一列块上按区间截取；结果按任务键收集，与完成顺序无关
+    if not isinstance(executor, Executor) and executor not in ("serial", "thread", "process"):
+        raise ValueError(f"未知的执行方式: {executor}")
+    columns = score_backtest_columns(kline, scorer)
+    results: dict = {}
+    remaining = Counter(task.fold_id for task in tasks)
+
+    def _done(task: _FoldTask, result: Optional[dict]) -> None:
+        results[(task.fold_id, task.side)] = result
+        remaining[task.fold_id] -= 1
+        if progress_callback is not None:
+            progress_callback(len(results), len(tasks), {
+                "fold": task.fold_id,
+                "side": task.side,
+                "fold_done": remaining[task.fold_id] == 0,
+                "found": result is not None,
+            })
+
+    def _drain(pool: Executor, with_columns: bool) -> None:
+        futures = {
+            (pool.submit(_run_fold_task, task, columns) if with_columns else pool.submit(_run_fold_task, task)): task
+            for task in tasks
+        }
+        for future in as_completed(futures):
+            _done(futures[future], future.result())
+
+    workers = max(1, min(len(tasks) or 1, int(max_workers or os.cpu_count() or 1)))
+    if isinstance(executor, Executor):
+        _drain(executor, True)
+    elif executor == "serial" or workers <= 1:
+        for task in tasks:
+            _done(task, _run_fold_task(task, columns))
+    elif executor == "thread":
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            _drain(pool, True)
+    else:
+        index, block = columns
+        total = len(index)
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1) * 5 * 8)
+        try:
+            shared = np.ndarray((5, total), dtype=np.float64, buffer=shm.buf)
+            shared[:4] = block
+            shared[4].view(np.int64)[:] = index.as_unit("ns").asi8
+            del shared
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_columns,
+                                     initargs=(shm.name, total, (index.unit, index.tz, index.freq, index.name))) as pool:
+                _drain(pool, False)
+        finally:
+            shm.close()
+            shm.unlink()
+    return results
+
+
 def optimize_ab_full_walkforward(
     kline: pd.DataFrame,
     scorer,
@@ -292,6 +532,11 @@ def optimize_ab_full_walkforward(
     space_a: Optional[CandidateSpace] = None,
     space_b: Optional[CandidateSpace] = None,
     top_k: int = 20,
+    executor: ExecutorKind | Executor = "serial",
+    max_workers: Optional[int] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    search: SearchMode = "grid",
+    halving_eta: int = 3,
 ) -> dict:
     if space_a is None:
         space_a = CandidateSpace(
@@ -334,36 +579,21 @@ def optimize_ab_full_walkforward(
         folds.append((n_splits - f, train_start, train_end, val_start, val_end))
     folds = list(reversed(folds))
 
+    tasks = [
+        _FoldTask(int(fold_id), side, train_start, train_end, val_start, val_end,
+                  space, objective, int(min_trades), float(fee_bps), int(top_k), search, int(halving_eta))
+        for fold_id, train_start, train_end, val_start, val_end in folds
+        for side, space, objective in (("A", space_a, objective_a), ("B", space_b, objective_b))
+    ]
+    results = _run_fold_tasks(kline, scorer, tasks, executor=executor, max_workers=max_workers,
+                              progress_callback=progress_callback)
+
     fold_rows = []
     a_folds = []
     b_folds = []
     for fold_id, train_start, train_end, val_start, val_end in folds:
-        a, _ = _search_one_range(
-            kline,
-            scorer,
-            train_start=train_start,
-            train_end=train_end,
-            val_start=val_start,
-            val_end=val_end,
-            space=space_a,
-            objective=objective_a,
-            min_trades=int(min_trades),
-            fee_bps=float(fee_bps),
-            top_k=int(top_k),
-        )
-        b, _ = _search_one_range(
-            kline,
-            scorer,
-            train_start=train_start,
-            train_end=train_end,
-            val_start=val_start,
-            val_end=val_end,
-            space=space_b,
-            objective=objective_b,
-            min_trades=int(min_trades),
-            fee_bps=float(fee_bps),
-            top_k=int(top_k),
-        )
+        a = results[(int(fold_id), "A")]
+        b = results[(int(fold_id), "B")]
         a_folds.append(a)
         b_folds.append(b)
 
@@ -25,7 +25,7 @@ class BacktestParams:
 
 @dataclass(frozen=True)
 class BacktestResult:
-    equity_curve: pd.Series
+    equity_curve: Optional[pd.Series]
     trades: list[dict]
     metrics: dict
 
@@ -73,113 +73,273 @@ def _compute_metrics(equity: pd.Series) -> dict:
     }
 
 
-def run_backtest(
-    kline: pd.DataFrame,
-    scorer,
-    params: BacktestParams,
-    lookback_days: int = 30,
-    start_date: Optional[pd.Timestamp] = None,
-    end_date: Optional[pd.Timestamp] = None,
-) -> BacktestResult:
+@dataclass
+class MetricsAccumulator:
+    # 在线累计 _compute_metrics 的指标，不构造净值序列：
+    # 日收益均值/方差用 Welford 递推（首日收益按 0 计，与 pct_change().fillna(0) 一致），峰值与最大回撤滚动更新，
+    # 另累计平仓交易的笔数/胜数/收益和。净值在两次平仓之间不变，hold() 一次并入整段 0 收益
+    bars: int = 1
+    mean: float = 0.0
+    m2: float = 0.0
+    first: float = 1.0
+    last: float = 1.0
+    peak: float = 1.0
+    max_dd: float = 0.0
+    trades: int = 0
+    wins: int = 0
+    ret_sum: float = 0.0
+
+    @classmethod
+    def start(cls, value: float = 1.0) -> "MetricsAccumulator":
+        return cls(first=float(value), last=float(value), peak=float(value))
+
+    def hold(self, bars: int) -> None:
+        # 追加 bars 根净值不变的K线（日收益为 0），按分组合并公式更新均值与二阶矩
+        if bars <= 0:
+            return
+        n = self.bars + bars
+        self.m2 += self.mean * self.mean * self.bars * bars / n
+        self.mean *= self.bars / n
+        self.bars = n
+
+    def update(self, value: float) -> None:
+        # 追加一根净值为 value 的K线
+        r = value / self.last - 1.0
+        self.bars += 1
+        delta = r - self.mean
+        self.mean += delta / self.bars
+        self.m2 += delta * (r - self.mean)
+        self.last = value
+        if value > self.peak:
+            self.peak = value
+        else:
+            dd = value / self.peak - 1.0
+            if dd < self.max_dd:
+                self.max_dd = dd
+
+    def add_trade(self, ret_pct: float) -> None:
+        self.trades += 1
+        self.wins += ret_pct > 0
+        self.ret_sum += ret_pct
+
+    def metrics(self, start: pd.Timestamp, end: pd.Timestamp) -> dict:
+        # start/end 为首末K线日期，用于年化
+        if self.bars < 2:
+            return dict.fromkeys(("总收益率%", "年化收益%", "年化波动%", "夏普", "最大回撤%"), 0.0)
+        std = float(np.sqrt(self.m2 / (self.bars - 1)))
+        years = max(1e-9, (end - start).days / 365.0)
+        growth = self.last / self.first
+        return {
+            "总收益率%": float((growth - 1.0) * 100),
+            "年化收益%": float((growth ** (1.0 / years) - 1.0) * 100),
+            "年化波动%": float(std * np.sqrt(250) * 100),
+            "夏普": float(self.mean / std * np.sqrt(250)) if std != 0 else 0.0,
+            "最大回撤%": float(self.max_dd * 100),
+        }
+
+    def trade_metrics(self) -> dict:
+        return {
+            "交易次数": int(self.trades),
+            "胜率%": float(self.wins / self.trades * 100) if self.trades else 0.0,
+            "平均单笔%": float(self.ret_sum / self.trades) if self.trades else 0.0,
+        }
+
+
+@dataclass(frozen=True, eq=False)
+class BacktestArrays:
+    index: pd.DatetimeIndex
+    score: np.ndarray
+    open: np.ndarray
+    close: np.ndarray
+    recent_low: np.ndarray
+    lookback_days: int
+
+
+EXIT_SIGNALS = ("BUY", "SELL-TP", "SELL-SL", "SELL-SCORE", "SELL-TIME")
+
+
+def _empty_result() -> BacktestResult:
+    return BacktestResult(pd.Series(dtype=float), [], {**_compute_metrics(pd.Series(dtype=float)), "交易次数": 0, "胜率%": 0.0, "平均单笔%": 0.0})
+
+
+def _slice_kline(kline: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
     kl = _normalize_kline(kline)
     if kl.empty:
-        return BacktestResult(pd.Series(dtype=float), [], {**_compute_metrics(pd.Series(dtype=float)), "交易次数": 0, "胜率%": 0.0, "平均单笔%": 0.0})
-
+        return kl
     if start_date is not None:
         kl = kl.loc[kl.index >= pd.to_datetime(start_date)]
     if end_date is not None:
         kl = kl.loc[kl.index <= pd.to_datetime(end_date)]
-    kl = kl.sort_index()
-    if len(kl) < lookback_days + 5:
-        return BacktestResult(pd.Series(dtype=float), [], {**_compute_metrics(pd.Series(dtype=float)), "交易次数": 0, "胜率%": 0.0, "平均单笔%": 0.0})
+    return kl.sort_index()
 
-    fee = float(params.fee_bps) / 10000.0
-    buy_th = float(params.buy_threshold)
-    sell_th = float(params.sell_threshold)
-    take_profit = float(params.take_profit_pct) / 100.0
-    stop_loss = float(params.stop_loss_pct) / 100.0
-    max_hold = int(max(1, params.max_holding_days))
 
-    holding = False
-    entry_price = 0.0
-    entry_date = None
-    holding_days = 0
+def _series_scores(kl: pd.DataFrame, scorer, lookback_days: int) -> np.ndarray:
+    if hasattr(scorer, "score_series"):
+        return scorer.score_series(kl, lookback_days)["score"].to_numpy(dtype=np.float64)
+    scores = np.full(len(kl), np.nan)
+    for t in range(lookback_days - 1, len(kl) - 2):
+        score, _detail = scorer.calculate_score_detail(kl.iloc[t - lookback_days + 1:t + 1])
+        scores[t] = float(score)
+    return scores
 
-    trades: list[dict] = []
-    equity_points = []
-    capital = 1.0
-    equity_points.append((kl.index[0], capital))
 
-    for i in range(len(kl) - lookback_days - 1):
-        w = kl.iloc[i:i + lookback_days]
-        if len(w) < lookback_days:
-            continue
-        score, _detail = scorer.calculate_score_detail(w)
-        score = float(score)
+def build_backtest_arrays(index: pd.DatetimeIndex, score: np.ndarray, open_: np.ndarray, close: np.ndarray,
+                          low: np.ndarray, lookback_days: int = 30) -> BacktestArrays:
+    # 近60根最低价与 kl.loc[:date].tail(60) 一致（含重复日期）
+    index = pd.DatetimeIndex(index)
+    rolling_low = pd.Series(np.asarray(low, dtype=np.float64)).rolling(60, min_periods=1).min().to_numpy()
+    last_pos = index.searchsorted(index, side="right") - 1
+    return BacktestArrays(
+        index=index,
+        score=np.asarray(score, dtype=np.float64),
+        open=np.asarray(open_, dtype=np.float64),
+        close=np.asarray(close, dtype=np.float64),
+        recent_low=rolling_low[last_pos],
+        lookback_days=int(lookback_days),
+    )
+
 
-        cur_close = float(w["收盘"].iloc[-1])
-        cur_date = w.index[-1]
+def prepare_backtest_arrays(kl: pd.DataFrame, scorer, lookback_days: int = 30) -> BacktestArrays:
+    # kl 为已规范化、已按回测区间截取的K线
+    return build_backtest_arrays(
+        kl.index,
+        _series_scores(kl, scorer, lookback_days),
+        kl["开盘"].to_numpy(dtype=np.float64),
+        kl["收盘"].to_numpy(dtype=np.float64),
+        kl["最低"].to_numpy(dtype=np.float64),
+        lookback_days,
+    )
 
-        next_row = kl.iloc[i + lookback_days]
-        next_open = float(next_row["开盘"])
-        next_date = next_row.name
 
+def _simulate_kernel(score, open_, close, recent_low, start, stop,
+                     buy_th, sell_th, take_profit, stop_loss, max_hold, fee,
+                     price_filter, price_to_low_max, override_th,
+                     ev_pos, ev_kind, ev_price, ev_ret, ev_capital):
+    holding = False
+    entry_price = 0.0
+    holding_days = 0
+    capital = 1.0
+    n_events = 0
+    for t in range(start, stop):
+        score_t = score[t]
+        cur_close = close[t]
+        next_open = open_[t + 1]
         if not holding:
-            if score >= buy_th and next_open > 0:
+            if score_t >= buy_th and next_open > 0:
                 allow_buy = True
-                if params.price_filter_enabled:
-                    recent_window = kl.loc[:cur_date].tail(60)
-                    recent_low = float(recent_window["最低"].min()) if not recent_window.empty else float(w["最低"].min())
-                    if recent_low > 0:
-                        price_to_low = (cur_close - recent_low) / recent_low * 100
-                        allow_buy = price_to_low < float(params.price_to_low_max_pct)
-                    else:
-                        allow_buy = True
-
-                    if not allow_buy and score >= buy_th + float(params.high_score_override_margin):
+                if price_filter:
+                    low = recent_low[t]
+                    if low > 0:
+                        allow_buy = (cur_close - low) / low * 100 < price_to_low_max
+                    if not allow_buy and score_t >= override_th:
                         allow_buy = True
-
                 if allow_buy:
                     holding = True
                     entry_price = next_open
-                    entry_date = next_date
                     holding_days = 0
-                    trades.append({"date": entry_date, "signal": "BUY", "price": entry_price, "return_pct": 0.0, "capital": capital})
+                    ev_pos[n_events] = t + 1
+                    ev_kind[n_events] = 0
+                    ev_price[n_events] = entry_price
+                    ev_ret[n_events] = 0.0
+                    ev_capital[n_events] = capital
+                    n_events += 1
         else:
             holding_days += 1
             if entry_price <= 0:
                 holding = False
                 continue
             pnl = (cur_close - entry_price) / entry_price
-            sell_triggered = False
-            reason = ""
-
+            kind = 0
             if pnl >= take_profit:
-                sell_triggered = True
-                reason = "TP"
+                kind = 1
             elif pnl <= stop_loss:
-                sell_triggered = True
-                reason = "SL"
-            elif score <= sell_th:
-                sell_triggered = True
-                reason = "SCORE"
+                kind = 2
+            elif score_t <= sell_th:
+                kind = 3
             elif holding_days >= max_hold:
-                sell_triggered = True
-                reason = "TIME"
-
-            if sell_triggered and next_open > 0:
-                exit_price = next_open
-                ret_pct = (exit_price - entry_price) / entry_price * 100
+                kind = 4
+            if kind > 0 and next_open > 0:
+                ret_pct = (next_open - entry_price) / entry_price * 100
                 capital *= (1 + ret_pct / 100.0 - fee)
-                equity_points.append((next_date, capital))
-                trades.append({"date": next_date, "signal": f"SELL-{reason}", "price": exit_price, "return_pct": ret_pct, "capital": capital})
+                ev_pos[n_events] = t + 1
+                ev_kind[n_events] = kind
+                ev_price[n_events] = next_open
+                ev_ret[n_events] = ret_pct
+                ev_capital[n_events] = capital
+                n_events += 1
                 holding = False
                 entry_price = 0.0
-                entry_date = None
                 holding_days = 0
+    return n_events
+
+
+try:
+    from numba import njit
+    _simulate_kernel_jit = njit(cache=True)(_simulate_kernel)
+except ImportError:
+    _simulate_kernel_jit = None
+
+
+def simulate_backtest(arrays: BacktestArrays, params: BacktestParams, with_equity: bool = True) -> BacktestResult:
+    # with_equity=False 时不构造净值序列（equity_curve 为 None），指标由 MetricsAccumulator 按平仓事件累计
+    n = len(arrays.index)
+    start = arrays.lookback_days - 1
+    stop = n - 2
+    if n < arrays.lookback_days + 5:
+        return _empty_result()
+
+    ev_pos = np.zeros(n, dtype=np.int64)
+    ev_kind = np.zeros(n, dtype=np.int64)
+    ev_price = np.zeros(n, dtype=np.float64)
+    ev_ret = np.zeros(n, dtype=np.float64)
+    ev_capital = np.zeros(n, dtype=np.float64)
+    buy_th = float(params.buy_threshold)
+    scalars = (
+        buy_th,
+        float(params.sell_threshold),
+        float(params.take_profit_pct) / 100.0,
+        float(params.stop_loss_pct) / 100.0,
+        int(max(1, params.max_holding_days)),
+        float(params.fee_bps) / 10000.0,
+        bool(params.price_filter_enabled),
+        float(params.price_to_low_max_pct),
+        buy_th + float(params.high_score_override_margin),
+    )
+    if _simulate_kernel_jit is not None:
+        n_events = _simulate_kernel_jit(arrays.score, arrays.open, arrays.close, arrays.recent_low, start, stop,
+                                        *scalars, ev_pos, ev_kind, ev_price, ev_ret, ev_capital)
+    else:
+        # 纯 Python 循环下按元素读取 list 比读取 ndarray 快得多
+        n_events = _simulate_kernel(arrays.score.tolist(), arrays.open.tolist(), arrays.close.tolist(),
+                                    arrays.recent_low.tolist(), start, stop,
+                                    *scalars, ev_pos, ev_kind, ev_price, ev_ret, ev_capital)
+
+    trades: list[dict] = []
+    equity_points = [(arrays.index[0], 1.0)]
+    acc = None if with_equity else MetricsAccumulator.start()
+    last_pos = 0
+    for pos, kind, price, ret_pct, capital in zip(ev_pos[:n_events].tolist(), ev_kind[:n_events].tolist(),
+                                                  ev_price[:n_events].tolist(), ev_ret[:n_events].tolist(),
+                                                  ev_capital[:n_events].tolist()):
+        date = arrays.index[pos]
+        trades.append({"date": date, "signal": EXIT_SIGNALS[kind], "price": price, "return_pct": ret_pct, "capital": capital})
+        if kind > 0:
+            if acc is None:
+                equity_points.append((date, capital))
+            else:
+                acc.hold(pos - last_pos - 1)
+                acc.update(capital)
+                acc.add_trade(ret_pct)
+                last_pos = pos
+
+    if acc is not None:
+        acc.hold(n - 1 - last_pos)
+        m = acc.metrics(arrays.index[0], arrays.index[-1])
+        m.update(acc.trade_metrics())
+        return BacktestResult(equity_curve=None, trades=trades, metrics=m)
 
     equity = pd.Series([p[1] for p in equity_points], index=pd.to_datetime([p[0] for p in equity_points])).sort_index()
-    equity = equity.reindex(kl.index).ffill()
+    equity = equity.reindex(arrays.index).ffill()
     if len(equity) > 0:
         equity = equity.fillna(1.0)
 
@@ -199,3 +359,286 @@ def run_backtest(
 
     return BacktestResult(equity_curve=equity, trades=trades, metrics=m)
 
+
+def _compute_metrics_rows(equity: np.ndarray, index: pd.DatetimeIndex) -> list[dict]:
+    # 逐行等价于 _compute_metrics(pd.Series(equity[i], index=index))，按 pandas 的归约顺序计算
+    n_rows, n = equity.shape
+    if n < 2:
+        return [_compute_metrics(pd.Series(dtype=float)) for _ in range(n_rows)]
+    daily = np.zeros_like(equity)
+    daily[:, 1:] = equity[:, 1:] / equity[:, :-1] - 1
+    mean = daily.sum(axis=1) / n
+    sqr = (mean[:, None] - daily) ** 2
+    std = np.sqrt(sqr.sum(axis=1) / (n - 1))
+    dd = ((equity / np.maximum.accumulate(equity, axis=1) - 1.0) * 100).min(axis=1)
+    years = max(1e-9, (index[-1] - index[0]).days / 365.0)
+    out = []
+    for i in range(n_rows):
+        first, last = float(equity[i, 0]), float(equity[i, -1])
+        ann = (last / first) ** (1.0 / years) - 1.0
+        out.append({
+            "总收益率%": float((last / first - 1.0) * 100),
+            "年化收益%": float(ann * 100),
+            "年化波动%": float(std[i] * np.sqrt(250) * 100),
+            "夏普": float(mean[i] / std[i] * np.sqrt(250)) if std[i] != 0 else 0.0,
+            "最大回撤%": float(dd[i]),
+        })
+    return out
+
+
+def simulate_grid(arrays: BacktestArrays, params_list: list[BacktestParams],
+                  with_equity: bool = True) -> list[BacktestResult]:
+    # 所有参数组合共用一份评分/价格数组，按K线推进 (组合数,) 的状态向量，结果与逐个 simulate_backtest 一致
+    # with_equity=False 时不构造 (组合数, K线数) 净值矩阵，指标由各组合的 MetricsAccumulator 累计
+    n = len(arrays.index)
+    n_combo = len(params_list)
+    if n_combo == 0:
+        return []
+    if n < arrays.lookback_days + 5:
+        return [_empty_result() for _ in params_list]
+
+    buy_th = np.array([float(p.buy_threshold) for p in params_list])
+    sell_th = np.array([float(p.sell_threshold) for p in params_list])
+    take_profit = np.array([float(p.take_profit_pct) / 100.0 for p in params_list])
+    stop_loss = np.array([float(p.stop_loss_pct) / 100.0 for p in params_list])
+    max_hold = np.array([int(max(1, p.max_holding_days)) for p in params_list])
+    fee = np.array([float(p.fee_bps) / 10000.0 for p in params_list])
+    price_filter = np.array([bool(p.price_filter_enabled) for p in params_list])
+    price_to_low_max = np.array([float(p.price_to_low_max_pct) for p in params_list])
+    override_th = buy_th + np.array([float(p.high_score_override_margin) for p in params_list])
+
+    holding = np.zeros(n_combo, dtype=bool)
+    entry_price = np.zeros(n_combo)
+    holding_days = np.zeros(n_combo, dtype=np.int64)
+    capital = np.ones(n_combo)
+    events = []
+
+    score, open_, close, recent_low = arrays.score, arrays.open, arrays.close, arrays.recent_low
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for t in range(arrays.lookback_days - 1, n - 2):
+            score_t = score[t]
+            cur_close = close[t]
+            next_open = open_[t + 1]
+            free = ~holding
+
+            held = np.flatnonzero(holding)
+            if len(held):
+                holding_days[held] += 1
+                entry = entry_price[held]
+                pnl = (cur_close - entry) / entry
+                tp = pnl >= take_profit[held]
+                sl = ~tp & (pnl <= stop_loss[held])
+                by_score = ~tp & ~sl & (score_t <= sell_th[held])
+                by_time = ~tp & ~sl & ~by_score & (holding_days[held] >= max_hold[held])
+                kind = tp * 1 + sl * 2 + by_score * 3 + by_time * 4
+                if next_open > 0:
+                    hit = kind > 0
+                    idx = held[hit]
+                    if len(idx):
+                        ret_pct = (next_open - entry_price[idx]) / entry_price[idx] * 100
+                        capital[idx] *= (1 + ret_pct / 100.0 - fee[idx])
+                        events.append((t + 1, idx, kind[hit], ret_pct, capital[idx]))
+                        holding[idx] = False
+                        entry_price[idx] = 0.0
+                        holding_days[idx] = 0
+
+            if next_open > 0:
+                buy = free & (score_t >= buy_th)
+                if buy.any():
+                    low = recent_low[t]
+                    if low > 0:
+                        near_low = (cur_close - low) / low * 100 < price_to_low_max
+                        buy &= ~price_filter | near_low | (score_t >= override_th)
+                    idx = np.flatnonzero(buy)
+                    if len(idx):
+                        holding[idx] = True
+                        entry_price[idx] = next_open
+                        holding_days[idx] = 0
+                        events.append((t + 1, idx, np.zeros(len(idx), dtype=np.int64), np.zeros(len(idx)), capital[idx]))
+
+    trades: list[list[dict]] = [[] for _ in range(n_combo)]
+    if not with_equity:
+        accs = [MetricsAccumulator.start() for _ in range(n_combo)]
+        last_pos = [0] * n_combo
+        for pos, idx, kinds, rets, caps in events:
+            date = arrays.index[pos]
+            price = float(open_[pos])
+            for c, kind, ret_pct, cap in zip(idx.tolist(), kinds.tolist(), rets.tolist(), caps.tolist()):
+                trades[c].append({"date": date, "signal": EXIT_SIGNALS[kind], "price": price, "return_pct": ret_pct, "capital": cap})
+                if kind > 0:
+                    acc = accs[c]
+                    acc.hold(pos - last_pos[c] - 1)
+                    acc.update(cap)
+                    acc.add_trade(ret_pct)
+                    last_pos[c] = pos
+        results = []
+        for c, acc in enumerate(accs):
+            acc.hold(n - 1 - last_pos[c])
+            m = acc.metrics(arrays.index[0], arrays.index[-1])
+            m.update(acc.trade_metrics())
+            results.append(BacktestResult(equity_curve=None, trades=trades[c], metrics=m))
+        return results
+
+    equity = np.full((n_combo, n), np.nan)
+    equity[:, 0] = 1.0
+    for pos, idx, kinds, rets, caps in events:
+        date = arrays.index[pos]
+        price = float(open_[pos])
+        for c, kind, ret_pct, cap in zip(idx.tolist(), kinds.tolist(), rets.tolist(), caps.tolist()):
+            trades[c].append({"date": date, "signal": EXIT_SIGNALS[kind], "price": price, "return_pct": ret_pct, "capital": cap})
+        exits = kinds > 0
+        equity[idx[exits], pos] = caps[exits]
+    filled = np.where(np.isnan(equity), 0, np.arange(n))
+    equity = equity[np.arange(n_combo)[:, None], np.maximum.accumulate(filled, axis=1)]
+
+    results = []
+    for c, m in enumerate(_compute_metrics_rows(equity, arrays.index)):
+        sell_trades = [t for t in trades[c] if t["signal"].startswith("SELL")]
+        if sell_trades:
+            rets = np.array([float(t["return_pct"]) for t in sell_trades], dtype=float)
+            m["交易次数"] = int(len(sell_trades))
+            m["胜率%"] = float((rets > 0).mean() * 100)
+            m["平均单笔%"] = float(rets.mean())
+        else:
+            m["交易次数"] = 0
+            m["胜率%"] = 0.0
+            m["平均单笔%"] = 0.0
+        results.append(BacktestResult(equity_curve=pd.Series(equity[c], index=arrays.index), trades=trades[c], metrics=m))
+    return results
+
+
+def run_backtest_grid(
+    kline: pd.DataFrame,
+    scorer,
+    params_list: list[BacktestParams],
+    lookback_days: int = 30,
+    start_date: Optional[pd.Timestamp] = None,
+    end_date: Optional[pd.Timestamp] = None,
+    with_equity: bool = True,
+) -> list[BacktestResult]:
+    kl = _slice_kline(kline, start_date, end_date)
+    if kl.empty or len(kl) < lookback_days + 5:
+        return [_empty_result() for _ in params_list]
+    return simulate_grid(prepare_backtest_arrays(kl, scorer, lookback_days), params_list, with_equity)
+
+
+def score_backtest_columns(kline: pd.DataFrame, scorer, lookback_days: int = 30) -> tuple[pd.DatetimeIndex, np.ndarray]:
+    # 全序列只评分一次：返回规范化后的时间索引与 (4, N) 的 开盘/收盘/最低/评分 列块，
+    # 任意区间内第 lookback_days-1 根起的评分窗口完整，与对区间切片重新评分一致
+    kl = _normalize_kline(kline)
+    if kl.empty:
+        return pd.DatetimeIndex([]), np.empty((4, 0))
+    columns = np.vstack([
+        kl["开盘"].to_numpy(dtype=np.float64),
+        kl["收盘"].to_numpy(dtype=np.float64),
+        kl["最低"].to_numpy(dtype=np.float64),
+        _series_scores(kl, scorer, lookback_days),
+    ])
+    return pd.DatetimeIndex(kl.index), columns
+
+
+def run_backtest_grid_columns(
+    index: pd.DatetimeIndex,
+    columns: np.ndarray,
+    params_list: list[BacktestParams],
+    lookback_days: int = 30,
+    start_date: Optional[pd.Timestamp] = None,
+    end_date: Optional[pd.Timestamp] = None,
+    with_equity: bool = True,
+) -> list[BacktestResult]:
+    # 与 run_backtest_grid 相同，但区间直接在 score_backtest_columns 的列块上按位置截取
+    lo = 0 if start_date is None else int(index.searchsorted(pd.to_datetime(start_date), side="left"))
+    hi = len(index) if end_date is None else int(index.searchsorted(pd.to_datetime(end_date), side="right"))
+    if hi - lo < lookback_days + 5:
+        return [_empty_result() for _ in params_list]
+    open_, close, low, score = columns[:, lo:hi]
+    arrays = build_backtest_arrays(index[lo:hi], score, open_, close, low, lookback_days)
+    return simulate_grid(arrays, params_list, with_equity)
+
+
+# 随机化基线与自助法单块最多元素数，控制 10k+ 次试验时的内存
+_SAMPLE_CHUNK_ELEMENTS = 4_000_000
+
+
+def random_trader_returns(
+    forward_returns_pct: np.ndarray,
+    n_trades: int,
+    n_trials: int = 10000,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    # 随机交易者：每次试验无放回抽取 n_trades 个样本的未来收益%并复利，返回各次试验的总收益%
+    # 全部试验以 (n_trials, n_trades) 索引矩阵一次抽取（随机键 argpartition），按对数收益求和
+    r = np.asarray(forward_returns_pct, dtype=np.float64)
+    r = r[~np.isnan(r)]
+    n = len(r)
+    k = int(min(max(1, n_trades), n))
+    if n == 0 or n_trials <= 0:
+        return np.empty(0)
+    rng = np.random.default_rng(seed)
+    with np.errstate(divide="ignore"):
+        log_r = np.log1p(r / 100.0)
+    out = np.empty(int(n_trials))
+    rows = max(1, _SAMPLE_CHUNK_ELEMENTS // n)
+    for lo in range(0, int(n_trials), rows):
+        hi = min(int(n_trials), lo + rows)
+        keys = rng.random((hi - lo, n))
+        idx = keys.argsort(axis=1)[:, :k] if k == n else np.argpartition(keys, k - 1, axis=1)[:, :k]
+        out[lo:hi] = np.expm1(log_r[idx].sum(axis=1)) * 100
+    return out
+
+
+def block_bootstrap_ci(
+    equity: pd.Series,
+    n_boot: int = 10000,
+    block_size: Optional[int] = None,
+    ci: float = 0.95,
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
+    # 循环块自助法：按块重抽日收益（保留短期自相关）重建净值，给出 总收益率%/夏普/最大回撤% 的置信区间
+    # 点估计与 _compute_metrics 一致，重抽的也是其所用日收益（首日补0），区间与估计针对同一统计量；块长默认 n^(1/3)
+    s = equity.dropna().astype(float) if equity is not None else pd.Series(dtype=float)
+    point = _compute_metrics(s)
+    names = ["总收益率%", "夏普", "最大回撤%"]
+    daily = s.pct_change().fillna(0.0).to_numpy()
+    n = len(daily)
+    if n < 3 or n_boot <= 0:
+        return pd.DataFrame({"估计": [point[k] for k in names], "下限": np.nan, "上限": np.nan}, index=names)
+
+    block = int(block_size) if block_size else max(1, int(round(n ** (1.0 / 3.0))))
+    block = min(block, n)
+    n_blocks = -(-n // block)
+    rng = np.random.default_rng(seed)
+    with np.errstate(divide="ignore"):
+        log_r = np.log1p(daily)
+    samples = np.empty((3, int(n_boot)))
+    rows = max(1, _SAMPLE_CHUNK_ELEMENTS // (n_blocks * block))
+    offsets = np.arange(block)
+    for lo in range(0, int(n_boot), rows):
+        hi = min(int(n_boot), lo + rows)
+        starts = rng.integers(0, n, size=(hi - lo, n_blocks))
+        idx = ((starts[:, :, None] + offsets) % n).reshape(hi - lo, -1)[:, :n]
+        r = daily[idx]
+        log_eq = np.cumsum(log_r[idx], axis=1)
+        std = r.std(axis=1, ddof=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            samples[1, lo:hi] = np.where(std != 0, r.mean(axis=1) / std * np.sqrt(250), 0.0)
+        samples[0, lo:hi] = np.expm1(log_eq[:, -1]) * 100
+        peak = np.maximum(np.maximum.accumulate(log_eq, axis=1), 0.0)
+        samples[2, lo:hi] = np.expm1((log_eq - peak).min(axis=1).clip(max=0.0)) * 100
+    alpha = (1.0 - float(ci)) / 2.0 * 100
+    low, high = np.percentile(samples, [alpha, 100 - alpha], axis=1)
+    return pd.DataFrame({"估计": [point[k] for k in names], "下限": low, "上限": high}, index=names)
+
+
+def run_backtest(
+    kline: pd.DataFrame,
+    scorer,
+    params: BacktestParams,
+    lookback_days: int = 30,
+    start_date: Optional[pd.Timestamp] = None,
+    end_date: Optional[pd.Timestamp] = None,
+) -> BacktestResult:
+    kl = _slice_kline(kline, start_date, end_date)
+    if kl.empty or len(kl) < lookback_days + 5:
+        return _empty_result()
+    return simulate_backtest(prepare_backtest_arrays(kl, scorer, lookback_days), params)
@@ -2,7 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-from dataclasses import dataclass
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta
 
 import numpy as np
@@ -10,6 +15,7 @@ import pandas as pd
 
 from data_source import get_kline
 from dynamic_scorer import DynamicScorer
+from score_cache import CachedScorer
 from score_formula_parser import ScoreFormulaParser
 from abtest_full_engine import optimize_ab_full_walkforward
 from backtest_engine import BacktestParams, run_backtest
@@ -95,7 +101,7 @@ def eval_one_symbol(symbol: str, start_date: str, end_date: str, horizon_days: i
 
     parser = ScoreFormulaParser()
     formula_info = parser.parse_deepseek_result(DEFAULT_FORMULA_TEXT)
-    scorer = DynamicScorer(formula_info)
+    scorer = CachedScorer(DynamicScorer(formula_info), symbol)
 
     ab = optimize_ab_full_walkforward(
         kline,
@@ -152,31 +158,142 @@ def eval_one_symbol(symbol: str, start_date: str, end_date: str, horizon_days: i
     )
 
 
+DEFAULT_JOURNAL = os.path.join("reports", "batch_backtest_eval.jsonl")
+
+
+def params_hash(params: dict) -> str:
+    # 评估参数（含公式文本与日期区间）的哈希，与代码一起作为结果日志的键
+    payload = json.dumps({**params, "formula": DEFAULT_FORMULA_TEXT}, sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def read_symbols_file(path: str) -> list[str]:
+    # 每行一个或逗号分隔多个代码，# 开头为注释
+    symbols = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0]
+            symbols.extend(s.strip() for s in line.replace("，", ",").split(",") if s.strip())
+    return list(dict.fromkeys(symbols))
+
+
+def load_journal(path: str, phash: str) -> dict:
+    # 只追加的 JSONL 结果日志；同一代码以最后一条为准，中断时写了一半的行直接跳过
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if rec.get("params_hash") == phash:
+                records[rec["symbol"]] = rec
+    return records
+
+
+def append_journal(path: str, rec: dict) -> None:
+    line = (json.dumps(rec, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    with open(path, "a+b") as f:
+        # 上次中断留下不完整的末行时先换行，避免与新记录粘连
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                line = b"\n" + line
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def eval_symbol_record(symbol: str, phash: str, kwargs: dict) -> dict:
+    # 进程池任务：异常记入日志而不中断整批评估
+    t0 = time.perf_counter()
+    rec = {"symbol": symbol, "params_hash": phash}
+    try:
+        r = eval_one_symbol(symbol, **kwargs)
+        rec.update({"status": "ok" if r is not None else "empty", "result": asdict(r) if r is not None else None})
+    except Exception as e:
+        rec.update({"status": "error", "result": None, "error": f"{type(e).__name__}: {e}"})
+    rec["elapsed"] = round(time.perf_counter() - t0, 3)
+    rec["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    return rec
+
+
+def _fmt_seconds(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    return f"{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run_batch(symbols: list[str], kwargs: dict, journal: str = DEFAULT_JOURNAL, workers: int = 1) -> list[EvalResult]:
+    phash = params_hash(kwargs)
+    done = load_journal(journal, phash)
+    # 出错的代码重跑，已完成（含数据不足）的跳过
+    todo = [s for s in symbols if done.get(s, {}).get("status") not in ("ok", "empty")]
+    print(f"params={phash} symbols={len(symbols)} done={len(symbols) - len(todo)} todo={len(todo)} workers={workers}")
+    os.makedirs(os.path.dirname(journal) or ".", exist_ok=True)
+
+    t0 = time.perf_counter()
+
+    def _record(i: int, rec: dict) -> None:
+        append_journal(journal, rec)
+        done[rec["symbol"]] = rec
+        elapsed = time.perf_counter() - t0
+        rate = i / elapsed if elapsed > 0 else 0.0
+        eta = (len(todo) - i) / rate if rate > 0 else 0.0
+        msg = f"[{i}/{len(todo)}] {rec['symbol']} {rec['status']} {rec['elapsed']:.1f}s | {rate:.2f} sym/s ETA {_fmt_seconds(eta)}"
+        if rec.get("error"):
+            msg += f" | {rec['error']}"
+        print(msg, flush=True)
+
+    if workers <= 1 or len(todo) <= 1:
+        for i, s in enumerate(todo, 1):
+            _record(i, eval_symbol_record(s, phash, kwargs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(eval_symbol_record, s, phash, kwargs) for s in todo]
+            for i, fut in enumerate(as_completed(futures), 1):
+                _record(i, fut.result())
+
+    elapsed = time.perf_counter() - t0
+    statuses = [done.get(s, {}).get("status") for s in symbols]
+    print(
+        f"finished {len(todo)} symbols in {_fmt_seconds(elapsed)} "
+        f"({len(todo) / elapsed if elapsed > 0 else 0.0:.2f} sym/s); "
+        f"ok={statuses.count('ok')} empty={statuses.count('empty')} error={statuses.count('error')}"
+    )
+    return [EvalResult(**done[s]["result"]) for s in symbols if done.get(s, {}).get("status") == "ok"]
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--symbols", default="000001,600000,600519,000333,002594")
+    ap.add_argument("--symbols-file", default=None, help="代码列表文件，每行一个或逗号分隔，覆盖 --symbols")
     ap.add_argument("--months", type=int, default=12)
+    ap.add_argument("--end", default=None, help="结束日期 YYYYMMDD，默认今天；固定后重跑可复用结果日志")
     ap.add_argument("--horizon", type=int, default=7)
     ap.add_argument("--train_ratio", type=float, default=0.7)
     ap.add_argument("--min_val_samples", type=int, default=30)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--journal", default=DEFAULT_JOURNAL, help="只追加的结果日志(JSONL)，按 代码+参数哈希 跳过已完成的代码")
     args = ap.parse_args()
 
-    end_date = datetime.now().strftime("%Y%m%d")
-    start_date = (datetime.now() - timedelta(days=int(args.months * 30.5))).strftime("%Y%m%d")
-    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()]
-
-    results = []
-    for s in symbols:
-        r = eval_one_symbol(
-            s,
-            start_date=start_date,
-            end_date=end_date,
-            horizon_days=int(args.horizon),
-            train_ratio=float(args.train_ratio),
-            min_val_samples=int(args.min_val_samples),
-        )
-        if r is not None:
-            results.append(r)
+    end_dt = datetime.strptime(args.end, "%Y%m%d") if args.end else datetime.now()
+    end_date = end_dt.strftime("%Y%m%d")
+    start_date = (end_dt - timedelta(days=int(args.months * 30.5))).strftime("%Y%m%d")
+    if args.symbols_file:
+        symbols = read_symbols_file(args.symbols_file)
+    else:
+        symbols = [s.strip() for s in args.symbols.split(",") if s.strip()]
+
+    kwargs = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "horizon_days": int(args.horizon),
+        "train_ratio": float(args.train_ratio),
+        "min_val_samples": int(args.min_val_samples),
+    }
+    results = run_batch(symbols, kwargs, journal=args.journal, workers=max(1, int(args.workers)))
 
     if not results:
         print("no results")
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缠论引擎性能基准
+对比逐行 DataFrame 实现（保留于此作为正确性参照）与数组实现的耗时
+
+用法: python bench_chanlun.py [--sizes 1000,10000,100000] [--legacy_run_max 2500]
+"""
+
+import argparse
+import logging
+import time
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from chanlun_engine import ChanQuantEngine, IncrementalChanEngine
+from logger import get_logger
+
+
+# ================= 参照实现（逐行 DataFrame 版本） =================
+
+def legacy_merge_k_lines(df: pd.DataFrame) -> pd.DataFrame:
+    """优化前的 merge_k_lines，逐行 iloc/to_dict 处理包含关系"""
+    data = df[['high', 'low', 'open', 'close']].copy()
+    data = data.reset_index().rename(columns={'index': 'date'})
+    data = data.sort_values('date')
+
+    merged = []
+    i = 0
+    n = len(data)
+    if n == 0:
+        return df
+
+    while i < n:
+        if i == 0:
+            merged.append(data.iloc[i].to_dict())
+            i += 1
+            continue
+        if not merged:
+            merged.append(data.iloc[i].to_dict())
+            i += 1
+            continue
+
+        current = data.iloc[i]
+        prev = merged[-1]
+        if current['high'] <= prev['high'] and current['low'] >= prev['low']:
+            if prev['close'] >= prev['open']:
+                new_high = max(prev['high'], current['high'])
+                new_low = max(prev['low'], current['low'])
+            else:
+                new_high = min(prev['high'], current['high'])
+                new_low = min(prev['low'], current['low'])
+            prev['high'] = new_high
+            prev['low'] = new_low
+            i += 1
+        elif current['high'] >= prev['high'] and current['low'] <= prev['low']:
+            merged.pop()
+            continue
+        else:
+            merged.append(current.to_dict())
+            i += 1
+
+    merged_df = pd.DataFrame(merged)
+    merged_df.set_index('date', inplace=True)
+    return merged_df
+
+
+class LegacyChanEngine(ChanQuantEngine):
+    """优化前的分型/笔识别（逐个 iloc 标量访问，嵌套循环切片；去掉了逐笔日志）"""
+
+    def merge_k_lines(self, df: pd.DataFrame) -> pd.DataFrame:
+        return legacy_merge_k_lines(df)
+
+    def _is_fractal(self, data: pd.DataFrame, i: int, window: int = 2) -> Tuple[bool, str]:
+        """
+        判断i位置是否为分型（基于合并后的K线）
+        使用前后各window根K线比较，标准分型要求相邻K线不包含（已合并，故满足）
+        """
+        if i < window or i >= len(data) - window:
+            return False, ''
+        left_high = data['high'].iloc[i-window:i].max()
+        left_low = data['low'].iloc[i-window:i].min()
+        right_high = data['high'].iloc[i+1:i+window+1].max()
+        right_low = data['low'].iloc[i+1:i+window+1].min()
+        cur_high = data['high'].iloc[i]
+        cur_low = data['low'].iloc[i]
+        
+        # 顶分型：中间高点最高，且中间低点不是最低（可选条件）
+        if cur_high > left_high and cur_high > right_high:
+            # 可附加条件：中间低点大于左右低点之一？标准定义只要求高点最高
+            return True, 'top'
+        # 底分型：中间低点最低
+        if cur_low < left_low and cur_low < right_low:
+            return True, 'bottom'
+        return False, ''
+    
+    def find_fractals(self, df_merged: pd.DataFrame) -> List[Tuple[int, str, float, float]]:
+        """
+        识别所有分型，返回列表 (索引位置, 类型, 高点, 低点)
+        """
+        fractals = []
+        n = len(df_merged)
+        for i in range(1, n-1):
+            is_f, typ = self._is_fractal(df_merged, i, window=1)  # 使用window=1简化，即相邻两根比较
+            if is_f:
+                fractals.append((i, typ, df_merged['high'].iloc[i], df_merged['low'].iloc[i]))
+        return fractals
+    
+    def find_bi(self, df_merged: pd.DataFrame, fractals: List[Tuple[int, str, float, float]]) -> List[Tuple[int, int, int, float, float]]:
+        """
+        根据分型生成笔
+        返回列表 (start_idx, end_idx, direction, start_price, end_price)
+        direction: 1 向上笔, -1 向下笔
+        """
+        bi = []
+        if len(fractals) < 2:
+            return bi
+        
+        # 按索引排序
+        fractals_sorted = sorted(fractals, key=lambda x: x[0])
+        
+        i = 0
+        while i < len(fractals_sorted)-1:
+            cur = fractals_sorted[i]
+            found = False
+            
+            # 寻找下一个类型相反的分型
+            for j in range(i+1, len(fractals_sorted)):
+                nxt = fractals_sorted[j]
+                
+                # 必须类型相反
+                if nxt[1] == cur[1]:
+                    continue
+                
+                # 间隔至少1根K线（即索引差>=2）
+                if nxt[0] - cur[0] < 2:
+                    continue
+                
+                # 验证分型的有效性
+                if not self._validate_fractal(df_merged, cur):
+                    break
+                if not self._validate_fractal(df_merged, nxt):
+                    continue
+                
+                # 计算价格幅度
+                if cur[1] == 'bottom' and nxt[1] == 'top':
+                    # 向上笔
+                    start_price = cur[3]   # 低点价格（取底分型低点）
+                    end_price = nxt[2]     # 高点价格（取顶分型高点）
+                    price_change = (end_price - start_price) / start_price
+                    
+                    if price_change >= self.bi_threshold:
+                        # 验证笔的有效性：确保期间没有反向的更大波动
+                        if self._validate_bi(df_merged, cur[0], nxt[0], 1):
+                            bi.append((cur[0], nxt[0], 1, start_price, end_price))
+                            i = j
+                            found = True
+                            break
+                
+                elif cur[1] == 'top' and nxt[1] == 'bottom':
+                    # 向下笔
+                    start_price = cur[2]   # 高点价格
+                    end_price = nxt[3]     # 低点价格
+                    price_change = (start_price - end_price) / start_price
+                    
+                    if price_change >= self.bi_threshold:
+                        # 验证笔的有效性：确保期间没有反向的更大波动
+                        if self._validate_bi(df_merged, cur[0], nxt[0], -1):
+                            bi.append((cur[0], nxt[0], -1, start_price, end_price))
+                            i = j
+                            found = True
+                            break
+            
+            if not found:
+                i += 1
+        
+        return bi
+    
+    def _validate_fractal(self, df_merged: pd.DataFrame, fractal: Tuple[int, str, float, float]) -> bool:
+        """
+        验证分型的有效性
+        
+        Args:
+            df_merged: 合并后的K线数据
+            fractal: 分型 (索引, 类型, 高点, 低点)
+        
+        Returns:
+            是否为有效分型
+        """
+        idx, typ, high, low = fractal
+        
+        # 确保分型位置在有效范围内
+        if idx < 1 or idx >= len(df_merged) - 1:
+            return False
+        
+        # 验证顶分型：中间K线高点最高，低点也较高
+        if typ == 'top':
+            # 检查前后K线的高点
+            prev_high = df_merged['high'].iloc[idx-1]
+            next_high = df_merged['high'].iloc[idx+1]
+            if high <= prev_high or high <= next_high:
+                return False
+            # 检查低点
+            prev_low = df_merged['low'].iloc[idx-1]
+            next_low = df_merged['low'].iloc[idx+1]
+            current_low = df_merged['low'].iloc[idx]
+            if current_low < prev_low or current_low < next_low:
+                return False
+        
+        # 验证底分型：中间K线低点最低，高点也较低
+        elif typ == 'bottom':
+            # 检查前后K线的低点
+            prev_low = df_merged['low'].iloc[idx-1]
+            next_low = df_merged['low'].iloc[idx+1]
+            if low >= prev_low or low >= next_low:
+                return False
+            # 检查高点
+            prev_high = df_merged['high'].iloc[idx-1]
+            next_high = df_merged['high'].iloc[idx+1]
+            current_high = df_merged['high'].iloc[idx]
+            if current_high > prev_high or current_high > next_high:
+                return False
+        
+        return True
+    
+    def _validate_bi(self, df_merged: pd.DataFrame, start_idx: int, end_idx: int, direction: int) -> bool:
+        """
+        验证笔的有效性
+        
+        Args:
+            df_merged: 合并后的K线数据
+            start_idx: 开始索引
+            end_idx: 结束索引
+            direction: 笔的方向，1为向上，-1为向下
+        
+        Returns:
+            是否为有效笔
+        """
+        # 向上笔：确保期间的低点不低于起点，高点逐渐抬升
+        if direction == 1:
+            start_low = df_merged['low'].iloc[start_idx]
+            min_low = df_merged['low'].iloc[start_idx:end_idx+1].min()
+            if min_low < start_low * 0.99:  # 允许小幅回调
+                return False
+            
+            # 确保高点逐渐抬升
+            highs = df_merged['high'].iloc[start_idx:end_idx+1]
+            if highs.is_monotonic_increasing:
+                return True
+            # 允许小幅回调，但整体趋势向上
+            if highs.iloc[-1] > highs.iloc[0]:
+                return True
+        
+        # 向下笔：确保期间的高点不高于起点，低点逐渐下降
+        elif direction == -1:
+            start_high = df_merged['high'].iloc[start_idx]
+            max_high = df_merged['high'].iloc[start_idx:end_idx+1].max()
+            if max_high > start_high * 1.01:  # 允许小幅反弹
+                return False
+            
+            # 确保低点逐渐下降
+            lows = df_merged['low'].iloc[start_idx:end_idx+1]
+            if lows.is_monotonic_decreasing:
+                return True
+            # 允许小幅反弹，但整体趋势向下
+            if lows.iloc[-1] < lows.iloc[0]:
+                return True
+        
+        return False
+
+
+# ================= 测试数据 =================
+
+def make_kline(n: int, seed: int = 7) -> pd.DataFrame:
+    """生成随机游走日线数据"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n))
+    dates = pd.date_range('2000-01-01', periods=n, freq='D')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close}, index=dates)
+
+
+def _timeit(fn, *args, repeat: int = 1) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_merge(sizes, legacy_max: int = 100000):
+    print("merge_k_lines")
+    print(f"{'bars':>8} {'legacy(s)':>10} {'array(s)':>10} {'speedup':>8}")
+    engine = ChanQuantEngine()
+    for n in sizes:
+        df = make_kline(n)
+        t_new = _timeit(engine.merge_k_lines, df, repeat=3)
+        if n <= legacy_max:
+            t_old = _timeit(legacy_merge_k_lines, df)
+            print(f"{n:>8} {t_old:>10.4f} {t_new:>10.4f} {t_old / t_new:>7.1f}x")
+        else:
+            print(f"{n:>8} {'-':>10} {t_new:>10.4f} {'-':>8}")
+
+
+def bench_run(sizes, legacy_max: int = 2500):
+    print("run (merge + fractal + bi + zhongshu + mmd)")
+    print(f"{'bars':>8} {'legacy(s)':>10} {'array(s)':>10} {'speedup':>8}")
+    for n in sizes:
+        df = make_kline(n)
+        t_new = _timeit(ChanQuantEngine(bi_threshold=0.03).run, df, repeat=3)
+        if n <= legacy_max:
+            t_old = _timeit(LegacyChanEngine(bi_threshold=0.03).run, df)
+            print(f"{n:>8} {t_old:>10.4f} {t_new:>10.4f} {t_old / t_new:>7.1f}x")
+        else:
+            print(f"{n:>8} {'-':>10} {t_new:>10.4f} {'-':>8}")
+
+
+def bench_stream(sizes, tail: int = 500):
+    print(f"streaming: last {tail} bars pushed one by one (full rerun vs update)")
+    print(f"{'bars':>8} {'rerun(ms/bar)':>14} {'update(us/bar)':>15}")
+    for n in sizes:
+        df = make_kline(n)
+        head = df.iloc[:n - tail]
+        bars = [(d, {'high': h, 'low': l, 'open': o, 'close': c})
+                for d, h, l, o, c in zip(df.index[n - tail:], df['high'].iloc[n - tail:], df['low'].iloc[n - tail:],
+                                         df['open'].iloc[n - tail:], df['close'].iloc[n - tail:])]
+        engine = IncrementalChanEngine(bi_threshold=0.03)
+        engine.run(head)
+        t0 = time.perf_counter()
+        for d, bar in bars:
+            bar['date'] = d
+            engine.update(bar)
+        t_update = (time.perf_counter() - t0) / tail
+        # 全量重算只抽样若干根，避免基准本身过慢
+        sample = range(n - tail, n, max(tail // 10, 1))
+        t0 = time.perf_counter()
+        for k in sample:
+            ChanQuantEngine(bi_threshold=0.03).run(df.iloc[:k + 1])
+        t_rerun = (time.perf_counter() - t0) / len(sample)
+        print(f"{n:>8} {t_rerun * 1e3:>14.2f} {t_update * 1e6:>15.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--legacy_max", type=int, default=100000, help="merge_k_lines 超过该长度不运行参照实现")
+    ap.add_argument("--legacy_run_max", type=int, default=2500, help="run 超过该长度不运行参照实现（参照实现近似平方复杂度）")
+    args = ap.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    # 基准测试时屏蔽引擎的INFO日志
+    get_logger().setLevel(logging.WARNING)
+    bench_merge(sizes, legacy_max=args.legacy_max)
+    print()
+    bench_run(sizes, legacy_max=args.legacy_run_max)
+    print()
+    bench_stream(sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全市场指标筛选性能基准
+对比逐只股票 build_indicators 与面板模式（panel_ma / panel_macd）筛选 "MA5 > MA20 且 MACD 金叉" 的耗时
+
+用法: python bench_indicators.py [--days 250] [--symbols 500,5000] [--loop_sample 200]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators import build_indicators, cross_above, panel_ma, panel_macd
+
+
+def make_close_panel(days: int, symbols: int, seed: int = 7) -> np.ndarray:
+    """生成随机游走收盘价面板（日期×股票）"""
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, symbols)), axis=0))
+
+
+def _timeit(fn, *args, repeat: int = 1) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def screen_panel(close: np.ndarray) -> np.ndarray:
+    ma = panel_ma(close, (5, 20))
+    macd = panel_macd(close)
+    return (ma['MA5'][-1] > ma['MA20'][-1]) & cross_above(macd['DIF'], macd['DEA'])[-1]
+
+
+def screen_loop(close: np.ndarray) -> np.ndarray:
+    picked = np.zeros(close.shape[1], dtype=bool)
+    for j in range(close.shape[1]):
+        ind = build_indicators(pd.DataFrame({'收盘': close[:, j]}), ['MA5', 'MA20', 'DIF', 'DEA'])
+        dif, dea = ind['DIF'].to_numpy(), ind['DEA'].to_numpy()
+        picked[j] = (ind['MA5'].iloc[-1] > ind['MA20'].iloc[-1]) and dif[-1] > dea[-1] and dif[-2] <= dea[-2]
+    return picked
+
+
+def bench_screen(days: int, sizes, loop_sample: int = 200):
+    print(f"screen MA5>MA20 & MACD golden cross, {days} days")
+    print(f"{'symbols':>8} {'loop(s)':>10} {'panel(s)':>10} {'speedup':>8}")
+    for n in sizes:
+        close = make_close_panel(days, n)
+        t_panel = _timeit(screen_panel, close, repeat=3)
+        # 逐只循环只抽样前 loop_sample 只，按比例外推
+        k = min(n, loop_sample)
+        assert np.array_equal(screen_loop(close[:, :k]), screen_panel(close[:, :k]))
+        t_loop = _timeit(screen_loop, close[:, :k]) * n / k
+        print(f"{n:>8} {t_loop:>10.4f} {t_panel:>10.4f} {t_loop / t_panel:>7.1f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=250)
+    ap.add_argument("--symbols", default="500,5000")
+    ap.add_argument("--loop_sample", type=int, default=200, help="逐只循环抽样的股票数（耗时按比例外推）")
+    args = ap.parse_args()
+    sizes = [int(s) for s in args.symbols.split(",") if s.strip()]
+    bench_screen(args.days, sizes, loop_sample=args.loop_sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,28 +8,78 @@
 import os
 import pickle
 import hashlib
-from datetime import datetime, timedelta
+import sqlite3
+import threading
+import time
 from typing import Dict, Any, Optional
 
 
 class CacheManager:
     """
     缓存管理器
+
+    数据存放在缓存目录下的 SQLite 数据库（WAL 模式，支持多进程并发读写），每条缓存一行：
+    键（前缀+参数的MD5）、前缀、写入时间、最近访问时间、过期时间、大小与 pickle 后的数据。
+    按主键查找；按前缀清除只删除索引行，不反序列化数据；总大小由触发器在同一事务内维护，
+    超过上限时按最近访问时间淘汰。
     """
     
-    def __init__(self, cache_dir: str = './cache', default_ttl: int = 3600):
+    # 数据库文件名
+    DB_NAME = 'cache.sqlite3'
+    # 访问时间的更新间隔（秒）：命中时只在记录的访问时间早于此间隔时写回，读多时不必每次加写锁
+    ACCESS_RESOLUTION = 5.0
+    
+    def __init__(self, cache_dir: str = './cache', default_ttl: int = 3600, max_bytes: int = 512 * 1024 * 1024):
         """
         初始化缓存管理器
         
         Args:
             cache_dir: 缓存目录
             default_ttl: 默认缓存过期时间（秒）
+            max_bytes: 缓存数据总大小上限（字节），超过时淘汰最久未访问的条目
         """
         self.cache_dir = cache_dir
         self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(cache_dir, self.DB_NAME)
+        self._local = threading.local()
         
-        # 创建缓存目录
+        # 创建缓存目录与数据表
         os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, prefix TEXT NOT NULL, created REAL NOT NULL, "
+                "accessed REAL NOT NULL, ttl REAL, size INTEGER NOT NULL, data BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_prefix ON entries(prefix)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed)")
+            # 单行表保存数据总大小，写入/删除时由触发器增减，淘汰时无需扫描全表
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM entries))")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+                "BEGIN UPDATE meta SET total_size = total_size + new.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+                "BEGIN UPDATE meta SET total_size = total_size - old.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries "
+                "BEGIN UPDATE meta SET total_size = total_size - old.size + new.size WHERE id = 0; END"
+            )
+    
+    def _connect(self) -> sqlite3.Connection:
+        """当前线程的数据库连接（每个线程、每个进程各自一个连接，fork 后重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
     
     def _get_cache_key(self, prefix: str, *args) -> str:
         """
@@ -47,18 +97,6 @@ class CacheManager:
         # 使用MD5生成哈希值作为缓存键
         return hashlib.md5(key_str.encode('utf-8')).hexdigest()
     
-    def _get_cache_path(self, key: str) -> str:
-        """
-        获取缓存文件路径
-        
-        Args:
-            key: 缓存键
-        
-        Returns:
-            缓存文件路径
-        """
-        return os.path.join(self.cache_dir, f"{key}.pkl")
-    
     def get(self, prefix: str, *args, ttl: Optional[int] = None) -> Optional[Any]:
         """
         获取缓存数据
@@ -66,57 +104,46 @@ class CacheManager:
         Args:
             prefix: 缓存前缀
             *args: 缓存参数
-            ttl: 缓存过期时间（秒），None使用默认值
+            ttl: 缓存过期时间（秒），None使用写入时的过期时间
         
         Returns:
             缓存数据，如果不存在或已过期返回None
         """
-        from logger import debug, warning
+        from logger import debug, exception
         
-        # 生成缓存键
         key = self._get_cache_key(prefix, *args)
-        cache_path = self._get_cache_path(key)
-        
-        # 检查缓存文件是否存在
-        if not os.path.exists(cache_path):
-            debug(f"缓存不存在: {prefix}")
-            return None
-        
         try:
-            # 读取缓存文件
-            with open(cache_path, 'rb') as f:
-                data = pickle.load(f)
-            
-            # 检查缓存是否过期
-            timestamp = data.get('timestamp')
-            if timestamp is None:
-                warning("缓存文件格式错误，无时间戳")
-                return None
-            
-            # 计算过期时间
-            expiry_seconds = ttl if ttl is not None else self.default_ttl
-            expiry_time = datetime.fromtimestamp(timestamp) + timedelta(seconds=expiry_seconds)
-            
-            if datetime.now() > expiry_time:
-                debug(f"缓存已过期: {prefix}")
-                # 删除过期缓存
-                os.remove(cache_path)
-                return None
-            
+            with self._connect() as conn:
+                row = conn.execute("SELECT created, accessed, ttl, data FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    debug(f"缓存不存在: {prefix}")
+                    return None
+                
+                created, accessed, stored_ttl, blob = row
+                expiry_seconds = ttl if ttl is not None else stored_ttl
+                now = time.time()
+                if expiry_seconds is not None and now > created + expiry_seconds:
+                    debug(f"缓存已过期: {prefix}")
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    return None
+                
+                try:
+                    data = pickle.loads(blob)
+                except Exception as e:
+                    exception(f"读取缓存失败: {e}")
+                    # 删除损坏的缓存
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    return None
+                
+                if now - accessed >= self.ACCESS_RESOLUTION:
+                    conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
             debug(f"缓存命中: {prefix}")
-            return data.get('data')
+            return data
         except Exception as e:
-            from logger import exception
             exception(f"读取缓存失败: {e}")
-            # 删除损坏的缓存文件
-            if os.path.exists(cache_path):
-                try:
-                    os.remove(cache_path)
-                except:
-                    pass
             return None
     
-    def set(self, prefix: str, data: Any, *args) -> bool:
+    def set(self, prefix: str, data: Any, *args, ttl: Optional[int] = None) -> bool:
         """
         设置缓存数据
         
@@ -124,6 +151,7 @@ class CacheManager:
             prefix: 缓存前缀
             data: 要缓存的数据
             *args: 缓存参数
+            ttl: 缓存过期时间（秒），None使用默认值
         
         Returns:
             是否成功设置缓存
@@ -131,19 +159,18 @@ class CacheManager:
         from logger import debug, exception
         
         try:
-            # 生成缓存键
             key = self._get_cache_key(prefix, *args)
-            cache_path = self._get_cache_path(key)
-            
-            # 准备缓存数据
-            cache_data = {
-                'timestamp': datetime.now().timestamp(),
-                'data': data
-            }
-            
-            # 写入缓存文件
-            with open(cache_path, 'wb') as f:
-                pickle.dump(cache_data, f)
+            blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            now = time.time()
+            with self._connect() as conn:
+                # 用 UPSERT 而非 INSERT OR REPLACE，覆盖旧值时触发 size 更新触发器
+                conn.execute(
+                    "INSERT INTO entries (key, prefix, created, accessed, ttl, size, data) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET prefix = excluded.prefix, created = excluded.created, "
+                    "accessed = excluded.accessed, ttl = excluded.ttl, size = excluded.size, data = excluded.data",
+                    (key, prefix, now, now, ttl if ttl is not None else self.default_ttl, len(blob), sqlite3.Binary(blob)),
+                )
+                self._evict(conn)
             
             debug(f"缓存设置成功: {prefix}")
             return True
@@ -151,6 +178,22 @@ class CacheManager:
             exception(f"设置缓存失败: {e}")
             return False
     
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """总大小超过上限时按最近访问时间从旧到新淘汰，返回淘汰条数"""
+        total = conn.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return 0
+        
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        return len(evicted)
+    
     def delete(self, prefix: str, *args) -> bool:
         """
         删除缓存数据
@@ -162,21 +205,15 @@ class CacheManager:
         Returns:
             是否成功删除缓存
         """
-        from logger import debug
+        from logger import debug, exception
         
         try:
-            # 生成缓存键
             key = self._get_cache_key(prefix, *args)
-            cache_path = self._get_cache_path(key)
-            
-            # 删除缓存文件
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
-                debug(f"缓存删除成功: {prefix}")
-            
+            with self._connect() as conn:
+                if conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount:
+                    debug(f"缓存删除成功: {prefix}")
             return True
         except Exception as e:
-            from logger import exception
             exception(f"删除缓存失败: {e}")
             return False
     
@@ -185,7 +222,7 @@ class CacheManager:
         清除缓存
         
         Args:
-            prefix: 缓存前缀，None清除所有缓存
+            prefix: 缓存前缀，None清除所有缓存（含旧版逐键 .pkl 缓存文件）
         
         Returns:
             是否成功清除缓存
@@ -193,34 +230,37 @@ class CacheManager:
         from logger import info, exception
         
         try:
-            if prefix:
-                # 清除指定前缀的缓存
+            with self._connect() as conn:
+                if prefix:
+                    # 按前缀索引删除，不读取数据
+                    removed = conn.execute("DELETE FROM entries WHERE prefix = ?", (prefix,)).rowcount
+                    info(f"清除指定前缀缓存成功: {prefix}，{removed} 条")
+                else:
+                    conn.execute("DELETE FROM entries")
+            if not prefix:
                 for filename in os.listdir(self.cache_dir):
                     if filename.endswith('.pkl'):
-                        # 读取缓存文件，检查前缀
-                        try:
-                            filepath = os.path.join(self.cache_dir, filename)
-                            with open(filepath, 'rb') as f:
-                                data = pickle.load(f)
-                            # 这里简化处理，实际应该在缓存中存储前缀信息
-                            # 或者通过文件名中的哈希值来判断
-                            # 暂时清除所有缓存
-                            os.remove(filepath)
-                        except:
-                            pass
-                info(f"清除指定前缀缓存成功: {prefix}")
-            else:
-                # 清除所有缓存
-                for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('.pkl'):
-                        filepath = os.path.join(self.cache_dir, filename)
-                        os.remove(filepath)
+                        os.remove(os.path.join(self.cache_dir, filename))
+                self._connect().execute("VACUUM")
                 info("清除所有缓存成功")
             
             return True
         except Exception as e:
             exception(f"清除缓存失败: {e}")
             return False
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        缓存统计
+        
+        Returns:
+            条目数、总大小、大小上限与各前缀条目数
+        """
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = conn.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+        prefixes = dict(conn.execute("SELECT prefix, COUNT(*) FROM entries GROUP BY prefix"))
+        return {'entries': entries, 'nbytes': total, 'max_bytes': self.max_bytes, 'prefixes': prefixes}
 
 
 # 全局缓存实例
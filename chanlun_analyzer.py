@@ -57,6 +57,10 @@ class ChanlunAnalyzer:
             # 识别中枢
             zhongshu = engine.find_zhongshu(bi_list, merged)
             
+            # 线段与高级别中枢
+            levels = engine.find_levels(merged, bi_list)
+            segments = levels[1]['strokes'] if len(levels) > 1 else []
+            
             # 生成买卖点
             signals = engine.find_mmd(merged, bi_list, zhongshu)
             
@@ -74,7 +78,7 @@ class ChanlunAnalyzer:
                 trend = '整理'
             
             # 生成简报
-            summary = self._generate_summary(bi_list, zhongshu, trend)
+            summary = self._generate_summary(bi_list, zhongshu, trend, segments)
             
             # 转换信号格式
             signal_list = []
@@ -90,8 +94,10 @@ class ChanlunAnalyzer:
             return {
                 'status': '成功',
                 'bi': bi_list,
-                'segments': [],
+                'segments': segments,
                 'zhongshu': zhongshu,
+                'levels': [{'level': lv['level'], 'segments': lv['strokes'], 'zhongshu': lv['zhongshu']}
+                           for lv in levels],
                 'signals': signal_list,
                 'trend': trend,
                 'summary': summary,
@@ -110,7 +116,7 @@ class ChanlunAnalyzer:
                 'summary': f'分析出错: {str(e)}'
             }
     
-    def _generate_summary(self, bi_list: List, zhongshu: List, trend: str) -> str:
+    def _generate_summary(self, bi_list: List, zhongshu: List, trend: str, segments: List = None) -> str:
         """生成分析简报"""
         parts = []
         
@@ -119,6 +125,10 @@ class ChanlunAnalyzer:
         down_bi = sum(1 for b in bi_list if b[2] == -1)
         parts.append(f"笔: ↑{up_bi}笔/↓{down_bi}笔")
         
+        # 线段
+        if segments:
+            parts.append(f"线段: {len(segments)}段")
+        
         # 中枢
         parts.append(f"中枢: {len(zhongshu)}个")
         
@@ -6,9 +6,699 @@
 功能：K线包含处理、分型、笔、线段、中枢、买卖点识别
 """
 
+import os
+import sys
+import time
 import numpy as np
 import pandas as pd
-from typing import List, Tuple, Optional
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple, Optional
+
+from logger import debug
+
+
+# ================= 数组内核 =================
+
+def merge_k_lines_array(high: np.ndarray, low: np.ndarray,
+                        open_: np.ndarray, close: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    基于NumPy数组的K线包含处理（与 ChanQuantEngine.merge_k_lines 规则一致）
+    
+    Args:
+        high, low, open_, close: 按时间排序的原始K线数组
+    
+    Returns:
+        keep: 每根合并K线所保留的原始K线位置（沿用其时间与open/close）
+        merged_high, merged_low: 合并后的高低点
+        spans: (m, 2) 数组，每根合并K线覆盖的原始K线位置区间 [first, last]
+    """
+    n = len(high)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, np.asarray(high)[:0], np.asarray(low)[:0], np.empty((0, 2), dtype=np.int64)
+    
+    h = np.asarray(high).tolist()
+    l = np.asarray(low).tolist()
+    up = (np.asarray(close) >= np.asarray(open_)).tolist()
+    
+    keep = [0]
+    mh = [h[0]]
+    ml = [l[0]]
+    first = [0]
+    pending_first = -1   # 被当前K线包含而移除的K线所覆盖的起点
+    i = 1
+    while i < n:
+        if not keep:
+            keep.append(i)
+            mh.append(h[i])
+            ml.append(l[i])
+            first.append(pending_first if pending_first >= 0 else i)
+            pending_first = -1
+            i += 1
+            continue
+        
+        ch = h[i]
+        cl = l[i]
+        ph = mh[-1]
+        pl = ml[-1]
+        if ch <= ph and cl >= pl:
+            # 当前被前一根包含：按前一根阴阳方向合并到前一根
+            if up[keep[-1]]:
+                mh[-1] = max(ph, ch)
+                ml[-1] = max(pl, cl)
+            else:
+                mh[-1] = min(ph, ch)
+                ml[-1] = min(pl, cl)
+            i += 1
+        elif ch >= ph and cl <= pl:
+            # 当前包含前一根：移除前一根后继续与新的前一根比较
+            keep.pop()
+            mh.pop()
+            ml.pop()
+            pending_first = first.pop()
+        else:
+            keep.append(i)
+            mh.append(ch)
+            ml.append(cl)
+            first.append(pending_first if pending_first >= 0 else i)
+            pending_first = -1
+            i += 1
+    
+    keep_arr = np.asarray(keep, dtype=np.int64)
+    first_arr = np.asarray(first, dtype=np.int64)
+    last_arr = np.empty_like(first_arr)
+    last_arr[:-1] = first_arr[1:] - 1
+    last_arr[-1] = n - 1
+    spans = np.column_stack([first_arr, last_arr])
+    return (keep_arr,
+            np.asarray(mh, dtype=np.asarray(high).dtype),
+            np.asarray(ml, dtype=np.asarray(low).dtype),
+            spans)
+
+
+def find_fractals_array(high: np.ndarray, low: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    相邻K线平移比较识别分型
+    
+    Returns:
+        idx: 分型所在位置（升序）
+        is_top: 是否为顶分型（否则为底分型）
+    """
+    high = np.asarray(high)
+    low = np.asarray(low)
+    if len(high) < 3:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    mid_h, mid_l = high[1:-1], low[1:-1]
+    top = (mid_h > high[:-2]) & (mid_h > high[2:])
+    bottom = ~top & (mid_l < low[:-2]) & (mid_l < low[2:])
+    idx = np.flatnonzero(top | bottom) + 1
+    return idx, top[idx - 1]
+
+
+def _fractal_validity(high: np.ndarray, low: np.ndarray, idx: np.ndarray,
+                      is_top: np.ndarray, f_high: np.ndarray, f_low: np.ndarray) -> np.ndarray:
+    """
+    分型有效性：顶分型高点严格最高且低点不低于两侧；底分型低点严格最低且高点不高于两侧
+    """
+    n = len(high)
+    ok = (idx >= 1) & (idx < n - 1)
+    i = np.where(ok, idx, 1)
+    if n < 3:
+        return np.zeros(len(idx), dtype=bool)
+    ph, nh, ch = high[i - 1], high[i + 1], high[i]
+    pl, nl, cl = low[i - 1], low[i + 1], low[i]
+    top_ok = ~((f_high <= ph) | (f_high <= nh)) & ~((cl < pl) | (cl < nl))
+    bottom_ok = ~((f_low >= pl) | (f_low >= nl)) & ~((ch > ph) | (ch > nh))
+    return ok & np.where(is_top, top_ok, bottom_ok)
+
+
+def _monotonic_run_start(values: np.ndarray, increasing: bool) -> np.ndarray:
+    """
+    每个位置所在单调（不减/不增）连续段的起点，
+    区间 [s, e] 单调 当且仅当 run_start[e] <= s
+    """
+    n = len(values)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    step_ok = np.empty(n, dtype=bool)
+    step_ok[0] = False
+    if increasing:
+        step_ok[1:] = values[1:] >= values[:-1]
+    else:
+        step_ok[1:] = values[1:] <= values[:-1]
+    breaks = np.where(step_ok, 0, np.arange(n))
+    return np.maximum.accumulate(breaks)
+
+
+def build_bi_array(high: np.ndarray, low: np.ndarray,
+                   fractals: List[Tuple[int, str, float, float]],
+                   bi_threshold: float, decisions: Optional[list] = None) -> List[Tuple[int, int]]:
+    """
+    单次扫描构建笔，返回成笔的分型下标对 (i, j)（指向按位置排序的 fractals）
+    
+    规则与逐个验证的版本一致：起点分型需有效，寻找之后第一个类型相反、
+    间隔>=2、有效、幅度达到阈值且区间走势合格的分型。区间内的最低/最高
+    随扫描滚动累计，一旦越过起点的回撤容忍线即可提前结束本次扫描。
+    decisions 不为 None 时记录每次成笔判定，见 _scan_bi。
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    n_f = len(fractals)
+    if n_f < 2:
+        return []
+    
+    f_idx = np.fromiter((f[0] for f in fractals), dtype=np.int64, count=n_f)
+    f_high = np.fromiter((f[2] for f in fractals), dtype=float, count=n_f)
+    f_low = np.fromiter((f[3] for f in fractals), dtype=float, count=n_f)
+    typ = [f[1] for f in fractals]
+    valid = _fractal_validity_typed(high, low, f_idx, typ, f_high, f_low)
+    
+    return _scan_bi(
+        high.tolist(), low.tolist(),
+        _monotonic_run_start(high, increasing=True).tolist(),
+        _monotonic_run_start(low, increasing=False).tolist(),
+        f_idx.tolist(), typ, f_high.tolist(), f_low.tolist(), valid.tolist(),
+        bi_threshold, decisions=decisions,
+    )
+
+
+def _fractal_validity_typed(high: np.ndarray, low: np.ndarray, f_idx: np.ndarray, typ: List[str],
+                            f_high: np.ndarray, f_low: np.ndarray) -> np.ndarray:
+    """按类型字符串计算分型有效性，非 top/bottom 类型按原规则视为有效"""
+    f_top = np.fromiter((t == 'top' for t in typ), dtype=bool, count=len(typ))
+    f_bottom = np.fromiter((t == 'bottom' for t in typ), dtype=bool, count=len(typ))
+    valid = _fractal_validity(high, low, f_idx, ~f_bottom, f_high, f_low)
+    return valid | ~(f_top | f_bottom)
+
+
+def _scan_bi(h: List[float], l: List[float], inc_start: List[int], dec_start: List[int],
+             idx_l: List[int], typ_l: List[str], fh_l: List[float], fl_l: List[float],
+             valid_l: List[bool], bi_threshold: float, start: int = 0,
+             decisions: Optional[list] = None) -> List[Tuple[int, int]]:
+    """
+    从第 start 个分型开始的贪心成笔扫描（纯列表运算）
+    
+    decisions 不为 None 时，逐个记录每次判定 (i, j, horizon)：j 为成笔终点分型
+    （未成笔为 -1，起点分型无效为 -2），horizon 为该判定依赖到的最大K线位置，供增量计算回滚使用。
+    扫描到序列末尾仍未成笔的判定依赖后续数据，horizon 记为K线总数。
+    """
+    n_f = len(idx_l)
+    n_bars = len(h)
+    pairs = []
+    i = start
+    while i < n_f - 1:
+        if not valid_l[i] or typ_l[i] not in ('top', 'bottom'):
+            if decisions is not None:
+                decisions.append((i, -2, idx_l[i] + 1))
+            i += 1
+            continue
+        s = idx_l[i]
+        up = typ_l[i] == 'bottom'
+        found = False
+        horizon = n_bars
+        if up:
+            start_price = fl_l[i]
+            floor = l[s] * 0.99
+            run = l[s]
+        else:
+            start_price = fh_l[i]
+            ceil = h[s] * 1.01
+            run = h[s]
+        pos = s
+        for j in range(i + 1, n_f):
+            e = idx_l[j]
+            # 滚动更新区间 [s, e] 的最低（向上笔）/最高（向下笔）
+            if e > pos:
+                if up:
+                    run = min(run, min(l[pos + 1:e + 1]))
+                else:
+                    run = max(run, max(h[pos + 1:e + 1]))
+                pos = e
+            if (up and run < floor) or (not up and run > ceil):
+                horizon = e + 1
+                break
+            if typ_l[j] == typ_l[i] or e - s < 2 or not valid_l[j]:
+                continue
+            if up:
+                if typ_l[j] != 'top':
+                    continue
+                if (fh_l[j] - start_price) / start_price < bi_threshold:
+                    continue
+                if not (inc_start[e] <= s or h[e] > h[s]):
+                    continue
+            else:
+                if typ_l[j] != 'bottom':
+                    continue
+                if (start_price - fl_l[j]) / start_price < bi_threshold:
+                    continue
+                if not (dec_start[e] <= s or l[e] < l[s]):
+                    continue
+            pairs.append((i, j))
+            if decisions is not None:
+                decisions.append((i, j, e + 1))
+            i = j
+            found = True
+            break
+        if not found:
+            if decisions is not None:
+                decisions.append((i, -1, horizon))
+            i += 1
+    return pairs
+
+
+class SparseTable:
+    """
+    区间最大/最小值稀疏表：O(n log n) 构建，O(1) 查询闭区间 [l, r]
+    
+    Args:
+        values: 一维数组
+        op: 'max' 或 'min'
+    """
+    
+    def __init__(self, values: np.ndarray, op: str = 'max'):
+        if op not in ('max', 'min'):
+            raise ValueError(f"不支持的区间运算: {op}")
+        self._ufunc = np.maximum if op == 'max' else np.minimum
+        level = np.asarray(values, dtype=float)
+        self._levels = [level]
+        span = 1
+        while 2 * span <= len(level):
+            prev = self._levels[-1]
+            self._levels.append(self._ufunc(prev[:-span], prev[span:]))
+            span *= 2
+    
+    def __len__(self) -> int:
+        return len(self._levels[0])
+    
+    def query(self, l: int, r: int) -> float:
+        """闭区间 [l, r] 的最值"""
+        k = (r - l + 1).bit_length() - 1
+        level = self._levels[k]
+        return self._ufunc(level[l], level[r - (1 << k) + 1])
+    
+    def query_many(self, l: np.ndarray, r: np.ndarray) -> np.ndarray:
+        """批量查询闭区间 [l[i], r[i]] 的最值"""
+        l = np.asarray(l, dtype=np.int64)
+        r = np.asarray(r, dtype=np.int64)
+        out = np.empty(len(l), dtype=float)
+        if len(l) == 0:
+            return out
+        k = np.frexp((r - l + 1).astype(float))[1] - 1
+        for level_k in np.unique(k):
+            mask = k == level_k
+            level = self._levels[level_k]
+            out[mask] = self._ufunc(level[l[mask]], level[r[mask] - (1 << int(level_k)) + 1])
+        return out
+
+
+def _prefix_sum(values) -> np.ndarray:
+    """带前导0的累计和，区间 [l, r] 的和为 cs[r+1] - cs[l]"""
+    cs = np.empty(len(values) + 1, dtype=float)
+    cs[0] = 0.
+    np.cumsum(values, out=cs[1:])
+    return cs
+
+
+def _bi_high_low(bi: List[Tuple], high_table: SparseTable,
+                 low_table: SparseTable) -> Tuple[np.ndarray, np.ndarray]:
+    """每一笔区间内（含起止价格）的最高/最低价"""
+    arr = np.asarray([(b[0], b[1], b[2], b[3], b[4]) for b in bi], dtype=float)
+    starts = arr[:, 0].astype(np.int64)
+    ends = arr[:, 1].astype(np.int64)
+    up = arr[:, 2] == 1
+    sp, ep = arr[:, 3], arr[:, 4]
+    bi_high = np.maximum(high_table.query_many(starts, ends), np.where(up, ep, sp))
+    bi_low = np.minimum(low_table.query_many(starts, ends), np.where(up, sp, ep))
+    return bi_high, bi_low
+
+
+def _scan_zhongshu(bi_high: List[float], bi_low: List[float], start: int = 0,
+                   bi: Optional[List[Tuple]] = None, trace: Optional['ChanTrace'] = None) -> List[Tuple]:
+    """
+    从第 start 笔开始扫描中枢（形成 + 延伸）
+    
+    - 形成：连续三笔重叠，ZG = 三笔高点最小值，ZD = 三笔低点最大值
+    - 延伸：之后与 [ZD, ZG] 重叠的笔都并入中枢，ZG/ZD 不变，GG/DD 随之扩展
+    - 结束：第一根不与 [ZD, ZG] 重叠的笔为离开笔，下一个中枢从离开笔开始寻找
+    
+    Returns:
+        [(first_bi, last_bi, zg, zd, gg, dd, dep)]，dep 为判定依赖到的最大笔下标
+        （离开笔；延伸到末尾尚未离开的中枢为 sys.maxsize）
+    """
+    raw = []
+    n = len(bi_high)
+    i = start
+    while i + 2 < n:
+        zg = min(bi_high[i], bi_high[i + 1], bi_high[i + 2])
+        zd = max(bi_low[i], bi_low[i + 1], bi_low[i + 2])
+        if not zg > zd:
+            if trace is not None:
+                trace.record_zhongshu(ChanTrace.ZS_REJECT, i, bi[i][0], bi[i + 2][1], zg, zd)
+            i += 1
+            continue
+        gg = max(bi_high[i], bi_high[i + 1], bi_high[i + 2])
+        dd = min(bi_low[i], bi_low[i + 1], bi_low[i + 2])
+        k = i + 3
+        while k < n and min(bi_high[k], zg) > max(bi_low[k], zd):
+            gg = max(gg, bi_high[k])
+            dd = min(dd, bi_low[k])
+            k += 1
+        if trace is not None:
+            trace.record_zhongshu(ChanTrace.ZS_FORM, i, bi[i][0], bi[k - 1][1], zg, zd)
+        raw.append((i, k - 1, zg, zd, gg, dd, k if k < n else sys.maxsize))
+        i = k
+    return raw
+
+
+def _merge_zhongshu(raw: List[Tuple], merged: Optional[List[list]] = None, raw_start: int = 0,
+                    bi: Optional[List[Tuple]] = None, trace: Optional['ChanTrace'] = None) -> List[list]:
+    """
+    中枢合并：离开后又回到原中枢区间（相邻中枢的 [ZD, ZG] 重叠）时视为同一中枢，
+    合并后 ZG/ZD 取两者的并集范围。波动区间 [DD, GG] 重叠的扩张属于级别升级，不在此合并
+    
+    Args:
+        raw: _scan_zhongshu 的输出
+        merged: 已有的合并结果（就地追加），元素为
+                [first_bi, last_bi, zg, zd, gg, dd, first_raw, last_raw]
+        raw_start: 从 raw 的第几个开始合并
+    """
+    if merged is None:
+        merged = []
+    for r in range(raw_start, len(raw)):
+        first, last, zg, zd, gg, dd, _ = raw[r]
+        if merged and min(merged[-1][2], zg) > max(merged[-1][3], zd):
+            m = merged[-1]
+            m[1] = last
+            m[2] = max(m[2], zg)
+            m[3] = min(m[3], zd)
+            m[4] = max(m[4], gg)
+            m[5] = min(m[5], dd)
+            m[7] = r
+            if trace is not None:
+                trace.record_zhongshu(ChanTrace.ZS_MERGE, m[0], bi[m[0]][0], bi[m[1]][1], m[2], m[3])
+        else:
+            merged.append([first, last, zg, zd, gg, dd, r, r])
+    return merged
+
+
+def build_segments(strokes: List[Tuple]) -> List[Tuple]:
+    """
+    由低一级的笔（或线段）构建线段，输入输出格式均为
+    (start_idx, end_idx, direction, start_price, end_price)
+    
+    特征序列法：向上线段的特征序列为其中的向下笔（向下线段为向上笔），
+    按线段方向做包含处理后出现顶分型（向下线段为底分型）且分型极值越过
+    线段起点时，线段在分型中间元素的起点结束，下一线段从该笔开始。
+    反向笔跌破（向下线段为升破）线段起点时，线段在此前的极值处结束；
+    此时不足三笔则放弃该起点，从下一笔重新开始。
+    线段至少包含三笔；只输出已确认的线段。
+    
+    每条线段扫描到确认位置为止，下一条从线段终点续扫，
+    总体为对笔序列的线性扫描。
+    """
+    segments = []
+    n = len(strokes)
+    i = 0
+    while i + 3 < n:
+        d = strokes[i][2]
+        start_price = strokes[i][3]
+        feature = []        # 包含处理后的特征序列 [high, low, 笔下标]
+        end_at = -1
+        breached = False
+        for k in range(i + 1, n):
+            s = strokes[k]
+            if s[2] != -d:
+                continue
+            hi, lo = max(s[3], s[4]), min(s[3], s[4])
+            if (d == 1 and lo < start_price) or (d == -1 and hi > start_price):
+                breached = True
+                if feature:
+                    peak = max(feature, key=lambda f: f[0]) if d == 1 else min(feature, key=lambda f: f[1])
+                    if peak[2] - i >= 3:
+                        end_at = peak[2]
+                break
+            if feature:
+                top = feature[-1]
+                if (hi <= top[0] and lo >= top[1]) or (hi >= top[0] and lo <= top[1]):
+                    # 特征序列包含处理：向上线段取高高，向下线段取低低，保留极值所在笔
+                    if d == 1:
+                        idx = k if hi > top[0] else top[2]
+                        feature[-1] = [max(hi, top[0]), max(lo, top[1]), idx]
+                    else:
+                        idx = k if lo < top[1] else top[2]
+                        feature[-1] = [min(hi, top[0]), min(lo, top[1]), idx]
+                    continue
+            feature.append([hi, lo, k])
+            if len(feature) < 3:
+                continue
+            f1, f2, f3 = feature[-3:]
+            if f2[2] - i < 3:
+                continue
+            if d == 1:
+                confirmed = f2[0] > f1[0] and f2[0] > f3[0] and f2[0] > start_price
+            else:
+                confirmed = f2[1] < f1[1] and f2[1] < f3[1] and f2[1] < start_price
+            if confirmed:
+                end_at = f2[2]
+                break
+        if end_at < 0:
+            if not breached:
+                break
+            i += 1
+            continue
+        end = strokes[end_at]
+        segments.append((strokes[i][0], end[0], d, start_price, end[3]))
+        i = end_at
+    return segments
+
+
+def build_levels(bi: List[Tuple], zhongshu_detail: List[list],
+                 high_table: SparseTable, low_table: SparseTable,
+                 max_level: Optional[int] = None) -> List[dict]:
+    """
+    递归构建多级别结构：第1级为笔及其中枢，第k+1级线段由第k级的笔/线段构建，
+    各级中枢沿用与笔中枢相同的规则（_scan_zhongshu / _merge_zhongshu）
+    
+    每升一级元素数至少减少为三分之一，总耗时与笔数同阶。
+    
+    Args:
+        bi: 笔列表
+        zhongshu_detail: 笔中枢明细（find_zhongshu 的结果），作为第1级
+        high_table, low_table: 合并K线的区间最高/最低价稀疏表
+        max_level: 最高级别，None 表示直到无法构成线段
+    
+    Returns:
+        [{'level', 'strokes', 'zhongshu', 'zhongshu_detail'}]，zhongshu 格式同 find_zhongshu
+    """
+    def zs_tuples(strokes, detail):
+        return [(strokes[m[0]][0], strokes[m[1]][1], m[2], m[3]) for m in detail]
+    
+    levels = [{'level': 1, 'strokes': bi, 'zhongshu': zs_tuples(bi, zhongshu_detail),
+               'zhongshu_detail': zhongshu_detail}]
+    strokes = bi
+    while max_level is None or len(levels) < max_level:
+        strokes = build_segments(strokes)
+        if not strokes:
+            break
+        detail = []
+        if len(strokes) >= 3:
+            seg_high, seg_low = _bi_high_low(strokes, high_table, low_table)
+            raw = _scan_zhongshu(seg_high.tolist(), seg_low.tolist())
+            detail = [m[:6] for m in _merge_zhongshu(raw)]
+        levels.append({'level': len(levels) + 1, 'strokes': strokes,
+                       'zhongshu': zs_tuples(strokes, detail), 'zhongshu_detail': detail})
+    return levels
+
+
+def _level_summary(levels: List[dict]) -> List[dict]:
+    """各级别的元素数与中枢数"""
+    return [{'level': lv['level'], 'stroke_count': len(lv['strokes']),
+             'zhongshu_count': len(lv['zhongshu'])} for lv in levels]
+
+
+def find_mmd_array(dates, low: np.ndarray, bi: List[Tuple], zhongshu: List[Tuple],
+                   macd_cumsum: Optional[np.ndarray] = None,
+                   bi_starts: Optional[List[int]] = None) -> List[Tuple]:
+    """
+    基于位置的买卖点识别（与 ChanQuantEngine.find_mmd 规则一致）
+    
+    笔按起点/终点位置严格递增，中枢之后的笔、一买之后的笔、中枢之前最近的
+    向下笔均通过二分定位，只遍历中枢之后的笔；笔区间的MACD柱面积由累计和
+    两次查表得到。
+    
+    Args:
+        dates: 合并K线的时间序列（按位置索引）
+        low: 合并K线低点
+        bi: 笔列表
+        zhongshu: 中枢列表
+        macd_cumsum: MACD柱带前导0的累计和（见 _prefix_sum），为 None 时使用无MACD的一买规则
+        bi_starts: 各笔起点位置（可选，增量计算时复用）
+    
+    Returns:
+        信号列表 [(date, signal, price)]
+    """
+    if not zhongshu:
+        return []
+    
+    # 获取最后一个中枢
+    zs_start, zs_end, zg, zd = zhongshu[-1]
+    
+    # 获取中枢之后的笔
+    starts = bi_starts if bi_starts is not None else [b[0] for b in bi]
+    first_after = bisect_right(starts, zs_end)
+    after_bi = bi[first_after:]
+    if not after_bi:
+        return []
+    
+    signals = []
+    buy1_pos = -1
+    for i, b in enumerate(after_bi):
+        start, end, dir_, sp, ep = b
+        
+        # 第一类买点：中枢之后第一笔为向下笔，并背驰
+        if dir_ == -1 and i == 0:
+            if macd_cumsum is not None:
+                area = macd_cumsum[end + 1] - macd_cumsum[start]
+                # 对比中枢之前最近一段向下笔的MACD面积
+                prev = None
+                for k in range(bisect_left(starts, zs_start) - 1, -1, -1):
+                    if bi[k][2] == -1 and bi[k][1] < zs_start:
+                        prev = bi[k]
+                        break
+                if prev is not None:
+                    prev_area = macd_cumsum[prev[1] + 1] - macd_cumsum[prev[0]]
+                    if area > prev_area:
+                        if low[end] < low[prev[1]] and area < prev_area:
+                            signals.append((dates[end], 'buy1', ep))
+                            buy1_pos = end
+            else:
+                if low[end] == min(low[start:end+1]):
+                    signals.append((dates[end], 'buy1', ep))
+                    buy1_pos = end
+        
+        # 第二类买点：一买之后向上笔的回调不破一买低点
+        if signals and signals[-1][1] == 'buy1':
+            buy1_price = signals[-1][2]
+            k = bisect_right(starts, buy1_pos)
+            if len(bi) - k >= 2:
+                up, down = bi[k], bi[k + 1]
+                if up[2] == 1 and down[2] == -1:
+                    if down[4] > buy1_price * 0.99:
+                        signals.append((dates[down[1]], 'buy2', down[4]))
+        
+        # 第三类买点：向上突破中枢后，回踩笔不进入中枢
+        if dir_ == 1 and ep > zg:
+            if i+1 < len(after_bi):
+                next_bi = after_bi[i+1]
+                if next_bi[2] == -1 and next_bi[4] > zg:
+                    signals.append((dates[next_bi[1]], 'buy3', next_bi[4]))
+    return signals
+
+
+def _signals_frame(signals: List[Tuple]) -> pd.DataFrame:
+    """信号列表转换为以时间为索引的DataFrame"""
+    if not signals:
+        return pd.DataFrame()
+    df_signals = pd.DataFrame(signals, columns=['date', 'signal', 'price'])
+    df_signals.set_index('date', inplace=True)
+    return df_signals
+
+
+# ================= 结构化追踪 =================
+
+class ChanTrace:
+    """
+    笔/中枢判定的结构化追踪器
+    
+    以紧凑的结构化数组记录每次判定，替代逐笔写日志。引擎的 trace 参数为
+    None（默认）时不做任何记录。
+    
+    记录字段：
+        kind: 判定类型，见 KIND_NAMES
+        i, j: 笔判定为起点/终点分型下标（未成笔 j<0）；中枢判定 i 为首笔下标
+        start, end: 对应的K线位置区间
+        horizon: 笔判定依赖到的最大K线位置（中枢判定为 -1）
+        v1, v2: 笔的起止价格；中枢的 zg / zd
+    
+    用法：
+        trace = ChanTrace()
+        ChanQuantEngine(trace=trace).run(df)
+        trace.to_frame()
+    """
+    
+    BI_INVALID = 0      # 起点分型无效
+    BI_FAIL = 1         # 未找到终点分型
+    BI_ACCEPT = 2       # 成笔
+    ZS_REJECT = 3       # 三笔无重叠
+    ZS_FORM = 4         # 构成中枢（含延伸）
+    ZS_MERGE = 5        # 与前一中枢合并
+    KIND_NAMES = ('bi_invalid', 'bi_fail', 'bi_accept', 'zs_reject', 'zs_form', 'zs_merge')
+    
+    DTYPE = np.dtype([
+        ('kind', np.uint8), ('i', np.int32), ('j', np.int32),
+        ('start', np.int32), ('end', np.int32), ('horizon', np.int32),
+        ('v1', np.float64), ('v2', np.float64),
+    ])
+    
+    def __init__(self, capacity: int = 1024):
+        self._buf = np.empty(max(capacity, 1), dtype=self.DTYPE)
+        self._n = 0
+    
+    def __len__(self) -> int:
+        return self._n
+    
+    def clear(self):
+        """清空记录（保留已分配的空间）"""
+        self._n = 0
+    
+    def _reserve(self, extra: int):
+        need = self._n + extra
+        if need > len(self._buf):
+            buf = np.empty(max(need, 2 * len(self._buf)), dtype=self.DTYPE)
+            buf[:self._n] = self._buf[:self._n]
+            self._buf = buf
+    
+    def record_bi(self, decisions: List[Tuple[int, int, int]], fractals: List[Tuple]):
+        """
+        记录一批成笔判定
+        
+        Args:
+            decisions: _scan_bi 输出的 (i, j, horizon)
+            fractals: 按位置排序的分型列表
+        """
+        if not decisions:
+            return
+        self._reserve(len(decisions))
+        out = self._buf[self._n:self._n + len(decisions)]
+        for k, (i, j, horizon) in enumerate(decisions):
+            cur = fractals[i]
+            price = cur[3] if cur[1] == 'bottom' else cur[2]
+            if j >= 0:
+                nxt = fractals[j]
+                out[k] = (self.BI_ACCEPT, i, j, cur[0], nxt[0], horizon, price,
+                          nxt[2] if cur[1] == 'bottom' else nxt[3])
+            else:
+                kind = self.BI_INVALID if j == -2 else self.BI_FAIL
+                out[k] = (kind, i, j, cur[0], -1, horizon, price, np.nan)
+        self._n += len(decisions)
+    
+    def record_zhongshu(self, kind: int, first_bi: int, start: int, end: int, zg: float, zd: float):
+        """记录一次中枢判定（ZS_REJECT / ZS_FORM / ZS_MERGE）"""
+        self._reserve(1)
+        self._buf[self._n] = (kind, first_bi, -1, start, end, -1, zg, zd)
+        self._n += 1
+    
+    def to_array(self) -> np.ndarray:
+        """已记录部分的结构化数组副本"""
+        return self._buf[:self._n].copy()
+    
+    def to_frame(self) -> pd.DataFrame:
+        """转换为DataFrame，kind 列为判定类型名称"""
+        df = pd.DataFrame(self.to_array())
+        df['kind'] = pd.Categorical.from_codes(df['kind'], categories=list(self.KIND_NAMES))
+        return df
 
 
 class ChanQuantEngine:
@@ -23,129 +713,81 @@ class ChanQuantEngine:
                  use_macd: bool = True,              # 是否使用MACD背驰
                  macd_fast: int = 12,
                  macd_slow: int = 26,
-                 macd_signal: int = 9):
+                 macd_signal: int = 9,
+                 trace: Optional['ChanTrace'] = None):   # 结构化追踪（None 时不记录）
         self.bi_threshold = bi_threshold
         self.max_include_len = max_include_len
         self.use_macd = use_macd
         self.macd_fast = macd_fast
         self.macd_slow = macd_slow
         self.macd_signal = macd_signal
+        self.trace = trace
         
         # 存储计算结果
         self.k_merged = None          # 合并后的K线 DataFrame
+        self._k_index_map = None      # 合并K线 -> 原始K线位置区间 [(first, last)]，见 k_index_map
         self.fractals = []            # 分型列表 [(idx, type, high, low)]
         self.bi = []                  # 笔列表 [(start_idx, end_idx, direction, start_price, end_price)]
-        self.segments = []             # 线段列表（可选）
+        self.levels = []               # 多级别结构，见 build_levels（线段见 segments）
         self.zhongshu = []             # 中枢列表 [(start_idx, end_idx, zg, zd)]
+        self.zhongshu_detail = []      # 中枢明细 [[first_bi, last_bi, zg, zd, gg, dd]]
+        self._range_tables = None      # (df_merged, 最高价稀疏表, 最低价稀疏表)
         self.signals = pd.DataFrame()  # 最终信号表
         
+    @property
+    def k_index_map(self) -> Optional[np.ndarray]:
+        """合并K线 -> 原始K线位置区间 [(first, last)]，由 merge_k_lines 生成（只读）"""
+        return self._k_index_map
+    
+    @property
+    def segments(self) -> List[Tuple]:
+        """线段列表，格式同笔，即多级别结构第1级的笔（只读）"""
+        return self.levels[1]['strokes'] if len(self.levels) > 1 else []
+    
     def merge_k_lines(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         处理K线包含关系，返回合并后的K线序列
         df 必须包含 'high','low','open','close'，索引为datetime
         返回的DataFrame包含合并后的K线，并保留原始索引范围
+        合并K线到原始K线的映射保存在 self.k_index_map
         """
-        from logger import debug
-        
         data = df[['high','low','open','close']].copy()
         data = data.reset_index().rename(columns={'index':'date'})
         # 按时间排序
         data = data.sort_values('date')
         
-        merged = []
-        i = 0
-        n = len(data)
-        
         # 处理空数据情况
-        if n == 0:
+        if len(data) == 0:
             debug("输入数据为空，返回原始DataFrame")
+            self._k_index_map = np.empty((0, 2), dtype=np.int64)
             return df
         
-        while i < n:
-            if i == 0:
-                # 第一根K线直接加入
-                merged.append(data.iloc[i].to_dict())
-                i += 1
-                continue
-            
-            # 确保merged列表不为空
-            if not merged:
-                debug("merged列表为空，添加当前K线")
-                merged.append(data.iloc[i].to_dict())
-                i += 1
-                continue
-            
-            current = data.iloc[i]
-            prev = merged[-1]
-            
-            # 检查包含关系：当前K线高点 <= 前一根高点 且 当前低点 >= 前一根低点 -> 被包含
-            # 或者 当前高点 >= 前一根高点 且 当前低点 <= 前一根低点 -> 包含前一根
-            if current['high'] <= prev['high'] and current['low'] >= prev['low']:
-                # 当前被前一根包含：需要合并到前一根
-                # 方向判断：如果前一根是上升（close>open），则取高点更高，低点更高；下降则取低点更低，高点更低
-                if prev['close'] >= prev['open']:  # 阳线
-                    new_high = max(prev['high'], current['high'])
-                    new_low = max(prev['low'], current['low'])  # 上升趋势取较高低点
-                else:
-                    new_high = min(prev['high'], current['high'])  # 下降趋势取较低高点
-                    new_low = min(prev['low'], current['low'])
-                # 合并K线：保留前一根的时间，更新high/low，open/close处理
-                prev['high'] = new_high
-                prev['low'] = new_low
-                # open和close可以选择保留前一根的，或者根据趋势调整，简化：保留前一根
-                # 但为了后续分型识别，我们保留open/close不变
-                # 记录合并次数，防止无限循环
-                i += 1
-            elif current['high'] >= prev['high'] and current['low'] <= prev['low']:
-                # 当前包含前一根：需要将前一根合并到当前
-                # 先移除前一跟
-                merged.pop()
-                # 重新判断当前与新的前一根的关系（循环处理）
-                continue
-            else:
-                # 无包含，直接加入
-                merged.append(current.to_dict())
-                i += 1
+        keep, high, low, spans = merge_k_lines_array(
+            data['high'].to_numpy(), data['low'].to_numpy(),
+            data['open'].to_numpy(), data['close'].to_numpy(),
+        )
+        self._k_index_map = spans
         
-        # 转换为DataFrame
-        merged_df = pd.DataFrame(merged)
+        # 保留每根合并K线的起始行（时间/open/close），更新合并后的high/low
+        merged_df = data[['date', 'high', 'low', 'open', 'close']].iloc[keep].reset_index(drop=True)
+        merged_df['high'] = high
+        merged_df['low'] = low
+        # 与逐行 to_dict 构造保持一致：全数值列时按行的公共类型统一上转
+        if all(pd.api.types.is_numeric_dtype(t) for t in merged_df.dtypes):
+            merged_df = merged_df.astype(np.result_type(*merged_df.dtypes))
         merged_df.set_index('date', inplace=True)
         return merged_df
     
-    def _is_fractal(self, data: pd.DataFrame, i: int, window: int = 2) -> Tuple[bool, str]:
-        """
-        判断i位置是否为分型（基于合并后的K线）
-        使用前后各window根K线比较，标准分型要求相邻K线不包含（已合并，故满足）
-        """
-        if i < window or i >= len(data) - window:
-            return False, ''
-        left_high = data['high'].iloc[i-window:i].max()
-        left_low = data['low'].iloc[i-window:i].min()
-        right_high = data['high'].iloc[i+1:i+window+1].max()
-        right_low = data['low'].iloc[i+1:i+window+1].min()
-        cur_high = data['high'].iloc[i]
-        cur_low = data['low'].iloc[i]
-        
-        # 顶分型：中间高点最高，且中间低点不是最低（可选条件）
-        if cur_high > left_high and cur_high > right_high:
-            # 可附加条件：中间低点大于左右低点之一？标准定义只要求高点最高
-            return True, 'top'
-        # 底分型：中间低点最低
-        if cur_low < left_low and cur_low < right_low:
-            return True, 'bottom'
-        return False, ''
-    
     def find_fractals(self, df_merged: pd.DataFrame) -> List[Tuple[int, str, float, float]]:
         """
         识别所有分型，返回列表 (索引位置, 类型, 高点, 低点)
+        使用相邻两根K线比较（window=1），顶分型优先于底分型
         """
-        fractals = []
-        n = len(df_merged)
-        for i in range(1, n-1):
-            is_f, typ = self._is_fractal(df_merged, i, window=1)  # 使用window=1简化，即相邻两根比较
-            if is_f:
-                fractals.append((i, typ, df_merged['high'].iloc[i], df_merged['low'].iloc[i]))
-        return fractals
+        high = df_merged['high'].to_numpy()
+        low = df_merged['low'].to_numpy()
+        idx, is_top = find_fractals_array(high, low)
+        return [(i, 'top' if t else 'bottom', high[i], low[i])
+                for i, t in zip(idx.tolist(), is_top.tolist())]
     
     def find_bi(self, df_merged: pd.DataFrame, fractals: List[Tuple[int, str, float, float]]) -> List[Tuple[int, int, int, float, float]]:
         """
@@ -153,203 +795,57 @@ class ChanQuantEngine:
         返回列表 (start_idx, end_idx, direction, start_price, end_price)
         direction: 1 向上笔, -1 向下笔
         """
-        from logger import info
-        
         bi = []
         if len(fractals) < 2:
             return bi
         
         # 按索引排序
         fractals_sorted = sorted(fractals, key=lambda x: x[0])
-        info(f"开始生成笔，分型数量: {len(fractals_sorted)}")
         
-        i = 0
-        while i < len(fractals_sorted)-1:
+        high = df_merged['high'].to_numpy()
+        low = df_merged['low'].to_numpy()
+        decisions = [] if self.trace is not None else None
+        pairs = build_bi_array(high, low, fractals_sorted, self.bi_threshold, decisions=decisions)
+        if decisions is not None:
+            self.trace.record_bi(decisions, fractals_sorted)
+        
+        for i, j in pairs:
             cur = fractals_sorted[i]
-            found = False
-            
-            # 寻找下一个类型相反的分型
-            for j in range(i+1, len(fractals_sorted)):
-                nxt = fractals_sorted[j]
-                
-                # 必须类型相反
-                if nxt[1] == cur[1]:
-                    continue
-                
-                # 间隔至少1根K线（即索引差>=2）
-                if nxt[0] - cur[0] < 2:
-                    continue
-                
-                # 验证分型的有效性
-                if not self._validate_fractal(df_merged, cur):
-                    break
-                if not self._validate_fractal(df_merged, nxt):
-                    continue
-                
-                # 计算价格幅度
-                if cur[1] == 'bottom' and nxt[1] == 'top':
-                    # 向上笔
-                    start_price = cur[3]   # 低点价格（取底分型低点）
-                    end_price = nxt[2]     # 高点价格（取顶分型高点）
-                    price_change = (end_price - start_price) / start_price
-                    
-                    if price_change >= self.bi_threshold:
-                        # 验证笔的有效性：确保期间没有反向的更大波动
-                        if self._validate_bi(df_merged, cur[0], nxt[0], 1):
-                            bi.append((cur[0], nxt[0], 1, start_price, end_price))
-                            info(f"生成向上笔: {cur[0]} -> {nxt[0]}, 价格: {start_price:.2f} -> {end_price:.2f}, 涨幅: {price_change:.2%}")
-                            i = j
-                            found = True
-                            break
-                
-                elif cur[1] == 'top' and nxt[1] == 'bottom':
-                    # 向下笔
-                    start_price = cur[2]   # 高点价格
-                    end_price = nxt[3]     # 低点价格
-                    price_change = (start_price - end_price) / start_price
-                    
-                    if price_change >= self.bi_threshold:
-                        # 验证笔的有效性：确保期间没有反向的更大波动
-                        if self._validate_bi(df_merged, cur[0], nxt[0], -1):
-                            bi.append((cur[0], nxt[0], -1, start_price, end_price))
-                            info(f"生成向下笔: {cur[0]} -> {nxt[0]}, 价格: {start_price:.2f} -> {end_price:.2f}, 跌幅: {price_change:.2%}")
-                            i = j
-                            found = True
-                            break
-            
-            if not found:
-                i += 1
-        
-        info(f"笔生成完成，笔数量: {len(bi)}")
+            nxt = fractals_sorted[j]
+            if cur[1] == 'bottom':
+                bi.append((cur[0], nxt[0], 1, cur[3], nxt[2]))
+            else:
+                bi.append((cur[0], nxt[0], -1, cur[2], nxt[3]))
         return bi
     
-    def _validate_fractal(self, df_merged: pd.DataFrame, fractal: Tuple[int, str, float, float]) -> bool:
-        """
-        验证分型的有效性
-        
-        Args:
-            df_merged: 合并后的K线数据
-            fractal: 分型 (索引, 类型, 高点, 低点)
-        
-        Returns:
-            是否为有效分型
+    def range_tables(self, df_merged: pd.DataFrame) -> Tuple[SparseTable, SparseTable]:
         """
-        idx, typ, high, low = fractal
-        
-        # 确保分型位置在有效范围内
-        if idx < 1 or idx >= len(df_merged) - 1:
-            return False
-        
-        # 验证顶分型：中间K线高点最高，低点也较高
-        if typ == 'top':
-            # 检查前后K线的高点
-            prev_high = df_merged['high'].iloc[idx-1]
-            next_high = df_merged['high'].iloc[idx+1]
-            if high <= prev_high or high <= next_high:
-                return False
-            # 检查低点
-            prev_low = df_merged['low'].iloc[idx-1]
-            next_low = df_merged['low'].iloc[idx+1]
-            current_low = df_merged['low'].iloc[idx]
-            if current_low < prev_low or current_low < next_low:
-                return False
-        
-        # 验证底分型：中间K线低点最低，高点也较低
-        elif typ == 'bottom':
-            # 检查前后K线的低点
-            prev_low = df_merged['low'].iloc[idx-1]
-            next_low = df_merged['low'].iloc[idx+1]
-            if low >= prev_low or low >= next_low:
-                return False
-            # 检查高点
-            prev_high = df_merged['high'].iloc[idx-1]
-            next_high = df_merged['high'].iloc[idx+1]
-            current_high = df_merged['high'].iloc[idx]
-            if current_high > prev_high or current_high > next_high:
-                return False
-        
-        return True
-    
-    def _validate_bi(self, df_merged: pd.DataFrame, start_idx: int, end_idx: int, direction: int) -> bool:
+        合并K线的区间最高价/最低价稀疏表，每个合并序列只构建一次
         """
-        验证笔的有效性
-        
-        Args:
-            df_merged: 合并后的K线数据
-            start_idx: 开始索引
-            end_idx: 结束索引
-            direction: 笔的方向，1为向上，-1为向下
-        
-        Returns:
-            是否为有效笔
-        """
-        # 向上笔：确保期间的低点不低于起点，高点逐渐抬升
-        if direction == 1:
-            start_low = df_merged['low'].iloc[start_idx]
-            min_low = df_merged['low'].iloc[start_idx:end_idx+1].min()
-            if min_low < start_low * 0.99:  # 允许小幅回调
-                return False
-            
-            # 确保高点逐渐抬升
-            highs = df_merged['high'].iloc[start_idx:end_idx+1]
-            if highs.is_monotonic_increasing:
-                return True
-            # 允许小幅回调，但整体趋势向上
-            if highs.iloc[-1] > highs.iloc[0]:
-                return True
-        
-        # 向下笔：确保期间的高点不高于起点，低点逐渐下降
-        elif direction == -1:
-            start_high = df_merged['high'].iloc[start_idx]
-            max_high = df_merged['high'].iloc[start_idx:end_idx+1].max()
-            if max_high > start_high * 1.01:  # 允许小幅反弹
-                return False
-            
-            # 确保低点逐渐下降
-            lows = df_merged['low'].iloc[start_idx:end_idx+1]
-            if lows.is_monotonic_decreasing:
-                return True
-            # 允许小幅反弹，但整体趋势向下
-            if lows.iloc[-1] < lows.iloc[0]:
-                return True
-        
-        return False
+        if self._range_tables is None or self._range_tables[0] is not df_merged:
+            self._range_tables = (df_merged,
+                                  SparseTable(df_merged['high'].to_numpy(), 'max'),
+                                  SparseTable(df_merged['low'].to_numpy(), 'min'))
+        return self._range_tables[1], self._range_tables[2]
     
     def find_zhongshu(self, bi: List[Tuple], df_merged: pd.DataFrame) -> List[Tuple[int, int, float, float]]:
         """
-        识别中枢：连续三笔重叠区域
-        返回列表 (start_idx, end_idx, zg, zd)
+        识别中枢：三笔重叠形成，之后与 [ZD, ZG] 重叠的笔延伸中枢，
+        相邻中枢 [ZD, ZG] 重叠时合并（规则见 _scan_zhongshu / _merge_zhongshu）
+        返回列表 (start_idx, end_idx, zg, zd)；GG/DD 与所含笔的下标保存在 self.zhongshu_detail
         """
-        zhongshu = []
+        self.zhongshu_detail = []
         if len(bi) < 3:
-            return zhongshu
+            return []
         
-        # 为了方便，将笔转换为包含区间高低点的形式
-        bi_with_range = []
-        for b in bi:
-            start, end, dir_, sp, ep = b
-            # 该笔的最低点和最高点（考虑整笔K线）
-            if dir_ == 1:
-                high = max(df_merged['high'].iloc[start:end+1].max(), ep)
-                low = min(df_merged['low'].iloc[start:end+1].min(), sp)
-            else:
-                high = max(df_merged['high'].iloc[start:end+1].max(), sp)
-                low = min(df_merged['low'].iloc[start:end+1].min(), ep)
-            bi_with_range.append((start, end, high, low))
-        
-        for i in range(len(bi_with_range)-2):
-            b1, b2, b3 = bi_with_range[i:i+3]
-            # 重叠条件：三笔的最高点的最小值 > 三笔的最低点的最大值
-            high_min = min(b1[2], b2[2], b3[2])
-            low_max = max(b1[3], b2[3], b3[3])
-            if high_min > low_max:
-                # 存在重叠，构成中枢
-                zg = high_min
-                zd = low_max
-                start_idx = b1[0]
-                end_idx = b3[1]
-                zhongshu.append((start_idx, end_idx, zg, zd))
-        return zhongshu
+        # 每一笔区间内的最高/最低价（稀疏表查询）
+        high_table, low_table = self.range_tables(df_merged)
+        bi_high, bi_low = _bi_high_low(bi, high_table, low_table)
+        
+        raw = _scan_zhongshu(bi_high.tolist(), bi_low.tolist(), bi=bi, trace=self.trace)
+        merged = _merge_zhongshu(raw, bi=bi, trace=self.trace)
+        self.zhongshu_detail = [m[:6] for m in merged]
+        return [(bi[m[0]][0], bi[m[1]][1], m[2], m[3]) for m in merged]
     
     def _compute_macd(self, close: pd.Series):
         """计算MACD指标，返回DIF, DEA, MACD柱"""
@@ -368,81 +864,15 @@ class ChanQuantEngine:
         if not zhongshu:
             return pd.DataFrame()
         
-        # 获取最后一个中枢
-        last_zs = zhongshu[-1]
-        zs_start, zs_end, zg, zd = last_zs
-        
-        # 获取中枢之后的笔
-        after_bi = [b for b in bi if b[0] > zs_end]
-        if not after_bi:
-            return pd.DataFrame()
-        
-        # 准备MACD（如果需要）
         if self.use_macd:
             dif, dea, macd_bar = self._compute_macd(df_merged['close'])
+            macd_cumsum = _prefix_sum(macd_bar.to_numpy())
         else:
-            macd_bar = None
-        
-        signals = []
+            macd_cumsum = None
         
-        # 遍历之后的笔
-        for i, b in enumerate(after_bi):
-            start, end, dir_, sp, ep = b
-            
-            # 第一类买点：中枢之后第一笔为向下笔，且出现底分型，并背驰
-            if dir_ == -1 and i == 0:  # 假设第一笔向下
-                # 检查该笔终点是否为底分型（需要找到该笔结束位置附近的分型）
-                # 简化：如果该笔结束时价格是局部低点，且与前一中枢比较
-                if self.use_macd and macd_bar is not None:
-                    # 获取该笔区间内的MACD柱面积
-                    macd_slice = macd_bar.iloc[start:end+1]
-                    if len(macd_slice) > 0:
-                        area = macd_slice.sum()
-                        # 对比中枢之前最近一段向下笔的MACD面积（如果有）
-                        prev_down = [bb for bb in bi if bb[2] == -1 and bb[1] < zs_start]
-                        if prev_down:
-                            prev = prev_down[-1]
-                            prev_slice = macd_bar.iloc[prev[0]:prev[1]+1]
-                            prev_area = prev_slice.sum() if len(prev_slice)>0 else 0
-                            if area > prev_area:  # 面积减小为背驰（负数面积意味着负值更大？需注意方向）
-                                # 简单处理：价格新低但MACD柱线面积减小（负值变小）
-                                if df_merged['low'].iloc[end] < df_merged['low'].iloc[prev[1]] and area < prev_area:
-                                    signals.append((df_merged.index[end], 'buy1', ep))
-                else:
-                    # 无MACD，简单用价格新低且RSI背离等，这里仅做示例
-                    if df_merged['low'].iloc[end] == df_merged['low'].iloc[start:end+1].min():
-                        signals.append((df_merged.index[end], 'buy1', ep))
-            
-            # 第二类买点：一买之后向上笔的回调不破一买低点
-            if signals and signals[-1][1] == 'buy1':
-                buy1_idx = signals[-1][0]
-                buy1_price = signals[-1][2]
-                # 找到buy1之后的所有笔
-                after_buy1 = [bb for bb in bi if bb[0] > df_merged.index.get_loc(buy1_idx)]
-                if len(after_buy1) >= 2:
-                    up = after_buy1[0]
-                    down = after_buy1[1]
-                    if up[2] == 1 and down[2] == -1:
-                        if down[4] > buy1_price * 0.99:  # 略高于一买低点
-                            signals.append((df_merged.index[down[1]], 'buy2', down[4]))
-            
-            # 第三类买点：向上突破中枢后，回踩笔不进入中枢
-            if dir_ == 1 and ep > zg:  # 向上笔突破上轨
-                # 寻找之后的向下回踩笔
-                if i+1 < len(after_bi):
-                    next_bi = after_bi[i+1]
-                    if next_bi[2] == -1:
-                        # 回踩不进入中枢：回踩低点 > 中枢上轨
-                        if next_bi[4] > zg:
-                            signals.append((df_merged.index[next_bi[1]], 'buy3', next_bi[4]))
-        
-        # 转换为DataFrame
-        if signals:
-            df_signals = pd.DataFrame(signals, columns=['date', 'signal', 'price'])
-            df_signals.set_index('date', inplace=True)
-            return df_signals
-        else:
-            return pd.DataFrame()
+        signals = find_mmd_array(df_merged.index, df_merged['low'].to_numpy(),
+                                 bi, zhongshu, macd_cumsum)
+        return _signals_frame(signals)
     
     def run(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -462,19 +892,37 @@ class ChanQuantEngine:
         # 4. 中枢
         self.zhongshu = self.find_zhongshu(self.bi, df_merged)
         
-        # 5. 买卖点
+        # 5. 线段与高级别中枢
+        self.levels = self.find_levels(df_merged, self.bi)
+        
+        # 6. 买卖点
         self.signals = self.find_mmd(df_merged, self.bi, self.zhongshu)
         
         return self.signals
     
+    def find_levels(self, df_merged: pd.DataFrame, bi: List[Tuple],
+                    max_level: Optional[int] = None) -> List[dict]:
+        """
+        构建多级别结构（笔 -> 线段 -> 高级别线段），需先调用 find_zhongshu
+        
+        Returns:
+            各级别的 {'level', 'strokes', 'zhongshu', 'zhongshu_detail'}，第1级为笔
+        """
+        if len(bi) == 0:
+            return []
+        high_table, low_table = self.range_tables(df_merged)
+        return build_levels(bi, self.zhongshu_detail, high_table, low_table, max_level)
+    
     def get_summary(self) -> dict:
-        """获取分析摘要"""
+        """获取分析摘要（levels 为各级别的元素数与中枢数）"""
         return {
             'merged_k_count': len(self.k_merged) if self.k_merged is not None else 0,
             'fractal_count': len(self.fractals),
             'bi_count': len(self.bi),
             'zhongshu_count': len(self.zhongshu),
+            'segment_count': len(self.segments),
             'signal_count': len(self.signals),
+            'levels': _level_summary(self.levels),
         }
     
     def get_bi_list(self) -> List[dict]:
@@ -494,17 +942,411 @@ class ChanQuantEngine:
     def get_zhongshu_list(self) -> List[dict]:
         """获取中枢列表"""
         result = []
-        for zs in self.zhongshu:
+        for k, zs in enumerate(self.zhongshu):
             start, end, zg, zd = zs
-            result.append({
+            item = {
                 'start_idx': start,
                 'end_idx': end,
                 'zg': zg,  # 中枢高点
                 'zd': zd,  # 中枢低点
-            })
+            }
+            if k < len(self.zhongshu_detail):
+                first_bi, last_bi, _, _, gg, dd = self.zhongshu_detail[k]
+                item.update({'gg': gg, 'dd': dd, 'bi_count': last_bi - first_bi + 1})
+            result.append(item)
         return result
 
 
+class IncrementalChanEngine(ChanQuantEngine):
+    """
+    增量缠论引擎：逐根推入K线，结果与 ChanQuantEngine.run() 对全量数据的输出一致
+    
+    包含处理以栈的方式维护合并K线，每次推入只记录最早被改动的合并K线位置
+    （脏位置）。刷新时只重算脏位置之后的分型；成笔扫描记录每次判定依赖到的
+    最大K线位置，从第一个受影响的判定处续扫；中枢与MACD同样从受影响处续算。
+    已确认的笔不会被重复计算，单根K线的摊还代价与历史长度无关
+    （仅与尚未完成的最后一笔的长度有关）。
+    
+    用法：
+        engine = IncrementalChanEngine(bi_threshold=0.03)
+        engine.run(df_history)
+        for date, bar in new_bars.iterrows():
+            signals = engine.update(bar)
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset()
+    
+    # ---------- 延迟构建的结果属性 ----------
+    
+    @property
+    def k_merged(self) -> Optional[pd.DataFrame]:
+        if self._k_merged_cache is None and self._m_high:
+            self._k_merged_cache = pd.DataFrame(
+                {'high': self._m_high, 'low': self._m_low,
+                 'open': self._m_open, 'close': self._m_close},
+                index=pd.Index(self._m_date, name='date'),
+            )
+        return self._k_merged_cache
+    
+    @k_merged.setter
+    def k_merged(self, value):
+        self._k_merged_cache = value
+    
+    @property
+    def k_index_map(self) -> np.ndarray:
+        if not self._m_first:
+            return np.empty((0, 2), dtype=np.int64)
+        first = np.asarray(self._m_first, dtype=np.int64)
+        last = np.empty_like(first)
+        last[:-1] = first[1:] - 1
+        last[-1] = self._n_raw - 1
+        return np.column_stack([first, last])
+    
+    @property
+    def signals(self) -> pd.DataFrame:
+        if self._signals_cache is None:
+            self._signals_cache = _signals_frame(self._signal_list)
+        return self._signals_cache
+    
+    @signals.setter
+    def signals(self, value):
+        self._signals_cache = value
+    
+    @property
+    def levels(self) -> List[dict]:
+        # 多级别结构按需构建（与笔数同阶），笔变动后失效
+        if self._levels_cache is None:
+            if self.bi:
+                self._levels_cache = build_levels(self.bi, self.zhongshu_detail,
+                                                  SparseTable(self._m_high, 'max'),
+                                                  SparseTable(self._m_low, 'min'))
+            else:
+                self._levels_cache = []
+        return self._levels_cache
+    
+    @levels.setter
+    def levels(self, value):
+        self._levels_cache = value
+    
+    # ---------- 公共接口 ----------
+    
+    def reset(self):
+        """清空全部状态"""
+        # 原始K线
+        self._n_raw = 0
+        self._last_date = None
+        self._last_raw = None
+        # 合并K线栈
+        self._m_date = []
+        self._m_high = []
+        self._m_low = []
+        self._m_open = []
+        self._m_close = []
+        self._m_up = []
+        self._m_first = []
+        self._pending_first = -1
+        self._dirty = None
+        self._k_merged_cache = None
+        # 单调段起点
+        self._inc_start = []
+        self._dec_start = []
+        # 分型
+        self.fractals = []
+        self._f_idx = []
+        self._f_typ = []
+        self._f_high = []
+        self._f_low = []
+        self._f_valid = []
+        # 成笔判定 (i, j, horizon) 及其前缀最大 horizon / 前缀成笔数
+        self._decisions = []
+        self._dec_hmax = []
+        self._dec_acc = []
+        # 笔、笔区间高低点
+        self.bi = []
+        self._bi_starts = []
+        self._bi_high = []
+        self._bi_low = []
+        # 中枢：扫描结果（_scan_zhongshu）与扩张合并结果（_merge_zhongshu）
+        self._zs_raw = []
+        self._zs_merged = []
+        self.zhongshu = []
+        self.zhongshu_detail = []
+        self._levels_cache = None
+        # MACD
+        self._ema_fast = []
+        self._ema_slow = []
+        self._dea = []
+        self._macd_bar = []
+        self._macd_cum = [0.]
+        # 信号
+        self._signal_list = []
+        self._signals_cache = None
+    
+    def update(self, bar) -> pd.DataFrame:
+        """
+        推入一根新K线并刷新结果
+        
+        Args:
+            bar: 包含 high/low/open/close 的 dict 或 Series，
+                 时间取 'date' 字段，否则取 Series 的 name
+        
+        Returns:
+            当前信号DataFrame
+        """
+        date = bar['date'] if 'date' in bar else getattr(bar, 'name', None)
+        if date is None:
+            date = self._n_raw
+        self._check_order(date)
+        self._push(date, float(bar['high']), float(bar['low']), float(bar['open']), float(bar['close']))
+        self._refresh()
+        return self.signals
+    
+    def extend(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        批量推入K线（时间须晚于已推入的K线），推入完成后统一刷新一次
+        """
+        if len(df) == 0:
+            return self.signals
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        if not df.index.is_unique:
+            raise ValueError("K线时间存在重复")
+        self._check_order(df.index[0])
+        dates = list(df.index)
+        cols = [df[c].to_numpy(dtype=float).tolist() for c in ('high', 'low', 'open', 'close')]
+        for date, h, l, o, c in zip(dates, *cols):
+            self._push(date, h, l, o, c)
+        self._refresh()
+        return self.signals
+    
+    def run(self, df: pd.DataFrame) -> pd.DataFrame:
+        """从头计算（等价于 reset 后 extend）"""
+        self.reset()
+        return self.extend(df)
+    
+    def sync(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        与最新的完整K线数据同步：只推入新增的K线
+        
+        已推入部分的根数或最后一根K线的OHLC与 df 不一致时（如复权调整、
+        盘中最后一根K线变动），回退为全量重算。
+        """
+        if self._n_raw == 0 or len(df) == 0:
+            return self.run(df)
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        pos = df.index.searchsorted(self._last_date, side='right')
+        if pos != self._n_raw or df.index[pos - 1] != self._last_date:
+            return self.run(df)
+        row = df.iloc[pos - 1]
+        if tuple(float(row[c]) for c in ('high', 'low', 'open', 'close')) != self._last_raw:
+            return self.run(df)
+        return self.extend(df.iloc[pos:])
+    
+    def get_summary(self) -> dict:
+        """获取分析摘要"""
+        return {
+            'merged_k_count': len(self._m_high),
+            'fractal_count': len(self.fractals),
+            'bi_count': len(self.bi),
+            'zhongshu_count': len(self.zhongshu),
+            'segment_count': len(self.segments),
+            'signal_count': len(self._signal_list),
+            'levels': _level_summary(self.levels),
+        }
+    
+    # ---------- 内部实现 ----------
+    
+    def _check_order(self, date):
+        if self._last_date is not None and not date > self._last_date:
+            raise ValueError(f"K线时间必须递增: {date} <= {self._last_date}")
+    
+    def _mark_dirty(self, pos: int):
+        if self._dirty is None or pos < self._dirty:
+            self._dirty = pos
+    
+    def _push(self, date, h: float, l: float, o: float, c: float):
+        """包含处理：与 merge_k_lines_array 的栈操作逐步一致"""
+        i = self._n_raw
+        self._n_raw += 1
+        self._last_date = date
+        self._last_raw = (h, l, o, c)
+        up = c >= o
+        mh, ml = self._m_high, self._m_low
+        while True:
+            if not mh or not ((h <= mh[-1] and l >= ml[-1]) or (h >= mh[-1] and l <= ml[-1])):
+                # 无包含关系（或栈为空）：作为新的合并K线入栈
+                self._mark_dirty(len(mh))
+                self._m_date.append(date)
+                mh.append(h)
+                ml.append(l)
+                self._m_open.append(o)
+                self._m_close.append(c)
+                self._m_up.append(up)
+                self._m_first.append(self._pending_first if self._pending_first >= 0 else i)
+                self._pending_first = -1
+                return
+            if h <= mh[-1] and l >= ml[-1]:
+                # 当前被前一根包含：按前一根阴阳方向合并
+                self._mark_dirty(len(mh) - 1)
+                if self._m_up[-1]:
+                    mh[-1] = max(mh[-1], h)
+                    ml[-1] = max(ml[-1], l)
+                else:
+                    mh[-1] = min(mh[-1], h)
+                    ml[-1] = min(ml[-1], l)
+                return
+            # 当前包含前一根：移除前一根后继续比较
+            self._m_date.pop()
+            mh.pop()
+            ml.pop()
+            self._m_open.pop()
+            self._m_close.pop()
+            self._m_up.pop()
+            self._pending_first = self._m_first.pop()
+            self._mark_dirty(len(mh))
+    
+    def _refresh(self):
+        """从脏位置开始续算分型、笔、中枢、MACD与信号"""
+        d = self._dirty
+        if d is None:
+            return
+        self._dirty = None
+        self._k_merged_cache = None
+        self._levels_cache = None
+        h, l = self._m_high, self._m_low
+        m = len(h)
+        
+        # 单调段起点
+        for arr, values, increasing in ((self._inc_start, h, True), (self._dec_start, l, False)):
+            del arr[d:]
+            for p in range(d, m):
+                if p > 0 and (values[p] >= values[p - 1] if increasing else values[p] <= values[p - 1]):
+                    arr.append(arr[p - 1])
+                else:
+                    arr.append(p)
+        
+        # 分型：位置 p 的分型依赖 p-1..p+1，从 d-1 开始重算
+        lo = max(d - 1, 1)
+        cut = bisect_left(self._f_idx, lo)
+        for arr in (self.fractals, self._f_idx, self._f_typ, self._f_high, self._f_low, self._f_valid):
+            del arr[cut:]
+        if m - lo >= 2:
+            hs = np.asarray(h[lo - 1:], dtype=float)
+            ls = np.asarray(l[lo - 1:], dtype=float)
+            idx, is_top = find_fractals_array(hs, ls)
+            valid = _fractal_validity(hs, ls, idx, is_top, hs[idx], ls[idx])
+            for k, t, v in zip((idx + lo - 1).tolist(), is_top.tolist(), valid.tolist()):
+                typ = 'top' if t else 'bottom'
+                self.fractals.append((k, typ, h[k], l[k]))
+                self._f_idx.append(k)
+                self._f_typ.append(typ)
+                self._f_high.append(h[k])
+                self._f_low.append(l[k])
+                self._f_valid.append(v)
+        
+        # 笔：丢弃依赖脏位置之后数据的判定，从该处续扫
+        kd = bisect_left(self._dec_hmax, d)
+        nb = self._dec_acc[kd - 1] if kd else 0
+        if kd:
+            i, j, _ = self._decisions[kd - 1]
+            start = j if j >= 0 else i + 1
+        else:
+            start = 0
+        del self._decisions[kd:], self._dec_hmax[kd:], self._dec_acc[kd:]
+        del self.bi[nb:], self._bi_starts[nb:], self._bi_high[nb:], self._bi_low[nb:]
+        decisions = []
+        pairs = _scan_bi(h, l, self._inc_start, self._dec_start, self._f_idx, self._f_typ,
+                         self._f_high, self._f_low, self._f_valid, self.bi_threshold,
+                         start=start, decisions=decisions)
+        if self.trace is not None:
+            self.trace.record_bi(decisions, self.fractals)
+        hmax = self._dec_hmax[-1] if self._dec_hmax else -1
+        acc = nb
+        for dec in decisions:
+            hmax = max(hmax, dec[2])
+            acc += dec[1] >= 0
+            self._decisions.append(dec)
+            self._dec_hmax.append(hmax)
+            self._dec_acc.append(acc)
+        for i, j in pairs:
+            cur = self.fractals[i]
+            nxt = self.fractals[j]
+            # 新笔的区间高低点：已确认的笔不会重算，切片总长度与K线数同阶
+            if cur[1] == 'bottom':
+                b = (cur[0], nxt[0], 1, cur[3], nxt[2])
+                self._bi_high.append(max(max(h[b[0]:b[1] + 1]), b[4]))
+                self._bi_low.append(min(min(l[b[0]:b[1] + 1]), b[3]))
+            else:
+                b = (cur[0], nxt[0], -1, cur[2], nxt[3])
+                self._bi_high.append(max(max(h[b[0]:b[1] + 1]), b[3]))
+                self._bi_low.append(min(min(l[b[0]:b[1] + 1]), b[4]))
+            self.bi.append(b)
+            self._bi_starts.append(b[0])
+        
+        # 中枢：丢弃依赖变动笔的中枢，从最后一个保留中枢的离开笔续扫
+        raw = self._zs_raw
+        while raw and raw[-1][6] >= nb:
+            raw.pop()
+        restart = raw[-1][6] if raw else 0
+        merged = self._zs_merged
+        while merged and merged[-1][6] >= len(raw):
+            merged.pop()
+        fold_from = len(raw)
+        if merged and merged[-1][7] >= len(raw):
+            fold_from = merged.pop()[6]
+        base = max(len(merged) - 1, 0)
+        raw.extend(_scan_zhongshu(self._bi_high, self._bi_low, restart, bi=self.bi, trace=self.trace))
+        _merge_zhongshu(raw, merged, raw_start=fold_from, bi=self.bi, trace=self.trace)
+        del self.zhongshu[base:], self.zhongshu_detail[base:]
+        for m in merged[base:]:
+            self.zhongshu.append((self.bi[m[0]][0], self.bi[m[1]][1], m[2], m[3]))
+            self.zhongshu_detail.append(m[:6])
+        
+        # MACD：与 pandas ewm(adjust=False) 相同的递推
+        if self.use_macd:
+            self._update_macd(d)
+        
+        signals = find_mmd_array(self._m_date, l, self.bi, self.zhongshu,
+                                 self._macd_cum if self.use_macd else None,
+                                 bi_starts=self._bi_starts)
+        if signals != self._signal_list:
+            self._signal_list = signals
+            self._signals_cache = None
+    
+    def _update_macd(self, d: int):
+        close = self._m_close
+        for arr in (self._ema_fast, self._ema_slow, self._dea, self._macd_bar):
+            del arr[d:]
+        del self._macd_cum[d + 1:]
+        
+        def factors(span):
+            alpha = 1. / (1. + (span - 1) / 2.)
+            return 1. - alpha, alpha
+        
+        of, af = factors(self.macd_fast)
+        os_, as_ = factors(self.macd_slow)
+        og, ag = factors(self.macd_signal)
+        for p in range(d, len(close)):
+            c = close[p]
+            if p == 0:
+                ef = es = c
+                dif = ef - es
+                dea = dif
+            else:
+                ef = (of * self._ema_fast[-1] + af * c) / (of + af)
+                es = (os_ * self._ema_slow[-1] + as_ * c) / (os_ + as_)
+                dif = ef - es
+                dea = (og * self._dea[-1] + ag * dif) / (og + ag)
+            self._ema_fast.append(ef)
+            self._ema_slow.append(es)
+            self._dea.append(dea)
+            self._macd_bar.append((dif - dea) * 2)
+            self._macd_cum.append(self._macd_cum[-1] + self._macd_bar[-1])
+
+
 # ================= 便捷函数 =================
 
 def analyze_stock(df: pd.DataFrame, **kwargs) -> dict:
@@ -530,6 +1372,141 @@ def analyze_stock(df: pd.DataFrame, **kwargs) -> dict:
     }
 
 
+# ================= 批量分析 =================
+
+_OHLC_COLUMNS = ['high', 'low', 'open', 'close']
+
+# 工作进程中挂载的共享内存与 (4, 总K线数) 视图
+_worker_shm = None
+_worker_ohlc = None
+
+
+def _attach_ohlc(name: str, total: int):
+    """工作进程初始化：按名称挂载共享内存中的OHLC数组"""
+    global _worker_shm, _worker_ohlc
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    _worker_ohlc = np.ndarray((4, total), dtype=np.float64, buffer=_worker_shm.buf)
+
+
+def _analyze_slices(tasks: List[Tuple[str, int, int]], engine_kwargs: dict,
+                    ohlc: Optional[np.ndarray] = None) -> List[dict]:
+    """
+    分析一批股票，每只股票对应 OHLC 数组中的 [offset, offset+length) 区间
+    
+    信号时间以K线位置返回，由主进程映射回原始索引
+    """
+    if ohlc is None:
+        ohlc = _worker_ohlc
+    results = []
+    for symbol, offset, length in tasks:
+        t0 = time.perf_counter()
+        row = {'symbol': symbol, 'bars': length}
+        try:
+            block = ohlc[:, offset:offset + length]
+            df = pd.DataFrame({c: block[k] for k, c in enumerate(_OHLC_COLUMNS)})
+            engine = ChanQuantEngine(**engine_kwargs)
+            signals = engine.run(df)
+            summary = engine.get_summary()
+            row['level_count'] = len(summary.pop('levels'))
+            row.update(summary)
+            row['signals'] = [(int(pos), sig, float(price))
+                              for pos, sig, price in zip(signals.index, signals['signal'], signals['price'])] \
+                if len(signals) > 0 else []
+            row['error'] = None
+        except Exception as e:
+            row['signals'] = []
+            row['error'] = str(e)
+        row['elapsed'] = time.perf_counter() - t0
+        results.append(row)
+    return results
+
+
+def analyze_universe(klines: Dict[str, pd.DataFrame], workers: Optional[int] = None,
+                     chunksize: Optional[int] = None, **kwargs) -> pd.DataFrame:
+    """
+    批量分析多只股票：多进程并行运行 ChanQuantEngine
+    
+    所有股票的OHLC拼接为一块 float64 共享内存，工作进程按名称挂载后
+    按 (offset, length) 切片计算，不需要逐个序列化DataFrame。
+    
+    Args:
+        klines: {symbol: K线DataFrame}，必须包含 open, high, low, close 列，索引为日期
+        workers: 进程数，默认CPU核数；<=1 时在当前进程中串行计算
+        chunksize: 每个任务包含的股票数，默认按进程数自动划分
+        **kwargs: ChanQuantEngine的参数
+    
+    Returns:
+        DataFrame: 每只股票一行，包含 bars、merged_k_count、fractal_count、bi_count、
+        zhongshu_count、segment_count、level_count、signal_count、last_signal、last_signal_date、last_signal_price、
+        signals（[(date, signal, price)]）、elapsed（秒）、error；
+        attrs['wall_time'] 为总耗时
+    """
+    t_start = time.perf_counter()
+    indexes = {}
+    arrays = {}
+    errors = {}
+    tasks = []
+    offset = 0
+    for symbol, df in klines.items():
+        length = 0
+        if df is not None and len(df) > 0:
+            try:
+                # 与引擎内部一致按时间排序，信号位置才能映射回原始索引
+                df = df.sort_index(kind='stable')
+                arrays[symbol] = [df[c].to_numpy(dtype=np.float64) for c in _OHLC_COLUMNS]
+                indexes[symbol] = df.index
+                length = len(df)
+            except Exception as e:
+                errors[symbol] = str(e)
+        tasks.append((symbol, offset, length))
+        offset += length
+    total = offset
+    
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks) or 1))
+    
+    shm = shared_memory.SharedMemory(create=True, size=max(total, 1) * 4 * 8)
+    try:
+        ohlc = np.ndarray((4, total), dtype=np.float64, buffer=shm.buf)
+        for symbol, start, length in tasks:
+            if length:
+                ohlc[:, start:start + length] = arrays[symbol]
+        arrays.clear()
+        
+        if workers <= 1:
+            rows = _analyze_slices(tasks, kwargs, ohlc)
+        else:
+            if chunksize is None:
+                chunksize = max(1, len(tasks) // (workers * 8))
+            chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+            rows = []
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_ohlc,
+                                     initargs=(shm.name, total)) as pool:
+                for part in pool.map(_analyze_slices, chunks, [kwargs] * len(chunks)):
+                    rows.extend(part)
+        del ohlc
+    finally:
+        shm.close()
+        shm.unlink()
+    
+    # 信号位置映射回原始时间索引
+    for row in rows:
+        if row['symbol'] in errors:
+            row['error'] = errors[row['symbol']]
+        index = indexes.get(row['symbol'])
+        row['signals'] = [(index[pos], sig, price) for pos, sig, price in row['signals']]
+        last = row['signals'][-1] if row['signals'] else (None, None, np.nan)
+        row['last_signal_date'], row['last_signal'], row['last_signal_price'] = last
+    
+    columns = ['symbol', 'bars', 'merged_k_count', 'fractal_count', 'bi_count', 'zhongshu_count',
+               'segment_count', 'level_count', 'signal_count', 'last_signal', 'last_signal_date', 'last_signal_price',
+               'signals', 'elapsed', 'error']
+    result = pd.DataFrame(rows).reindex(columns=columns)
+    result.attrs['wall_time'] = time.perf_counter() - t_start
+    return result
+
+
 # ================= 测试代码 =================
 if __name__ == '__main__':
     # 模拟数据测试
@@ -568,7 +1545,10 @@ if __name__ == '__main__':
     print(f"分型数量: {summary['fractal_count']}")
     print(f"笔数量: {summary['bi_count']}")
     print(f"中枢数量: {summary['zhongshu_count']}")
+    print(f"线段数量: {summary['segment_count']}")
     print(f"信号数量: {summary['signal_count']}")
+    for lv in summary['levels']:
+        print(f"  级别{lv['level']}: 笔/线段 {lv['stroke_count']}，中枢 {lv['zhongshu_count']}")
     
     if len(signals) > 0:
         print("\n买卖点信号:")
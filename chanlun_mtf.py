@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多级别缠论联立（区间套）
+由一条基础K线（分钟线或日线）在本地重采样出 30分钟/60分钟/日线/周线，
+逐级别运行缠论引擎，并把高级别买卖点与其区间内的低级别买卖点对齐
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+from chanlun_engine import ChanQuantEngine
+
+
+# 支持的级别：名称 -> (级别序号, 时间跨度)，序号越大级别越高
+LEVELS = {
+    '30min': (0, pd.Timedelta(minutes=30)),
+    '60min': (1, pd.Timedelta(minutes=60)),
+    'D': (2, pd.Timedelta(days=1)),
+    'W': (3, pd.Timedelta(days=7)),
+}
+
+LEVEL_NAMES = {'30min': '30分钟', '60min': '60分钟', 'D': '日线', 'W': '周线'}
+
+# A股交易时段（分钟）：上午 9:30-11:30，下午 13:00-15:00
+_AM_OPEN = 9 * 60 + 30
+_AM_CLOSE = 11 * 60 + 30
+_PM_OPEN = 13 * 60
+
+_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+        'volume': 'sum', 'amount': 'sum'}
+
+
+def _base_span(index: pd.DatetimeIndex) -> pd.Timedelta:
+    """基础K线的周期（相邻K线时间差的最小正值；日内数据按分钟计）"""
+    if len(index) < 2:
+        return pd.Timedelta(days=1)
+    diffs = np.diff(index.as_unit('ns').asi8)
+    diffs = diffs[diffs > 0]
+    if len(diffs) == 0:
+        return pd.Timedelta(days=1)
+    return pd.Timedelta(int(diffs.min()), unit='ns')
+
+
+def _group_keys(index: pd.DatetimeIndex, freq: str) -> np.ndarray:
+    """每根基础K线所属的目标周期分组键（int64，随时间递增）"""
+    day = index.as_unit('ns').normalize().asi8
+    if freq in ('30min', '60min'):
+        step = 30 if freq == '30min' else 60
+        minutes = np.asarray(index.hour * 60 + index.minute)
+        # 交易分钟序号：上午 (9:30, 11:30] -> (0, 120]，下午 (13:00, 15:00] -> (120, 240]
+        session = np.where(minutes <= _AM_CLOSE, minutes - _AM_OPEN, minutes - _PM_OPEN + 120)
+        bucket = np.maximum(np.ceil(session / step), 1).astype(np.int64)
+        return day + bucket
+    if freq == 'D':
+        return day
+    if freq == 'W':
+        # 1970-01-01 为周四，偏移3天后按7天取整即为周一开始的自然周
+        return (day // 86_400_000_000_000 + 3) // 7
+    raise ValueError(f"不支持的级别: {freq}")
+
+
+def resample_kline(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """
+    将K线重采样到更高级别
+
+    日内级别按A股交易时段切分（60分钟线为 10:30/11:30/14:00/15:00），
+    周线按自然周；每根新K线以其最后一根基础K线的时间为索引。
+
+    Args:
+        df: 基础K线，包含 open, high, low, close（可选 volume, amount），索引为时间
+        freq: '30min' / '60min' / 'D' / 'W'
+
+    Returns:
+        DataFrame: 重采样后的K线
+    """
+    if freq not in LEVELS:
+        raise ValueError(f"不支持的级别: {freq}")
+    if len(df) == 0:
+        return df.copy()
+
+    df = df.sort_index()
+    index = pd.DatetimeIndex(df.index)
+    keys = _group_keys(index, freq)
+
+    columns = [c for c in _AGG if c in df.columns]
+    grouped = df[columns].groupby(keys, sort=True)
+    out = grouped.agg({c: _AGG[c] for c in columns})
+    out.index = pd.DatetimeIndex(pd.Series(index, index=df.index).groupby(keys, sort=True).last().to_numpy())
+    return out
+
+
+def build_timeframes(base: pd.DataFrame, freqs: Tuple[str, ...] = ('30min', '60min', 'D', 'W')) -> Dict[str, pd.DataFrame]:
+    """
+    由基础K线生成各级别K线，跳过比基础周期更细的级别
+
+    Returns:
+        {freq: K线DataFrame}，按级别从低到高排列
+    """
+    base = base.sort_index().rename_axis(None)
+    span = _base_span(pd.DatetimeIndex(base.index))
+    result = {}
+    for freq in sorted(freqs, key=lambda f: LEVELS[f][0]):
+        target = LEVELS[freq][1]
+        if target < span:
+            continue
+        result[freq] = base if target == span else resample_kline(base, freq)
+    return result
+
+
+def _signal_windows(engine: ChanQuantEngine) -> List[Tuple]:
+    """
+    每个信号对应的区间：从信号所在笔的起点K线到信号K线
+
+    Returns:
+        [(date, signal, price, window_start)]
+    """
+    signals = engine.signals
+    if len(signals) == 0:
+        return []
+    dates = engine.k_merged.index
+    bi_start_by_end = {dates[b[1]]: dates[b[0]] for b in engine.bi}
+    return [(date, sig, price, bi_start_by_end.get(date, date))
+            for date, sig, price in zip(signals.index, signals['signal'], signals['price'])]
+
+
+def analyze_multi_timeframe(base: pd.DataFrame,
+                            freqs: Tuple[str, ...] = ('30min', '60min', 'D', 'W'),
+                            **kwargs) -> Dict:
+    """
+    多级别缠论分析与区间套对齐
+
+    高级别信号的区间取其所在笔的起点K线到信号K线（高级别K线以周期末时间为索引，
+    区间起点取该K线所覆盖的第一根基础K线），落在区间内的低级别同向信号
+    （buy/sell）视为低级别确认。
+
+    Args:
+        base: 基础K线（分钟线或日线），包含 open, high, low, close
+        freqs: 需要分析的级别
+        **kwargs: ChanQuantEngine的参数
+
+    Returns:
+        dict:
+            levels: {freq: {'name', 'kline', 'signals', 'summary', 'engine'}}
+            nesting: 区间套视图 DataFrame，每个信号一行，列为 level, date, signal, price,
+                     window_start, window_end, lower_signals（[(level, date, signal, price)]），
+                     confirmed（最低级别为 None）
+    """
+    frames = build_timeframes(base, freqs)
+    levels = {}
+    windows = {}
+    for freq, kline in frames.items():
+        engine = ChanQuantEngine(**kwargs)
+        signals = engine.run(kline)
+        levels[freq] = {
+            'name': LEVEL_NAMES[freq],
+            'kline': kline,
+            'signals': signals,
+            'summary': engine.get_summary(),
+            'engine': engine,
+        }
+        windows[freq] = _signal_windows(engine)
+
+    ordered = list(frames)    # 从低到高
+    rows = []
+    for pos, freq in enumerate(ordered):
+        kline_index = frames[freq].index
+        for date, sig, price, bi_start in windows[freq]:
+            # 区间起点：笔起点K线所覆盖的第一根基础K线之后
+            k = kline_index.get_loc(bi_start)
+            window_start = kline_index[k - 1] if k > 0 else kline_index[0] - LEVELS[freq][1]
+            lower = []
+            for lower_freq in ordered[:pos]:
+                for l_date, l_sig, l_price, _ in windows[lower_freq]:
+                    if window_start < l_date <= date and l_sig[:3] == sig[:3]:
+                        lower.append((lower_freq, l_date, l_sig, l_price))
+            rows.append({
+                'level': freq,
+                'date': date,
+                'signal': sig,
+                'price': price,
+                'window_start': window_start,
+                'window_end': date,
+                'lower_signals': lower,
+                'confirmed': bool(lower) if pos > 0 else None,
+            })
+
+    columns = ['level', 'date', 'signal', 'price', 'window_start', 'window_end', 'lower_signals', 'confirmed']
+    nesting = pd.DataFrame(rows, columns=columns)
+    if len(nesting) > 0:
+        nesting['rank'] = nesting['level'].map(lambda f: -LEVELS[f][0])
+        nesting = nesting.sort_values(['rank', 'date'], kind='stable').drop(columns='rank').reset_index(drop=True)
+    return {'levels': levels, 'nesting': nesting}
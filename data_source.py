@@ -153,7 +153,8 @@ class EastMoneyData:
             symbol: 股票代码，如 '000001'（深市）或 '600000'（沪市）
             start_date: 开始日期 'YYYYMMDD'
             end_date: 结束日期 'YYYYMMDD'
-            period: K线周期 '101'=日线 '102'=周 '103'=月
+            period: K线周期 '101'=日线 '102'=周 '103'=月，
+                    分钟线 '1'/'5'/'15'/'30'/'60'（多级别分析可只取一条分钟线在本地重采样，见 chanlun_mtf）
         
         Returns:
             DataFrame: K线数据
@@ -5,9 +5,337 @@
 根据解析出的评分公式计算股票评分
 """
 
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
 import pandas as pd
 import numpy as np
-from typing import Dict, List
+
+from logger import warning
+
+
+# 各部分在评分中的累加顺序（扣分项最后扣除）
+SECTIONS = ('trend_strength', 'momentum_confirmation', 'volume_price_coordination',
+            'risk_control', 'market_environment')
+
+# 条件关键词 -> 规则键，按顺序取第一个出现在条件中的关键词（条件字符串只在编译公式时匹配）
+RULE_PATTERNS = {
+    'trend_strength': [
+        ('MA5 > MA20', 'ma5_gt_ma20'),
+        ('MA10 > MA30', 'ma10_gt_ma30'),
+        ('均线多头排列', 'ma_bull'),
+        ('近期5日涨幅 > 3%', 'chg5_gt_3'),
+    ],
+    'momentum_confirmation': [
+        ('MACD金叉', 'macd_cross'),
+        ('KDJ', 'kdj_golden'),
+        ('布林带', 'boll_mid'),
+    ],
+    'volume_price_coordination': [
+        ('成交量 > 20日均量1.3倍', 'volume_surge'),
+        ('量比', 'volume_ratio'),
+    ],
+    'risk_control': [
+        ('波动率', 'low_volatility'),
+        ('价格处于20日均线上方', 'above_ma20'),
+        ('RSI', 'rsi_neutral'),
+    ],
+    'penalty_items': [
+        ('长上影线', 'upper_shadow'),
+        ('行业指数', 'industry_index'),
+        ('大宗交易', 'block_trade'),
+        ('涨幅>5%但波动率同步放大', 'surge_volatile'),
+        ('价涨量缩', 'price_up_volume_down'),
+        ('RSI', 'rsi_extreme'),
+    ],
+}
+
+_KLINE_COLUMNS = ('开盘', '最高', '最低', '收盘', '成交量')
+
+
+def _window_rows(values: np.ndarray, n: int) -> np.ndarray:
+    """长度为 n 的滑动窗口矩阵（连续内存），第 r 行为 values[r:r+n]"""
+    return np.array(np.lib.stride_tricks.sliding_window_view(values, n))
+
+
+def _nanmean_rows(rows: np.ndarray) -> np.ndarray:
+    """逐行均值，与 Series.mean() 的求和方式一致（NaN 置 0 求和并从计数中剔除）"""
+    mask = np.isnan(rows)
+    count = rows.shape[1] - mask.sum(axis=1)
+    total = np.where(mask, 0.0, rows).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _nanstd_rows(rows: np.ndarray) -> np.ndarray:
+    """逐行样本标准差，与 Series.std() 的两遍算法一致"""
+    mask = np.isnan(rows)
+    count = (rows.shape[1] - mask.sum(axis=1)).astype(np.float64)
+    count[count <= 1] = np.nan
+    values = np.where(mask, 0.0, rows)
+    avg = values.sum(axis=1) / count
+    sqr = (avg[:, None] - values) ** 2
+    sqr[mask] = 0.0
+    return np.sqrt(sqr.sum(axis=1) / (count - 1))
+
+
+def _selected_mean_rows(rows: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """逐行对选中元素求均值，等价于 s[s > 0].mean() 这类布尔筛选后的均值"""
+    count = keep.sum(axis=1)
+    out = np.full(len(rows), np.nan)
+    packed = np.take_along_axis(rows, np.argsort(~keep, axis=1, kind='stable'), axis=1)
+    for k in np.unique(count[count > 0]):
+        sel = count == k
+        out[sel] = packed[sel, :k].sum(axis=1) / k
+    return out
+
+
+def _ewm_rows(rows: np.ndarray, com: float) -> np.ndarray:
+    """
+    逐行指数加权均值，复现 ewm(com=com, adjust=False).mean() 的递推
+
+    Args:
+        rows: 二维数组，每行独立从第一列开始递推
+        com: 质心参数（span 对应 (span-1)/2，alpha 对应 (1-alpha)/alpha）
+
+    Returns:
+        np.ndarray: 与 rows 同形状的加权均值
+    """
+    alpha = 1.0 / (1.0 + com)
+    old_wt_factor = 1.0 - alpha
+    out = np.empty_like(rows)
+    weighted = rows[:, 0].copy()
+    old_wt = np.ones(len(rows))
+    out[:, 0] = weighted
+    for j in range(1, rows.shape[1]):
+        cur = rows[:, j]
+        is_obs = cur == cur
+        has_value = weighted == weighted
+        old_wt = np.where(has_value, old_wt * old_wt_factor, old_wt)
+        blended = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(has_value & is_obs & (weighted != cur), blended, weighted)
+        weighted = np.where(~has_value & is_obs, cur, weighted)
+        old_wt = np.where(has_value & is_obs, 1.0, old_wt)
+        out[:, j] = weighted
+    return out
+
+
+# 规则键 -> (特征, 比较符, 阈值)；None 表示可识别但不参与计算（恒不触发）
+RULE_SPECS = {
+    'ma5_gt_ma20': ('ma5_ma20_spread', '>', 0),
+    'ma10_gt_ma30': ('ma10_ma30_spread', '>', 0),
+    'ma_bull': ('ma_bull_spread', '>', 0),
+    'chg5_gt_3': ('change_5d_pct', '>', 3),
+    'macd_cross': ('macd_expansion', '>', 0),
+    'kdj_golden': ('kdj_k_above_d', 'between', (20, 80)),
+    'boll_mid': ('close_ma20_spread', '>', 0),
+    'volume_surge': ('volume_surge_spread', '>', 0),
+    'volume_ratio': ('volume_ratio_5', '>', 1.2),
+    'low_volatility': ('volatility_spread', '<', 0),
+    'above_ma20': ('ma20_deviation_pct', '<', 8),
+    'rsi_neutral': ('rsi_14', 'between', (40, 60)),
+    'upper_shadow': ('upper_shadow_pct', '>', 2),
+    'industry_index': None,
+    'block_trade': None,
+    'surge_volatile': ('surge_volatility_spread', '>', 0),
+    'price_up_volume_down': ('volume_change_on_up', '<', 0),
+    'rsi_extreme': ('rsi_14', 'outside', (30, 70)),
+}
+
+# 比较符 -> 向量化比较；NaN 与任何阈值比较均不成立
+COMPARATORS = {
+    '>': lambda x, t: x > t,
+    '<': lambda x, t: x < t,
+    '==': lambda x, t: x == t,
+    '>=': lambda x, t: x >= t,
+    'between': lambda x, t: (x > t[0]) & (x < t[1]),
+    'outside': lambda x, t: (x > t[1]) | (x < t[0]),
+}
+
+PLAN_CACHE_SIZE = 128
+
+
+class PlanEntry(NamedTuple):
+    """评分计划中的一项：特征满足比较条件时加上权重（扣分项权重为负），并置位 bits"""
+    feature: str
+    comparator: str
+    threshold: object
+    weight: float
+    section: str
+    bits: int
+
+
+class ScorePlan:
+    """
+    编译后的评分计划
+
+    由 compile_formula 生成：条件字符串只在编译时匹配一次，评估时对特征矩阵逐项比较
+    得到命中矩阵，再与权重向量做矩阵乘得到评分。
+    """
+
+    def __init__(self, formula_hash: str, rules: List[Dict], entries: List[PlanEntry], unrecognized: List[Dict]):
+        self.formula_hash = formula_hash
+        self.rules = rules
+        self.entries = entries
+        self.unrecognized = unrecognized
+        self.features = list(dict.fromkeys(entry.feature for entry in entries))
+        self.weights = np.array([entry.weight for entry in entries], dtype=np.float64)
+        self.bits = np.array([entry.bits for entry in entries], dtype=np.uint64)
+
+    def hits(self, features: Dict[str, np.ndarray], size: int) -> np.ndarray:
+        """
+        逐项比较特征与阈值
+
+        Args:
+            features: 特征 -> 数组，需包含 self.features 中的全部特征
+            size: 样本数
+
+        Returns:
+            np.ndarray: (size, len(entries)) 的布尔命中矩阵
+        """
+        matrix = np.column_stack([features[name] for name in self.features]) if self.features else np.empty((size, 0))
+        column = {name: i for i, name in enumerate(self.features)}
+        hits = np.zeros((size, len(self.entries)), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for j, entry in enumerate(self.entries):
+                hits[:, j] = COMPARATORS[entry.comparator](matrix[:, column[entry.feature]], entry.threshold)
+        return hits
+
+    def evaluate(self, features: Dict[str, np.ndarray], size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        按计划评分
+
+        Args:
+            features: 特征 -> 数组，需包含 self.features 中的全部特征
+            size: 样本数
+
+        Returns:
+            (score, triggered): 限制在 0-100 的评分与触发规则位掩码
+        """
+        hits = self.hits(features, size)
+        score = hits.astype(np.float64) @ self.weights
+        triggered = np.bitwise_or.reduce(np.where(hits, self.bits, np.uint64(0)), axis=1)
+        return np.maximum(0, np.minimum(100, score)), triggered
+
+
+_plan_cache: "OrderedDict[str, ScorePlan]" = OrderedDict()
+
+
+def formula_hash(formula_info: Dict) -> str:
+    """评分公式的内容哈希（与字典键顺序无关）"""
+    text = json.dumps(formula_info, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def _flatten_rules(formula_info: Dict) -> List[Dict]:
+    """按评分顺序展开公式中的全部规则，并按 RULE_PATTERNS 的关键词确定规则键"""
+    rules = []
+    for section in SECTIONS + ('penalty_items',):
+        if section == 'penalty_items':
+            items = formula_info.get('penalty_items', [])
+        else:
+            items = formula_info.get(section, {}).get('items', [])
+        for item in items:
+            condition = item.get('condition', '')
+            if section == 'market_environment':
+                cond_lower = str(condition).lower()
+                if '其他' in condition:
+                    key = 'market_fallback'
+                elif '上涨' in condition or '涨幅' in condition or 'up' in cond_lower:
+                    key = 'market_up'
+                else:
+                    key = 'market_other'
+            else:
+                key = next((k for pattern, k in RULE_PATTERNS[section] if pattern in condition), None)
+            rule = {'bit': len(rules), 'section': section, 'condition': condition, 'key': key}
+            if section == 'penalty_items':
+                rule['penalty'] = item.get('penalty', 0)
+            else:
+                rule['score'] = item.get('score', 0)
+            rules.append(rule)
+    return rules
+
+
+def _compile_market(rules: List[Dict]) -> List[PlanEntry]:
+    """
+    市场环境部分取最大值并带兜底分，编译为基于 market_up 特征（1/0，窗口不足为 NaN）的两项：
+    上涨时取上涨类规则的最高分，否则取“其他”类规则的最高分
+    """
+    up_rules = [r for r in rules if r['key'] == 'market_up']
+    up_weight = 0
+    for rule in up_rules:
+        up_weight = max(up_weight, rule['score'])
+    fallback = 0
+    for rule in rules:
+        if rule['key'] == 'market_fallback':
+            fallback = max(fallback, rule['score'])
+
+    def other_bits(score):
+        return sum(1 << r['bit'] for r in rules if r['key'] == 'market_fallback' and r['score'] == score)
+
+    entries = []
+    if up_rules:
+        chosen = up_rules[-1]
+        bits = sum(1 << r['bit'] for r in rules
+                   if r['condition'] == chosen['condition'] and r['score'] == chosen['score'])
+        if up_weight > 0:
+            bits |= other_bits(up_weight)
+        entries.append(PlanEntry('market_up', '==', 1, up_weight, 'market_environment', bits))
+    fallback_bits = other_bits(fallback)
+    if fallback or fallback_bits:
+        comparator = '==' if up_weight > 0 else '>='
+        entries.append(PlanEntry('market_up', comparator, 0, fallback, 'market_environment', fallback_bits))
+    return entries
+
+
+def compile_formula(formula_info: Dict) -> ScorePlan:
+    """
+    将解析后的评分公式编译为评分计划，按公式哈希缓存
+
+    未识别的条件在编译时记录到 plan.unrecognized 并输出一次警告，评估时不再逐条匹配。
+
+    Args:
+        formula_info: ScoreFormulaParser.parse_deepseek_result 的输出
+
+    Returns:
+        ScorePlan: 评分计划
+    """
+    key = formula_hash(formula_info)
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        _plan_cache.move_to_end(key)
+        return plan
+
+    rules = _flatten_rules(formula_info)
+    entries = []
+    unrecognized = []
+    market_rules = [r for r in rules if r['section'] == 'market_environment']
+    for rule in rules:
+        if rule['section'] == 'market_environment':
+            if rule is market_rules[0]:
+                entries.extend(_compile_market(market_rules))
+            continue
+        if rule['key'] is None:
+            unrecognized.append(rule)
+            continue
+        spec = RULE_SPECS[rule['key']]
+        if spec is None:
+            continue
+        weight = -rule['penalty'] if rule['section'] == 'penalty_items' else rule['score']
+        entries.append(PlanEntry(*spec, weight, rule['section'], 1 << rule['bit']))
+
+    if unrecognized:
+        warning(f"评分公式 {key[:8]} 有 {len(unrecognized)} 条未识别的规则: "
+                + '; '.join(f"{r['section']} | {r['condition']}" for r in unrecognized))
+
+    plan = ScorePlan(key, rules, entries, unrecognized)
+    _plan_cache[key] = plan
+    if len(_plan_cache) > PLAN_CACHE_SIZE:
+        _plan_cache.popitem(last=False)
+    return plan
+
 
 class DynamicScorer:
     """
@@ -22,6 +350,7 @@ class DynamicScorer:
             formula_info: 解析后的评分公式信息
         """
         self.formula_info = formula_info
+        self.plan = compile_formula(formula_info)
     
     def calculate_score(self, kline_data: pd.DataFrame) -> int:
         """
@@ -33,430 +362,241 @@ class DynamicScorer:
         Returns:
             int: 评分
         """
-        score = 0
-        
-        # 计算趋势强度得分
-        score += self._calculate_trend_strength(kline_data)
-        
-        # 计算动量确认得分
-        score += self._calculate_momentum_confirmation(kline_data)
-        
-        # 计算量价配合得分
-        score += self._calculate_volume_price_coordination(kline_data)
-        
-        # 计算风险控制得分
-        score += self._calculate_risk_control(kline_data)
-        
-        # 计算市场环境得分
-        score += self._calculate_market_environment(kline_data)
-        
-        # 应用扣分项
-        score -= self._calculate_penalties(kline_data)
-        
-        # 限制评分范围
-        score = max(0, min(100, score))
-        
-        return score
+        return self.calculate_score_detail(kline_data)[0]
+
+    def calculate_score_detail(self, kline_data: pd.DataFrame) -> Tuple[float, Dict]:
+        """
+        按编译好的评分计划对整段K线（视为一个窗口）评分，并由触发位掩码生成规则明细
+
+        Args:
+            kline_data: K线数据（按时间升序）
+
+        Returns:
+            (score, detail): 限制在 0-100 的评分；detail 含各部分得分 section_scores、
+                             triggered_items、penalty_items、recognized_not_triggered_items、unrecognized_items
+        """
+        data = {col: kline_data[col].to_numpy(dtype=np.float64)
+                for col in _KLINE_COLUMNS if col in kline_data.columns}
+        n = len(kline_data)
+        features = self._series_features(data, n, n, self.plan.features)
+        hits = self.plan.hits(features, 1)[0]
+
+        section_scores = {section: 0 for section in SECTIONS}
+        penalty = 0
+        triggered = 0
+        for entry, hit in zip(self.plan.entries, hits):
+            if not hit:
+                continue
+            triggered |= entry.bits
+            if entry.section == 'penalty_items':
+                penalty -= entry.weight
+            else:
+                section_scores[entry.section] += entry.weight
+        section_scores['penalty_total'] = penalty
 
-    def calculate_score_detail(self, kline_data: pd.DataFrame):
         detail = {
-            'section_scores': {},
+            'section_scores': section_scores,
             'triggered_items': [],
             'recognized_not_triggered_items': [],
             'unrecognized_items': [],
             'penalty_items': [],
         }
+        for rule in self.plan.rules:
+            section, condition = rule['section'], rule['condition']
+            is_penalty = section == 'penalty_items'
+            payload = {'section': section, 'condition': condition,
+                       'score': -rule['penalty'] if is_penalty else rule['score']}
+            if rule['key'] is None:
+                detail['unrecognized_items'].append(payload)
+            elif not triggered >> rule['bit'] & 1:
+                detail['recognized_not_triggered_items'].append(payload)
+            elif is_penalty:
+                detail['penalty_items'].append({'section': section, 'condition': condition, 'penalty': rule['penalty']})
+            else:
+                detail['triggered_items'].append(payload)
 
-        score = 0
-
-        trend_score = self._calculate_trend_strength(kline_data, detail)
-        detail['section_scores']['trend_strength'] = trend_score
-        score += trend_score
-
-        momentum_score = self._calculate_momentum_confirmation(kline_data, detail)
-        detail['section_scores']['momentum_confirmation'] = momentum_score
-        score += momentum_score
-
-        volume_score = self._calculate_volume_price_coordination(kline_data, detail)
-        detail['section_scores']['volume_price_coordination'] = volume_score
-        score += volume_score
-
-        risk_score = self._calculate_risk_control(kline_data, detail)
-        detail['section_scores']['risk_control'] = risk_score
-        score += risk_score
-
-        market_score = self._calculate_market_environment(kline_data, detail)
-        detail['section_scores']['market_environment'] = market_score
-        score += market_score
-
-        penalty = self._calculate_penalties(kline_data, detail)
-        detail['section_scores']['penalty_total'] = penalty
-        score -= penalty
-
-        score = max(0, min(100, score))
-        return score, detail
-
-    def _calculate_kdj(self, kline_data: pd.DataFrame, n: int = 9) -> Dict[str, float]:
-        if len(kline_data) < n:
-            return {'k': np.nan, 'd': np.nan, 'j': np.nan}
-        low_n = kline_data['最低'].rolling(n, min_periods=n).min()
-        high_n = kline_data['最高'].rolling(n, min_periods=n).max()
-        denom = (high_n - low_n).replace(0, np.nan)
-        rsv = (kline_data['收盘'] - low_n) / denom * 100
-        k = rsv.ewm(alpha=1/3, adjust=False).mean()
-        d = k.ewm(alpha=1/3, adjust=False).mean()
-        j = 3 * k - 2 * d
-        return {'k': float(k.iloc[-1]), 'd': float(d.iloc[-1]), 'j': float(j.iloc[-1])}
-    
-    def _calculate_trend_strength(self, kline_data: pd.DataFrame, detail: Dict = None) -> int:
-        """
-        计算趋势强度得分
-        """
-        trend_score = 0
-        items = self.formula_info.get('trend_strength', {}).get('items', [])
-        
-        for item in items:
-            condition = item.get('condition', '')
-            item_score = item.get('score', 0)
-            recognized = False
-            triggered = False
-            
-            if 'MA5 > MA20' in condition:
-                recognized = True
-                if len(kline_data) >= 20:
-                    ma5 = kline_data['收盘'].tail(5).mean()
-                    ma20 = kline_data['收盘'].tail(20).mean()
-                    if ma5 > ma20:
-                        trend_score += item_score
-                        triggered = True
-            
-            elif 'MA10 > MA30' in condition:
-                recognized = True
-                if len(kline_data) >= 30:
-                    ma10 = kline_data['收盘'].tail(10).mean()
-                    ma30 = kline_data['收盘'].tail(30).mean()
-                    if ma10 > ma30:
-                        trend_score += item_score
-                        triggered = True
-            
-            elif '均线多头排列' in condition:
-                recognized = True
-                if len(kline_data) >= 20:
-                    ma5 = kline_data['收盘'].tail(5).mean()
-                    ma10 = kline_data['收盘'].tail(10).mean()
-                    ma20 = kline_data['收盘'].tail(20).mean()
-                    if ma5 > ma10 > ma20:
-                        trend_score += item_score
-                        triggered = True
-            
-            elif '近期5日涨幅 > 3%' in condition:
-                recognized = True
-                if len(kline_data) >= 5:
-                    start_price = kline_data['收盘'].iloc[-5]
-                    end_price = kline_data['收盘'].iloc[-1]
-                    change_pct = (end_price - start_price) / start_price * 100
-                    if change_pct > 3:
-                        trend_score += item_score
-                        triggered = True
-
-            if detail is not None:
-                payload = {'section': 'trend_strength', 'condition': condition, 'score': item_score}
-                if recognized:
-                    if triggered:
-                        detail['triggered_items'].append(payload)
-                    else:
-                        detail['recognized_not_triggered_items'].append(payload)
-                else:
-                    detail['unrecognized_items'].append(payload)
-        
-        return trend_score
-    
-    def _calculate_momentum_confirmation(self, kline_data: pd.DataFrame, detail: Dict = None) -> int:
+        score = sum(section_scores[section] for section in SECTIONS) - penalty
+        return max(0, min(100, score)), detail
+
+    def rule_list(self) -> List[Dict]:
         """
-        计算动量确认得分
+        按评分顺序展开公式中的全部规则，位置即 score_series 位掩码中的位序号
+
+        Returns:
+            List[Dict]: 每条规则的 bit, section, condition, score（扣分项为 penalty）, key
+                        （key 为 None 表示未识别的条件）
         """
-        momentum_score = 0
-        items = self.formula_info.get('momentum_confirmation', {}).get('items', [])
-        
-        for item in items:
-            condition = item.get('condition', '')
-            item_score = item.get('score', 0)
-            recognized = False
-            triggered = False
-            
-            if 'MACD金叉' in condition:
-                recognized = True
-                # 简化计算MACD
-                if len(kline_data) >= 26:
-                    exp1 = kline_data['收盘'].ewm(span=12, adjust=False).mean()
-                    exp2 = kline_data['收盘'].ewm(span=26, adjust=False).mean()
-                    macd = exp1 - exp2
-                    signal = macd.ewm(span=9, adjust=False).mean()
-                    histogram = macd - signal
-                    if len(histogram) >= 2:
-                        if histogram.iloc[-1] > histogram.iloc[-2] and histogram.iloc[-1] > 0:
-                            momentum_score += item_score
-                            triggered = True
-            
-            elif 'KDJ' in condition:
-                recognized = True
-                # 计算KDJ
-                if len(kline_data) >= 9:
-                    kdj = self._calculate_kdj(kline_data, n=9)
-                    k = kdj['k']
-                    d = kdj['d']
-                    if not np.isnan(k) and not np.isnan(d):
-                        if k > d and 20 < k < 80:
-                            momentum_score += item_score
-                            triggered = True
-            
-            elif '布林带' in condition:
-                recognized = True
-                if len(kline_data) >= 20:
-                    close = kline_data['收盘'].iloc[-1]
-                    ma20 = kline_data['收盘'].tail(20).mean()
-                    std20 = kline_data['收盘'].tail(20).std()
-                    upper_band = ma20 + 2 * std20
-                    lower_band = ma20 - 2 * std20
-                    middle_band = ma20
-                    if close > middle_band:
-                        momentum_score += item_score
-                        triggered = True
-
-            if detail is not None:
-                payload = {'section': 'momentum_confirmation', 'condition': condition, 'score': item_score}
-                if recognized:
-                    if triggered:
-                        detail['triggered_items'].append(payload)
-                    else:
-                        detail['recognized_not_triggered_items'].append(payload)
-                else:
-                    detail['unrecognized_items'].append(payload)
-        
-        return momentum_score
-    
-    def _calculate_volume_price_coordination(self, kline_data: pd.DataFrame, detail: Dict = None) -> int:
+        return [dict(rule) for rule in self.plan.rules]
+
+    def score_series(self, kline_data: pd.DataFrame, lookback: int = 30) -> pd.DataFrame:
         """
-        计算量价配合得分
+        一次性计算每根K线的评分
+
+        第 t 根K线的结果与 calculate_score_detail(kline_data.iloc[t-lookback+1:t+1]) 完全一致：
+        按编译好的评分计划计算所需特征列（均线、量能、收益率等按全长滚动列向量化，
+        MACD/KDJ 这类依赖窗口起点的递推指标按窗口矩阵逐列递推），再与计划的权重做矩阵乘；
+        开头不足 lookback 根的窗口按实际长度计算。
+
+        Args:
+            kline_data: K线数据（按时间升序）
+            lookback: 评分窗口长度，与回测时的窗口一致
+
+        Returns:
+            pd.DataFrame: 索引同 kline_data，列 score（评分）和 triggered（触发规则位掩码，
+                          第 i 位对应 attrs['rules'][i]，扣分项触发同样置位）
         """
-        volume_score = 0
-        items = self.formula_info.get('volume_price_coordination', {}).get('items', [])
-        
-        for item in items:
-            condition = item.get('condition', '')
-            item_score = item.get('score', 0)
-            recognized = False
-            triggered = False
-            
-            if '成交量 > 20日均量1.3倍' in condition:
-                recognized = True
-                if len(kline_data) >= 20:
-                    avg_volume = kline_data['成交量'].tail(20).mean()
-                    recent_volume = kline_data['成交量'].iloc[-1]
-                    if recent_volume > avg_volume * 1.3:
-                        volume_score += item_score
-                        triggered = True
-            
-            elif '量比' in condition:
-                recognized = True
-                if len(kline_data) >= 5:
-                    avg_volume_5 = kline_data['成交量'].tail(5).mean()
-                    current_volume = kline_data['成交量'].iloc[-1]
-                    if current_volume / avg_volume_5 > 1.2:
-                        volume_score += item_score
-                        triggered = True
-
-            if detail is not None:
-                payload = {'section': 'volume_price_coordination', 'condition': condition, 'score': item_score}
-                if recognized:
-                    if triggered:
-                        detail['triggered_items'].append(payload)
-                    else:
-                        detail['recognized_not_triggered_items'].append(payload)
-                else:
-                    detail['unrecognized_items'].append(payload)
-        
-        return volume_score
-    
-    def _calculate_risk_control(self, kline_data: pd.DataFrame, detail: Dict = None) -> int:
+        if len(self.plan.rules) > 64:
+            raise ValueError(f"规则数量 {len(self.plan.rules)} 超过位掩码上限 64")
+        lookback = max(1, int(lookback))
+        data = {col: kline_data[col].to_numpy(dtype=np.float64)
+                for col in _KLINE_COLUMNS if col in kline_data.columns}
+        n = len(kline_data)
+
+        score = np.zeros(n)
+        triggered = np.zeros(n, dtype=np.uint64)
+        if n >= lookback:
+            score[lookback - 1:], triggered[lookback - 1:] = self._score_windows(data, n, lookback)
+        for t in range(min(lookback - 1, n)):
+            head = {col: values[:t + 1] for col, values in data.items()}
+            s, b = self._score_windows(head, t + 1, t + 1)
+            score[t], triggered[t] = s[0], b[0]
+
+        out = pd.DataFrame({'score': score, 'triggered': triggered}, index=kline_data.index)
+        out.attrs['rules'] = self.rule_list()
+        return out
+
+    def _score_windows(self, data: Dict[str, np.ndarray], n: int, window: int) -> Tuple[np.ndarray, np.ndarray]:
         """
-        计算风险控制得分
+        对所有长度恰为 window 的窗口评分
+
+        Returns:
+            (score, triggered): 长度为 n-window+1 的评分数组与位掩码数组
         """
-        risk_score = 0
-        items = self.formula_info.get('risk_control', {}).get('items', [])
-        
-        for item in items:
-            condition = item.get('condition', '')
-            item_score = item.get('score', 0)
-            recognized = False
-            triggered = False
-            
-            if '波动率' in condition:
-                recognized = True
-                if len(kline_data) >= 30:
-                    returns = kline_data['收盘'].pct_change().tail(10).std()
-                    median_volatility = kline_data['收盘'].pct_change().tail(30).std()
-                    if returns < median_volatility:
-                        risk_score += item_score
-                        triggered = True
-            
-            elif '价格处于20日均线上方' in condition:
-                recognized = True
-                if len(kline_data) >= 20:
-                    ma20 = kline_data['收盘'].tail(20).mean()
-                    current_price = kline_data['收盘'].iloc[-1]
-                    if current_price > ma20:
-                        deviation = (current_price - ma20) / ma20 * 100
-                        if deviation < 8:
-                            risk_score += item_score
-                            triggered = True
-            
-            elif 'RSI' in condition:
-                recognized = True
-                if len(kline_data) >= 14:
-                    returns = kline_data['收盘'].pct_change().tail(14)
-                    gains = returns[returns > 0].mean()
-                    losses = -returns[returns < 0].mean()
-                    if losses > 0:
-                        rs = gains / losses
-                        rsi = 100 - (100 / (1 + rs))
-                        if 40 < rsi < 60:
-                            risk_score += item_score
-                            triggered = True
-
-            if detail is not None:
-                payload = {'section': 'risk_control', 'condition': condition, 'score': item_score}
-                if recognized:
-                    if triggered:
-                        detail['triggered_items'].append(payload)
-                    else:
-                        detail['recognized_not_triggered_items'].append(payload)
-                else:
-                    detail['unrecognized_items'].append(payload)
-        
-        return risk_score
-    
-    def _calculate_market_environment(self, kline_data: pd.DataFrame, detail: Dict = None) -> int:
+        features = self._series_features(data, n, window, self.plan.features)
+        return self.plan.evaluate(features, n - window + 1)
+
+    def _series_features(self, data: Dict[str, np.ndarray], n: int, window: int, names) -> Dict[str, np.ndarray]:
         """
-        计算市场环境得分
+        计算评分计划用到的特征列，窗口长度不足时特征为 NaN（任何比较均不成立）
+
+        Args:
+            data: 列名 -> 全长数组
+            n: K线数量
+            window: 窗口长度，所有窗口长度相同
+            names: 需要计算的特征
+
+        Returns:
+            Dict[str, np.ndarray]: 特征 -> 数组（每个窗口一个值）
         """
-        market_score = 0
-        items = self.formula_info.get('market_environment', {}).get('items', [])
-        if not items or len(kline_data) < 20:
-            return 0
+        size = n - window + 1
+        cache = {}
 
-        close = kline_data['收盘']
-        base = close.iloc[-20]
-        stock_ret_20 = (close.iloc[-1] - base) / base * 100 if base else 0
+        def last(col, lag=0):
+            return data[col][window - 1 - lag:n - lag]
 
-        fallback_score = 0
-        chosen = None
-        for item in items:
-            condition = item.get('condition', '')
-            item_score = item.get('score', 0)
-            cond_lower = str(condition).lower()
+        def mean(col, k):
+            if (col, k) not in cache:
+                cache[(col, k)] = _nanmean_rows(_window_rows(data[col], k)[window - k:])
+            return cache[(col, k)]
 
-            if '其他' in condition:
-                fallback_score = max(fallback_score, item_score)
-                continue
+        def change(k):
+            start = last('收盘', k - 1)
+            return (last('收盘') - start) / start * 100
 
-            if ('上涨' in condition or '涨幅' in condition or 'up' in cond_lower) and stock_ret_20 > 3:
-                market_score = max(market_score, item_score)
-                chosen = {'section': 'market_environment', 'condition': condition, 'score': item_score}
+        def returns_tail(k):
+            # 窗口内 pct_change 的最后 k 个值；窗口首根的收益率为 NaN
+            if 'returns' not in cache:
+                close = data['收盘']
+                returns = np.full(n, np.nan)
+                returns[1:] = close[1:] / close[:-1] - 1
+                cache['returns'] = returns
+            k = min(k, window)
+            rows = _window_rows(cache['returns'], k)[window - k:]
+            if k == window:
+                rows[:, 0] = np.nan
+            return rows
 
-        final_score = market_score if market_score > 0 else fallback_score
+        def volatility_spread():
+            if 'volatility' not in cache:
+                cache['volatility'] = _nanstd_rows(returns_tail(10)) - _nanstd_rows(returns_tail(30))
+            return cache['volatility']
 
-        if detail is not None:
-            for item in items:
-                payload = {'section': 'market_environment', 'condition': item.get('condition', ''), 'score': item.get('score', 0)}
-                if chosen and payload['condition'] == chosen['condition'] and payload['score'] == chosen['score']:
-                    detail['triggered_items'].append(payload)
-                elif '其他' in payload['condition'] and final_score == payload['score']:
-                    detail['triggered_items'].append(payload)
-                else:
-                    detail['recognized_not_triggered_items'].append(payload)
+        def rsi():
+            rows = returns_tail(14)
+            gains = _selected_mean_rows(rows, rows > 0)
+            losses = -_selected_mean_rows(rows, rows < 0)
+            valid = losses > 0
+            value = np.full(size, np.nan)
+            value[valid] = 100 - (100 / (1 + gains[valid] / losses[valid]))
+            return value
 
-        return final_score
-    
-    def _calculate_penalties(self, kline_data: pd.DataFrame, detail: Dict = None) -> int:
-        """
-        计算扣分项
-        """
-        penalty = 0
-        items = self.formula_info.get('penalty_items', [])
-        
-        for item in items:
-            condition = item.get('condition', '')
-            item_penalty = item.get('penalty', 0)
-            recognized = False
-            triggered = False
-            
-            if '长上影线' in condition:
-                recognized = True
-                if len(kline_data) >= 1:
-                    high = kline_data['最高'].iloc[-1]
-                    close = kline_data['收盘'].iloc[-1]
-                    open_price = kline_data['开盘'].iloc[-1]
-                    amplitude = (high - min(open_price, close)) / min(open_price, close) * 100
-                    if amplitude > 5 and (high - close) / high * 100 > 2:
-                        penalty += item_penalty
-                        triggered = True
-            
-            elif '行业指数' in condition:
-                recognized = True
-                # 简化计算，默认不扣分
-                pass
-            
-            elif '大宗交易' in condition:
-                recognized = True
-                # 简化计算，默认不扣分
-                pass
-            
-            elif '涨幅>5%但波动率同步放大' in condition:
-                recognized = True
-                if len(kline_data) >= 5:
-                    start_price = kline_data['收盘'].iloc[-5]
-                    end_price = kline_data['收盘'].iloc[-1]
-                    change_pct = (end_price - start_price) / start_price * 100
-                    if change_pct > 5:
-                        volatility = kline_data['收盘'].pct_change().tail(10).std()
-                        if volatility > kline_data['收盘'].pct_change().tail(30).std():
-                            penalty += item_penalty
-                            triggered = True
-            
-            elif '价涨量缩' in condition:
-                recognized = True
-                if len(kline_data) >= 2:
-                    price_change = kline_data['收盘'].iloc[-1] - kline_data['收盘'].iloc[-2]
-                    volume_change = kline_data['成交量'].iloc[-1] - kline_data['成交量'].iloc[-2]
-                    if price_change > 0 and volume_change < 0:
-                        penalty += item_penalty
-                        triggered = True
-            
-            elif 'RSI' in condition:
-                recognized = True
-                if len(kline_data) >= 14:
-                    returns = kline_data['收盘'].pct_change().tail(14)
-                    gains = returns[returns > 0].mean()
-                    losses = -returns[returns < 0].mean()
-                    if losses > 0:
-                        rs = gains / losses
-                        rsi = 100 - (100 / (1 + rs))
-                        if rsi > 70 or rsi < 30:
-                            penalty += item_penalty
-                            triggered = True
-
-            if detail is not None:
-                payload = {'section': 'penalty_items', 'condition': condition, 'penalty': item_penalty}
-                if recognized:
-                    if triggered:
-                        detail['penalty_items'].append(payload)
-                    else:
-                        detail['recognized_not_triggered_items'].append({'section': 'penalty_items', 'condition': condition, 'score': -item_penalty})
-                else:
-                    detail['unrecognized_items'].append({'section': 'penalty_items', 'condition': condition, 'score': -item_penalty})
-        
-        return penalty
+        def macd_expansion():
+            rows = _window_rows(data['收盘'], window)
+            macd = _ewm_rows(rows, (12 - 1) / 2) - _ewm_rows(rows, (26 - 1) / 2)
+            histogram = macd - _ewm_rows(macd, (9 - 1) / 2)
+            return np.minimum(histogram[:, -1] - histogram[:, -2], histogram[:, -1])
+
+        def kdj_k_above_d(period=9):
+            low_n = _window_rows(data['最低'], period).min(axis=1)
+            high_n = _window_rows(data['最高'], period).max(axis=1)
+            denom = high_n - low_n
+            denom[denom == 0] = np.nan
+            rsv = np.full(n, np.nan)
+            rsv[period - 1:] = (data['收盘'][period - 1:] - low_n) / denom * 100
+            rows = _window_rows(rsv, window)
+            rows[:, :period - 1] = np.nan
+            com = (1 - 1 / 3) / (1 / 3)
+            k = _ewm_rows(rows, com)
+            d = _ewm_rows(k, com)
+            return np.where(k[:, -1] > d[:, -1], k[:, -1], np.nan)
+
+        def ma20_deviation_pct():
+            ma20 = mean('收盘', 20)
+            close = last('收盘')
+            return np.where(close > ma20, (close - ma20) / ma20 * 100, np.nan)
+
+        def market_up():
+            base = last('收盘', 19)
+            stock_ret_20 = np.where(base != 0, (last('收盘') - base) / base * 100, 0.0)
+            return (stock_ret_20 > 3).astype(np.float64)
+
+        def upper_shadow_pct():
+            high, close, open_price = last('最高'), last('收盘'), last('开盘')
+            low_body = np.where(close < open_price, close, open_price)
+            amplitude = (high - low_body) / low_body * 100
+            return np.where(amplitude > 5, (high - close) / high * 100, np.nan)
+
+        def volume_change_on_up():
+            price_change = last('收盘') - last('收盘', 1)
+            return np.where(price_change > 0, last('成交量') - last('成交量', 1), np.nan)
+
+        # 特征 -> (所需最短窗口, 计算函数)
+        builders = {
+            'ma5_ma20_spread': (20, lambda: mean('收盘', 5) - mean('收盘', 20)),
+            'ma10_ma30_spread': (30, lambda: mean('收盘', 10) - mean('收盘', 30)),
+            'ma_bull_spread': (20, lambda: np.minimum(mean('收盘', 5) - mean('收盘', 10),
+                                                      mean('收盘', 10) - mean('收盘', 20))),
+            'change_5d_pct': (5, lambda: change(5)),
+            'macd_expansion': (26, macd_expansion),
+            'kdj_k_above_d': (9, kdj_k_above_d),
+            'close_ma20_spread': (20, lambda: last('收盘') - mean('收盘', 20)),
+            'volume_surge_spread': (20, lambda: last('成交量') - mean('成交量', 20) * 1.3),
+            'volume_ratio_5': (5, lambda: last('成交量') / mean('成交量', 5)),
+            'volatility_spread': (30, volatility_spread),
+            'ma20_deviation_pct': (20, ma20_deviation_pct),
+            'rsi_14': (14, rsi),
+            'market_up': (20, market_up),
+            'upper_shadow_pct': (1, upper_shadow_pct),
+            'surge_volatility_spread': (5, lambda: np.where(change(5) > 5, volatility_spread(), np.nan)),
+            'volume_change_on_up': (2, volume_change_on_up),
+        }
+
+        out = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for name in names:
+                min_window, build = builders[name]
+                out[name] = build() if window >= min_window else np.full(size, np.nan)
+        return out
 
 # 测试代码
 if __name__ == '__main__':
@@ -5,9 +5,15 @@
 统一管理所有技术指标的计算
 """
 
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 
 def calculate_ma(df: pd.DataFrame, periods: List[int] = None) -> pd.DataFrame:
@@ -191,7 +197,157 @@ def calculate_volume_indicators(df: pd.DataFrame) -> pd.DataFrame:
     return result
 
 
-def calculate_all_indicators(df: pd.DataFrame) -> pd.DataFrame:
+# calculate_all_indicators 输出的指标列（按输出顺序）
+INDICATOR_COLUMNS = (
+    'MA5', 'MA10', 'MA20', 'MA60', 'MA120', 'MA250',
+    'EMA12', 'EMA26', 'DIF', 'DEA', 'MACD',
+    'RSV', 'K', 'D', 'J',
+    'PRICE_CHANGE', 'PRICE_DIRECTION', 'OBV',
+    'VOL_MA5', 'VOL_MA10', 'VOL_RATIO',
+    'VOLUME_CHANGE', 'VOLUME_DIRECTION', 'CPV_SCORE', 'CPV_STREAK',
+)
+
+# K线图表（均线、MACD、KDJ）与 get_indicator_status 用到的指标列
+CHART_COLUMNS = ('MA5', 'MA10', 'MA20', 'MA60', 'DIF', 'DEA', 'MACD', 'K', 'D', 'J', 'OBV')
+STATUS_COLUMNS = ('MA20', 'MA60', 'MACD', 'J', 'OBV')
+
+# 整数类型的指标列，其余为 float64
+_INT_COLUMNS = ('CPV_SCORE', 'CPV_STREAK')
+
+
+def _run_streak(values: np.ndarray) -> np.ndarray:
+    """连续相同取值的计数（从1开始），等价于按取值变化分组后的 cumcount() + 1"""
+    n = len(values)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    positions = np.arange(n)
+    starts = np.zeros(n, dtype=np.int64)
+    change = np.empty(n, dtype=bool)
+    change[0] = True
+    change[1:] = values[1:] != values[:-1]
+    starts[change] = positions[change]
+    return positions - np.maximum.accumulate(starts) + 1
+
+
+def build_indicators(df: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    单遍计算技术指标，只返回指标列
+
+    从 收盘/最高/最低/成交量 的 NumPy 数组出发，按需计算所选指标（及其依赖的中间量）并写入
+    一块预分配的 float64 数组，不复制输入数据。滚动与指数平滑沿用 pandas 的实现，结果与
+    calculate_ma / calculate_macd / calculate_kdj / calculate_obv / calculate_volume_indicators /
+    calculate_cpv 逐个计算完全一致。
+
+    Args:
+        df: 包含 收盘、最高、最低、成交量 列的DataFrame（只读取所选指标需要的列）
+        columns: 需要的指标列，默认 INDICATOR_COLUMNS 全部
+
+    Returns:
+        只含所选指标列的DataFrame，索引与 df 相同，列顺序与 INDICATOR_COLUMNS 一致
+    """
+    if columns is None:
+        wanted = list(INDICATOR_COLUMNS)
+    else:
+        unknown = [col for col in columns if col not in INDICATOR_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知的指标列: {unknown}")
+        wanted = [col for col in INDICATOR_COLUMNS if col in set(columns)]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _build_indicator_frame(df, wanted)
+
+
+def _build_indicator_frame(df: pd.DataFrame, wanted: List[str]) -> pd.DataFrame:
+    """build_indicators 的计算部分，wanted 为已按 INDICATOR_COLUMNS 排序的指标列"""
+    need = set(wanted)
+    n = len(df)
+    float_cols = [col for col in wanted if col not in _INT_COLUMNS]
+    block = np.empty((n, len(float_cols)), dtype=np.float64)
+    slot = {col: i for i, col in enumerate(float_cols)}
+    values: Dict[str, np.ndarray] = {}
+
+    def put(col: str, arr) -> None:
+        if col in slot:
+            block[:, slot[col]] = arr
+
+    def series(arr: np.ndarray) -> pd.Series:
+        return pd.Series(arr, copy=False)
+
+    close = df['收盘'].to_numpy(dtype=np.float64) if need & {
+        'MA5', 'MA10', 'MA20', 'MA60', 'MA120', 'MA250', 'EMA12', 'EMA26', 'DIF', 'DEA', 'MACD',
+        'RSV', 'K', 'D', 'J', 'PRICE_CHANGE', 'PRICE_DIRECTION', 'OBV', 'CPV_SCORE', 'CPV_STREAK'} else None
+    close_s = series(close) if close is not None else None
+
+    # 均线
+    for period in (5, 10, 20, 60, 120, 250):
+        if f'MA{period}' in need:
+            put(f'MA{period}', close_s.rolling(window=period).mean().to_numpy())
+
+    # MACD
+    if need & {'EMA12', 'EMA26', 'DIF', 'DEA', 'MACD'}:
+        ema_fast = close_s.ewm(span=12, adjust=False).mean().to_numpy()
+        ema_slow = close_s.ewm(span=26, adjust=False).mean().to_numpy()
+        dif = ema_fast - ema_slow
+        put('EMA12', ema_fast)
+        put('EMA26', ema_slow)
+        put('DIF', dif)
+        if need & {'DEA', 'MACD'}:
+            dea = series(dif).ewm(span=9, adjust=False).mean().to_numpy()
+            put('DEA', dea)
+            put('MACD', (dif - dea) * 2)
+
+    # KDJ
+    if need & {'RSV', 'K', 'D', 'J'}:
+        low_low = df['最低'].rolling(window=9).min().to_numpy(dtype=np.float64)
+        high_high = df['最高'].rolling(window=9).max().to_numpy(dtype=np.float64)
+        rsv = (close - low_low) / (high_high - low_low) * 100
+        put('RSV', rsv)
+        if need & {'K', 'D', 'J'}:
+            k = series(rsv).ewm(span=3, adjust=False).mean().to_numpy()
+            d = series(k).ewm(span=3, adjust=False).mean().to_numpy()
+            put('K', k)
+            put('D', d)
+            put('J', 3 * k - 2 * d)
+
+    # 价格变化方向（OBV 与 CPV 共用，只计算一次）
+    volume = df['成交量'].to_numpy(dtype=np.float64) if need & {
+        'OBV', 'VOL_MA5', 'VOL_MA10', 'VOL_RATIO', 'VOLUME_CHANGE', 'VOLUME_DIRECTION', 'CPV_SCORE', 'CPV_STREAK'} else None
+    if need & {'PRICE_CHANGE', 'PRICE_DIRECTION', 'OBV', 'CPV_SCORE', 'CPV_STREAK'}:
+        price_change = np.empty(n)
+        price_change[:1] = np.nan
+        np.subtract(close[1:], close[:-1], out=price_change[1:])
+        price_direction = np.sign(price_change)
+        put('PRICE_CHANGE', price_change)
+        put('PRICE_DIRECTION', price_direction)
+        if 'OBV' in need:
+            put('OBV', np.nan_to_num(price_direction * volume, nan=0.0).cumsum())
+
+    # 成交量指标
+    if need & {'VOL_MA5', 'VOL_RATIO'}:
+        vol_ma5 = series(volume).rolling(window=5).mean().to_numpy()
+        put('VOL_MA5', vol_ma5)
+        put('VOL_RATIO', volume / vol_ma5)
+    if 'VOL_MA10' in need:
+        put('VOL_MA10', series(volume).rolling(window=10).mean().to_numpy())
+
+    # CPV：量价同向为正向，异向为负向
+    if need & {'VOLUME_CHANGE', 'VOLUME_DIRECTION', 'CPV_SCORE', 'CPV_STREAK'}:
+        volume_change = np.empty(n)
+        volume_change[:1] = np.nan
+        np.subtract(volume[1:], volume[:-1], out=volume_change[1:])
+        volume_direction = np.sign(volume_change)
+        put('VOLUME_CHANGE', volume_change)
+        put('VOLUME_DIRECTION', volume_direction)
+        if need & {'CPV_SCORE', 'CPV_STREAK'}:
+            cpv_score = np.where(price_direction == volume_direction, 1, -1)
+            values['CPV_SCORE'] = cpv_score
+            values['CPV_STREAK'] = _run_streak(cpv_score)
+
+    data = {col: block[:, slot[col]] if col in slot else values[col] for col in wanted}
+    return pd.DataFrame(data, index=df.index, columns=wanted, copy=False)
+
+
+def calculate_all_indicators(df: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
     """
     计算所有技术指标
     
@@ -201,33 +357,788 @@ def calculate_all_indicators(df: pd.DataFrame) -> pd.DataFrame:
             - 最高
             - 最低
             - 成交量
+        columns: 只计算所需的指标列（见 INDICATOR_COLUMNS），默认全部
     
     Returns:
-        包含所有技术指标的DataFrame
+        包含原有列与技术指标的DataFrame（已存在的同名列被覆盖）
     """
+    return _attach_indicators(df, build_indicators(df, columns))
+
+
+def _attach_indicators(df: pd.DataFrame, indicators: pd.DataFrame) -> pd.DataFrame:
+    """把指标列接到K线右侧，已存在的同名列原位覆盖"""
+    if not df.columns.isin(indicators.columns).any():
+        return pd.concat([df, indicators], axis=1)
     result = df.copy()
-    
-    # 计算MA
-    result = calculate_ma(result)
-    
-    # 计算MACD
-    result = calculate_macd(result)
-    
-    # 计算KDJ
-    result = calculate_kdj(result)
-    
-    # 计算OBV
-    result = calculate_obv(result)
-    
-    # 计算成交量指标
-    result = calculate_volume_indicators(result)
-    
-    # 计算CPV
-    result = calculate_cpv(result)
-    
+    for col in indicators.columns:
+        result[col] = indicators[col]
+    return result
+
+
+# 指纹所用的K线原始列
+_FINGERPRINT_COLUMNS = ('收盘', '最高', '最低', '成交量')
+
+
+def _normalize_columns(columns: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    """按 INDICATOR_COLUMNS 顺序排列所选指标列，用作缓存键的参数部分"""
+    if columns is None:
+        return INDICATOR_COLUMNS
+    return tuple(col for col in INDICATOR_COLUMNS if col in set(columns)) + tuple(
+        sorted(col for col in set(columns) if col not in INDICATOR_COLUMNS))
+
+
+def kline_fingerprint(df: pd.DataFrame) -> str:
+    """
+    K线内容指纹（收盘/最高/最低/成交量 的字节哈希）
+
+    Args:
+        df: K线数据
+
+    Returns:
+        十六进制摘要，任一价格或成交量变化（如复权修订）即不同
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for col in _FINGERPRINT_COLUMNS:
+        if col in df.columns:
+            digest.update(col.encode('utf-8'))
+            digest.update(np.ascontiguousarray(df[col].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+class IndicatorMemo:
+    """
+    技术指标 LRU 缓存
+
+    键为 (股票代码, 最后一根K线日期, K线根数, 指标列, 内容指纹)，值为 build_indicators 的结果。
+    同一会话内对同一只股票反复计算时直接复用；占用内存超过 max_bytes 时淘汰最久未使用的条目。
+    指定股票代码且所选列都在 STATE_COLUMNS 内时，条目同时保存 IndicatorState：新K线接在该股票
+    上一条目之后（前缀指纹一致）时只对新增K线增量计算（新增部分的均线在浮点误差内一致）。
+    可在多线程（如多个页面会话）间共享：查找与写入在锁内进行，指标计算在锁外。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        初始化指标缓存
+
+        Args:
+            max_bytes: 缓存指标数据的内存上限（字节）
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.extends = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries: "OrderedDict[tuple, Tuple[pd.DataFrame, int, Optional[IndicatorState]]]" = OrderedDict()
+        # (股票代码, 指标列) -> 该股票最近写入的条目键
+        self._latest: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, df: pd.DataFrame, columns: Tuple[str, ...], symbol: Optional[str]) -> tuple:
+        # 只取最后一根K线的日期，不解析整列
+        last_date = None
+        if len(df) and '日期' in df.columns:
+            last_date = pd.Timestamp(df['日期'].iloc[-1]).value
+        elif len(df) and isinstance(df.index, pd.DatetimeIndex):
+            last_date = df.index[-1].value
+        return (symbol, last_date, len(df), columns, kline_fingerprint(df))
+
+    def get(self, df: pd.DataFrame, columns: Optional[Sequence[str]] = None, symbol: Optional[str] = None) -> pd.DataFrame:
+        """
+        获取指标列（与 build_indicators(df, columns) 一致）
+
+        Args:
+            df: K线数据
+            columns: 需要的指标列，默认全部
+            symbol: 股票代码，None 时只按内容指纹区分
+
+        Returns:
+            只含所选指标列的DataFrame，索引与 df 相同
+        """
+        wanted = _normalize_columns(columns)
+        key = self._key(df, wanted, symbol)
+        incremental = (symbol is not None and set(wanted) <= set(STATE_COLUMNS)
+                       and all(col in df.columns for col in _FINGERPRINT_COLUMNS))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[0].set_axis(df.index, axis=0)
+            prev_key = self._latest.get((symbol, wanted)) if incremental else None
+            prev = self._entries.get(prev_key) if prev_key is not None else None
+
+        extended = self._extend(df, key, prev_key, prev) if prev is not None else None
+        if extended is not None:
+            frame, state = extended
+        elif incremental:
+            full = build_indicators(df, STATE_COLUMNS)
+            frame = full[list(wanted)]
+            state = IndicatorState.from_kline(df, full)
+        else:
+            frame, state = build_indicators(df, columns), None
+
+        # 指标列均为 8 字节的 float64/int64
+        size = frame.size * 8
+        if state is not None:
+            # 状态中的价格窗口（Python 浮点对象约 32 字节）
+            size += 32 * (len(state.closes) + len(state.highs) + len(state.lows))
+        with self._lock:
+            if extended is not None:
+                self.extends += 1
+            else:
+                self.misses += 1
+            if size <= self.max_bytes:
+                # 其他线程可能已写入同一键：替换而不重复计入大小
+                replaced = self._entries.pop(key, None)
+                if replaced is not None:
+                    self.nbytes -= replaced[1]
+                self._entries[key] = (frame, size, state)
+                self.nbytes += size
+                if state is not None:
+                    self._latest[(symbol, wanted)] = key
+                while self.nbytes > self.max_bytes and self._entries:
+                    _, (_, evicted, _) = self._entries.popitem(last=False)
+                    self.nbytes -= evicted
+                    self.evictions += 1
+        # 返回的对象与缓存条目写时复制，调用方修改不影响缓存
+        return frame.set_axis(df.index, axis=0)
+
+    def _extend(self, df: pd.DataFrame, key: tuple, prev_key: tuple,
+                prev: tuple) -> Optional[Tuple[pd.DataFrame, 'IndicatorState']]:
+        """该股票上一条目 prev 覆盖 df 的前缀时，用其状态增量计算新增K线，否则返回None"""
+        if prev[2] is None:
+            return None
+        rows = prev_key[2]
+        if not 0 < rows < len(df) or kline_fingerprint(df.iloc[:rows]) != prev_key[4]:
+            return None
+
+        # 新增K线按行顺序递推，与 build_indicators 的计算顺序相同；状态复制后再更新，缓存中的状态不变
+        wanted = key[3]
+        state = prev[2].copy()
+        tail = state._advance(*(df[col].to_numpy(dtype=np.float64)[rows:] for col in ('收盘', '最高', '最低', '成交量')))
+        state.last_date = None if key[1] is None else pd.Timestamp(key[1]).isoformat()
+        block = np.vstack([prev[0].to_numpy(dtype=np.float64), tail[:, [STATE_COLUMNS.index(col) for col in wanted]]])
+        return pd.DataFrame(block, index=df.index, columns=list(wanted), copy=False), state
+
+    def clear(self, symbol: Optional[str] = None) -> int:
+        """
+        清除缓存
+
+        Args:
+            symbol: 股票代码，None清除所有
+
+        Returns:
+            删除的条目数
+        """
+        with self._lock:
+            keys = [key for key in self._entries if symbol is None or key[0] == symbol]
+            for key in keys:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._latest = {name: key for name, key in self._latest.items() if key in self._entries}
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        缓存统计
+
+        Returns:
+            条目数、占用字节、命中/未命中/增量计算/淘汰次数与命中率
+        """
+        with self._lock:
+            total = self.hits + self.extends + self.misses
+            return {
+                'entries': len(self._entries),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'extends': self.extends,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+# 全局指标缓存实例
+indicator_memo = IndicatorMemo()
+
+
+def get_indicator_memo() -> IndicatorMemo:
+    """
+    获取指标缓存实例
+
+    Returns:
+        指标缓存实例
+    """
+    return indicator_memo
+
+
+def cached_all_indicators(df: pd.DataFrame, columns: Optional[Sequence[str]] = None,
+                          symbol: Optional[str] = None) -> pd.DataFrame:
+    """
+    带缓存的 calculate_all_indicators
+
+    Args:
+        df: 包含 收盘、最高、最低、成交量 列的DataFrame
+        columns: 只计算所需的指标列，默认全部
+        symbol: 股票代码，None 时只按内容指纹区分
+
+    Returns:
+        包含原有列与技术指标的DataFrame（已存在的同名列被覆盖）
+    """
+    return _attach_indicators(df, indicator_memo.get(df, columns, symbol))
+
+
+# IndicatorState 增量维护的指标列
+STATE_COLUMNS = ('MA5', 'MA10', 'MA20', 'MA60', 'MA120', 'MA250',
+                 'EMA12', 'EMA26', 'DIF', 'DEA', 'MACD', 'RSV', 'K', 'D', 'J', 'OBV')
+
+_MA_PERIODS = (5, 10, 20, 60, 120, 250)
+_KDJ_PERIOD = 9
+# 指数平滑的 span，alpha 与 pandas 相同由 com = (span - 1) / 2 换算
+_EMA_SPANS = {'EMA12': 12, 'EMA26': 26, 'DEA': 9, 'K': 3, 'D': 3}
+
+
+def _span_alpha(span: int) -> float:
+    """与 pandas ewm(span=...) 相同的 alpha"""
+    return 1.0 / (1.0 + (span - 1) / 2.0)
+
+
+def _ewm_step(weighted: float, old_wt: float, value: float, alpha: float) -> Tuple[float, float]:
+    """pandas ewm(adjust=False).mean() 的单步递推，返回 (新平滑值, 旧值权重)；结果与 pandas 逐位一致"""
+    if weighted == weighted:
+        old_wt *= 1.0 - alpha
+        if value == value:
+            if weighted != value:
+                if alpha == 0.5:
+                    # pandas 在 alpha=0.5（span=3）时缺失值之后按 旧值权重 与 1-旧值权重 加权
+                    weighted = old_wt * weighted + (1.0 - old_wt) * value
+                else:
+                    weighted = (old_wt * weighted + alpha * value) / (old_wt + alpha)
+            old_wt = 1.0
+    elif value == value:
+        weighted = value
+    return weighted, old_wt
+
+
+def _ewm_tail_state(output: np.ndarray, source: np.ndarray, alpha: float) -> List[float]:
+    """由已算出的 ewm 序列末值与输入末尾的缺失数恢复递推状态 [平滑值, 旧值权重]"""
+    if len(output) == 0:
+        return [math.nan, 1.0]
+    old_wt = 1.0
+    weighted = float(output[-1])
+    if weighted == weighted:
+        for value in source[::-1]:
+            if value == value:
+                break
+            old_wt *= 1.0 - alpha
+    return [weighted, old_wt]
+
+
+@dataclass
+class IndicatorState:
+    """
+    技术指标的增量计算状态
+
+    保存 MA 滚动和（补偿求和，与 pandas rolling 相同的加入/移出方式）、最近250根收盘价与9根最高/最低价、
+    EMA/DEA/K/D 的平滑值与 OBV 累计值。追加 k 根K线只需 O(k)，结果与对全部历史重新计算一致
+    （EMA/MACD/KDJ/OBV 逐位一致，MA 在浮点误差内一致）。可经 to_dict/from_dict 序列化，随K线缓存持久化。
+    """
+    closes: List[float] = field(default_factory=list)
+    highs: List[float] = field(default_factory=list)
+    lows: List[float] = field(default_factory=list)
+    # 每个均线周期一组 [和, 加入补偿, 移出补偿, 有效数, 负值数]
+    ma_sums: Dict[str, List[float]] = field(default_factory=dict)
+    # 末尾连续相同收盘价的个数与该价格（全相同窗口直接取该价格，与 pandas 一致）
+    same_run: int = 0
+    same_value: float = math.nan
+    # 每个平滑指标一组 [平滑值, 旧值权重]
+    ewm: Dict[str, List[float]] = field(default_factory=dict)
+    obv: float = 0.0
+    last_close: float = math.nan
+    last_date: Optional[str] = None
+    bars: int = 0
+
+    @classmethod
+    def from_kline(cls, df: pd.DataFrame, indicators: Optional[pd.DataFrame] = None) -> 'IndicatorState':
+        """
+        由完整K线初始化状态
+
+        Args:
+            df: K线数据，需要 收盘、最高、最低、成交量 列，可含 日期 列或日期索引
+            indicators: 已对 df 计算的指标（含 STATE_COLUMNS），None则在此计算
+
+        Returns:
+            指向 df 最后一根K线之后的状态
+        """
+        if indicators is None:
+            indicators = build_indicators(df, STATE_COLUMNS)
+        close = df['收盘'].to_numpy(dtype=np.float64)
+        tail = max(_MA_PERIODS) + 1
+        state = cls(
+            closes=close[-tail:].tolist(),
+            highs=df['最高'].to_numpy(dtype=np.float64)[-_KDJ_PERIOD:].tolist(),
+            lows=df['最低'].to_numpy(dtype=np.float64)[-_KDJ_PERIOD:].tolist(),
+            bars=len(df),
+        )
+        for period in _MA_PERIODS:
+            acc = [0.0, 0.0, 0.0, 0, 0]
+            for value in close[-period:].tolist():
+                _ma_add(acc, value)
+            state.ma_sums[str(period)] = acc
+        # 末尾连续相同的有效收盘价（跳过NaN）
+        observed = close[~np.isnan(close)]
+        if len(observed):
+            state.same_value = float(observed[-1])
+            differs = np.flatnonzero(observed != observed[-1])
+            state.same_run = len(observed) - (int(differs[-1]) + 1 if len(differs) else 0)
+        sources = {
+            'EMA12': close, 'EMA26': close,
+            'DEA': indicators['DIF'].to_numpy(), 'K': indicators['RSV'].to_numpy(), 'D': indicators['K'].to_numpy(),
+        }
+        for name, span in _EMA_SPANS.items():
+            output = indicators[name].to_numpy()
+            state.ewm[name] = _ewm_tail_state(output, sources[name], _span_alpha(span))
+        if len(df):
+            state.obv = float(indicators['OBV'].iloc[-1])
+            state.last_close = float(close[-1])
+            dates = _kline_dates(df.iloc[-1:])
+            state.last_date = None if dates is None else dates[-1].isoformat()
+        return state
+
+    def update(self, bars: pd.DataFrame) -> pd.DataFrame:
+        """
+        追加新K线并返回其指标
+
+        Args:
+            bars: 新K线（列同 from_kline）；带日期时跳过不晚于状态最后日期的K线，可直接传入刷新后的完整K线
+
+        Returns:
+            新K线的 STATE_COLUMNS 指标，索引与所处理的K线相同
+        """
+        dates = _kline_dates(bars)
+        if dates is not None and self.last_date is not None:
+            keep = dates > pd.Timestamp(self.last_date)
+            bars, dates = bars[keep], dates[keep]
+        rows = self._advance(*(bars[col].to_numpy(dtype=np.float64) for col in ('收盘', '最高', '最低', '成交量')))
+        if len(bars) and dates is not None:
+            self.last_date = dates[-1].isoformat()
+        return pd.DataFrame(rows, index=bars.index, columns=list(STATE_COLUMNS))
+
+    def _advance(self, close: np.ndarray, high: np.ndarray, low: np.ndarray, volume: np.ndarray) -> np.ndarray:
+        """依次处理多根K线（不检查日期），返回 (K线数, len(STATE_COLUMNS)) 的指标数组"""
+        rows = np.full((len(close), len(STATE_COLUMNS)), np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i, bar in enumerate(zip(close.tolist(), high.tolist(), low.tolist(), volume.tolist())):
+                rows[i] = self._step(*bar)
+        return rows
+
+    def copy(self) -> 'IndicatorState':
+        """
+        复制状态（之后各自更新互不影响）
+
+        Returns:
+            IndicatorState 实例
+        """
+        return replace(self, closes=list(self.closes), highs=list(self.highs), lows=list(self.lows),
+                       ma_sums={name: list(acc) for name, acc in self.ma_sums.items()},
+                       ewm={name: list(acc) for name, acc in self.ewm.items()})
+
+    def _step(self, close: float, high: float, low: float, volume: float) -> List[float]:
+        """处理一根K线，返回按 STATE_COLUMNS 排列的指标值"""
+        self.bars += 1
+        self.closes.append(close)
+        if close == close:
+            if close == self.same_value:
+                self.same_run += 1
+            else:
+                self.same_run, self.same_value = 1, close
+        out = []
+        for period in _MA_PERIODS:
+            acc = self.ma_sums[str(period)]
+            if len(self.closes) > period:
+                _ma_remove(acc, self.closes[-period - 1])
+            _ma_add(acc, close)
+            out.append(_ma_value(acc, period, self.same_run, self.same_value))
+        del self.closes[:-(max(_MA_PERIODS) + 1)]
+
+        ema = {}
+        for name, value in (('EMA12', close), ('EMA26', close)):
+            ema[name] = self._ewm(name, value)
+        dif = ema['EMA12'] - ema['EMA26']
+        dea = self._ewm('DEA', dif)
+        out += [ema['EMA12'], ema['EMA26'], dif, dea, (dif - dea) * 2]
+
+        self.highs = (self.highs + [high])[-_KDJ_PERIOD:]
+        self.lows = (self.lows + [low])[-_KDJ_PERIOD:]
+        window = self.highs + self.lows
+        if len(self.highs) < _KDJ_PERIOD or any(v != v for v in window):
+            rsv = math.nan
+        else:
+            low_low, high_high = min(self.lows), max(self.highs)
+            rsv = float(np.float64(close - low_low) / np.float64(high_high - low_low) * 100)
+        k = self._ewm('K', rsv)
+        d = self._ewm('D', k)
+        out += [rsv, k, d, 3 * k - 2 * d]
+
+        change = close - self.last_close
+        direction = (change > 0) - (change < 0) if change == change else math.nan
+        term = direction * volume
+        self.obv += term if term == term else 0.0
+        self.last_close = close
+        out.append(self.obv)
+        return out
+
+    def _ewm(self, name: str, value: float) -> float:
+        weighted, old_wt = self.ewm[name]
+        weighted, old_wt = _ewm_step(weighted, old_wt, value, _span_alpha(_EMA_SPANS[name]))
+        self.ewm[name] = [weighted, old_wt]
+        return weighted
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        序列化为只含基本类型的字典（可 json.dumps 或存入缓存）
+
+        Returns:
+            状态字典
+        """
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'IndicatorState':
+        """
+        从 to_dict 的结果恢复状态
+
+        Args:
+            data: 状态字典
+
+        Returns:
+            IndicatorState 实例
+        """
+        return cls(**data)
+
+
+def _kline_dates(df: pd.DataFrame) -> Optional[pd.DatetimeIndex]:
+    """K线日期（日期列或日期索引），没有日期时返回None"""
+    if '日期' in df.columns:
+        return pd.DatetimeIndex(pd.to_datetime(df['日期']))
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df.index
+    return None
+
+
+def _ma_add(acc: list, value: float) -> None:
+    """滚动和加入一个值（补偿求和，与 pandas rolling mean 相同）"""
+    if value == value:
+        acc[3] += 1
+        y = value - acc[1]
+        t = acc[0] + y
+        acc[1] = t - acc[0] - y
+        acc[0] = t
+        if math.copysign(1.0, value) < 0:
+            acc[4] += 1
+
+
+def _ma_remove(acc: list, value: float) -> None:
+    """滚动和移出一个值"""
+    if value == value:
+        acc[3] -= 1
+        y = -value - acc[2]
+        t = acc[0] + y
+        acc[2] = t - acc[0] - y
+        acc[0] = t
+        if math.copysign(1.0, value) < 0:
+            acc[4] -= 1
+
+
+def _ma_value(acc: list, period: int, same_run: int, same_value: float) -> float:
+    """由滚动和得到均线值，有效数不足周期时为NaN"""
+    nobs = acc[3]
+    if nobs < period:
+        return math.nan
+    if same_run >= nobs:
+        return same_value
+    result = acc[0] / nobs
+    if acc[4] == 0 and result < 0:
+        return 0.0
+    if acc[4] == nobs and result > 0:
+        return 0.0
     return result
 
 
+def save_indicator_state(symbol: str, state: IndicatorState) -> bool:
+    """
+    将指标状态存入缓存（与K线缓存同一存储）
+
+    Args:
+        symbol: 股票代码
+        state: 指标状态
+
+    Returns:
+        是否成功
+    """
+    from cache import cache_set
+    return cache_set('indicator_state', state.to_dict(), symbol)
+
+
+def load_indicator_state(symbol: str, ttl: Optional[int] = None) -> Optional[IndicatorState]:
+    """
+    从缓存读取指标状态
+
+    Args:
+        symbol: 股票代码
+        ttl: 缓存过期时间（秒），None使用默认值
+
+    Returns:
+        指标状态，不存在或已过期时返回None
+    """
+    from cache import cache_get
+    data = cache_get('indicator_state', symbol, ttl=ttl)
+    return None if data is None else IndicatorState.from_dict(data)
+
+
+# 面板：日期×股票 的二维数组或宽表（索引为日期、列为股票代码）
+Panel = Union[np.ndarray, pd.DataFrame]
+
+
+def build_panel(klines: Dict[str, pd.DataFrame], column: str = '收盘') -> pd.DataFrame:
+    """
+    将多只股票的K线拼成宽表
+
+    Args:
+        klines: {股票代码: K线DataFrame}，K线可含 日期 列或以日期为索引
+        column: 取值列，如 收盘、最高、最低、成交量
+
+    Returns:
+        宽表，索引为所有日期的并集（升序），列为股票代码，缺失处为NaN
+    """
+    series = {}
+    for symbol, kline in klines.items():
+        dates = _kline_dates(kline)
+        index = dates if dates is not None else kline.index
+        series[symbol] = pd.Series(kline[column].to_numpy(dtype=np.float64), index=index)
+    return pd.DataFrame(series).sort_index()
+
+
+def _panel_values(panel: Panel) -> np.ndarray:
+    """面板的 float64 二维数组（一维数组视为单只股票）"""
+    values = panel.to_numpy(dtype=np.float64) if isinstance(panel, pd.DataFrame) else np.asarray(panel, dtype=np.float64)
+    return values.reshape(len(values), -1)
+
+
+def _like(panel: Panel, values: np.ndarray) -> Panel:
+    """按输入面板的类型返回结果（宽表保留索引与列）"""
+    if isinstance(panel, pd.DataFrame):
+        return pd.DataFrame(values, index=panel.index, columns=panel.columns, copy=False)
+    return values.reshape(np.shape(panel)) if np.ndim(panel) == 1 else values
+
+
+def _panel_rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """逐日推进、各股票并行的滚动均值，与 pandas rolling(window).mean() 的补偿求和逐位一致"""
+    T, N = x.shape
+    out = np.full((T, N), np.nan)
+    total = np.zeros(N)
+    comp_add = np.zeros(N)
+    comp_remove = np.zeros(N)
+    nobs = np.zeros(N, dtype=np.int64)
+    neg = np.zeros(N, dtype=np.int64)
+    same = np.zeros(N, dtype=np.int64)
+    prev = np.full(N, np.nan)
+    for t in range(T):
+        if t >= window:
+            v = x[t - window]
+            valid = v == v
+            nobs -= valid
+            y = -v - comp_remove
+            s = total + y
+            comp_remove = np.where(valid, s - total - y, comp_remove)
+            total = np.where(valid, s, total)
+            neg -= valid & np.signbit(v)
+        v = x[t]
+        valid = v == v
+        nobs += valid
+        y = v - comp_add
+        s = total + y
+        comp_add = np.where(valid, s - total - y, comp_add)
+        total = np.where(valid, s, total)
+        neg += valid & np.signbit(v)
+        same = np.where(valid, np.where(v == prev, same + 1, 1), same)
+        prev = np.where(valid, v, prev)
+        if t >= window - 1:
+            mean = total / np.maximum(nobs, 1)
+            mean = np.where(same >= nobs, prev, mean)
+            mean = np.where(((neg == 0) & (mean < 0)) | ((neg == nobs) & (mean > 0)), 0.0, mean)
+            out[t] = np.where(nobs >= window, mean, np.nan)
+    return out
+
+
+def _panel_ewm(x: np.ndarray, span: int) -> np.ndarray:
+    """逐日推进、各股票并行的 ewm(span, adjust=False).mean()，递推同 _ewm_step"""
+    alpha = _span_alpha(span)
+    T, N = x.shape
+    out = np.empty((T, N))
+    if T == 0:
+        return out
+    weighted = x[0].copy()
+    old_wt = np.ones(N)
+    out[0] = weighted
+    for t in range(1, T):
+        v = x[t]
+        has_weighted = weighted == weighted
+        valid = v == v
+        old_wt = np.where(has_weighted, old_wt * (1.0 - alpha), old_wt)
+        if alpha == 0.5:
+            blended = old_wt * weighted + (1.0 - old_wt) * v
+        else:
+            blended = (old_wt * weighted + alpha * v) / (old_wt + alpha)
+        step = has_weighted & valid
+        weighted = np.where(step & (weighted != v), blended, np.where(~has_weighted & valid, v, weighted))
+        old_wt = np.where(step, 1.0, old_wt)
+        out[t] = weighted
+    return out
+
+
+def _panel_diff_sign(x: np.ndarray) -> np.ndarray:
+    """逐股票的 sign(diff())，首行为NaN"""
+    out = np.full(x.shape, np.nan)
+    out[1:] = np.sign(x[1:] - x[:-1])
+    return out
+
+
+def panel_ma(close: Panel, periods: Sequence[int] = (5, 10, 20, 60, 120, 250)) -> Dict[str, Panel]:
+    """
+    面板模式的移动平均线（与 calculate_ma 逐股票结果一致）
+
+    Args:
+        close: 收盘价面板（日期×股票）
+        periods: 均线周期
+
+    Returns:
+        {'MA5': 面板, ...}
+    """
+    x = _panel_values(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {f'MA{period}': _like(close, _panel_rolling_mean(x, int(period))) for period in periods}
+
+
+def panel_macd(close: Panel, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9) -> Dict[str, Panel]:
+    """
+    面板模式的MACD（与 calculate_macd 逐股票结果一致）
+
+    Args:
+        close: 收盘价面板（日期×股票）
+        fast_period: 快速EMA周期
+        slow_period: 慢速EMA周期
+        signal_period: 信号EMA周期
+
+    Returns:
+        {'DIF', 'DEA', 'MACD'} 三个面板
+    """
+    x = _panel_values(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dif = _panel_ewm(x, fast_period) - _panel_ewm(x, slow_period)
+        dea = _panel_ewm(dif, signal_period)
+        macd = (dif - dea) * 2
+    return {'DIF': _like(close, dif), 'DEA': _like(close, dea), 'MACD': _like(close, macd)}
+
+
+def panel_kdj(high: Panel, low: Panel, close: Panel, period: int = 9, k_period: int = 3, d_period: int = 3) -> Dict[str, Panel]:
+    """
+    面板模式的KDJ（与 calculate_kdj 逐股票结果一致）
+
+    Args:
+        high: 最高价面板
+        low: 最低价面板
+        close: 收盘价面板
+        period: RSV周期
+        k_period: K值平滑周期
+        d_period: D值平滑周期
+
+    Returns:
+        {'RSV', 'K', 'D', 'J'} 四个面板
+    """
+    h, l, c = _panel_values(high), _panel_values(low), _panel_values(close)
+    low_low = np.full(l.shape, np.nan)
+    high_high = np.full(h.shape, np.nan)
+    if len(c) >= period:
+        # 窗口内有NaN时 min/max 为NaN，与 rolling(period).min() 要求满窗有效值一致
+        low_low[period - 1:] = np.lib.stride_tricks.sliding_window_view(l, period, axis=0).min(axis=-1)
+        high_high[period - 1:] = np.lib.stride_tricks.sliding_window_view(h, period, axis=0).max(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsv = (c - low_low) / (high_high - low_low) * 100
+        k = _panel_ewm(rsv, k_period)
+        d = _panel_ewm(k, d_period)
+        j = 3 * k - 2 * d
+    return {'RSV': _like(close, rsv), 'K': _like(close, k), 'D': _like(close, d), 'J': _like(close, j)}
+
+
+def panel_obv(close: Panel, volume: Panel) -> Panel:
+    """
+    面板模式的OBV（与 calculate_obv 逐股票结果一致）
+
+    Args:
+        close: 收盘价面板
+        volume: 成交量面板
+
+    Returns:
+        OBV面板
+    """
+    direction = _panel_diff_sign(_panel_values(close))
+    return _like(close, np.nan_to_num(direction * _panel_values(volume), nan=0.0).cumsum(axis=0))
+
+
+def panel_cpv(close: Panel, volume: Panel) -> Dict[str, Panel]:
+    """
+    面板模式的CPV（与 calculate_cpv 逐股票结果一致）
+
+    Args:
+        close: 收盘价面板
+        volume: 成交量面板
+
+    Returns:
+        {'CPV_SCORE', 'CPV_STREAK'} 两个整数面板
+    """
+    score = np.where(_panel_diff_sign(_panel_values(close)) == _panel_diff_sign(_panel_values(volume)), 1, -1)
+    rows = np.arange(len(score))[:, None]
+    change = np.ones(score.shape, dtype=bool)
+    change[1:] = score[1:] != score[:-1]
+    starts = np.maximum.accumulate(np.where(change, rows, 0), axis=0)
+    return {'CPV_SCORE': _like(close, score), 'CPV_STREAK': _like(close, rows - starts + 1)}
+
+
+def panel_volume_ratio(volume: Panel, period: int = 5) -> Panel:
+    """
+    面板模式的量比：成交量 / period 日均量（period=5 时即 calculate_volume_indicators 的 VOL_RATIO）
+
+    Args:
+        volume: 成交量面板
+        period: 均量周期
+
+    Returns:
+        量比面板
+    """
+    v = _panel_values(volume)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _like(volume, v / _panel_rolling_mean(v, int(period)))
+
+
+def cross_above(fast: Panel, slow: Panel) -> Panel:
+    """
+    上穿信号（如 MACD 金叉：cross_above(DIF, DEA)）
+
+    Args:
+        fast: 快线面板
+        slow: 慢线面板
+
+    Returns:
+        布尔面板，当日 fast > slow 且前一日 fast <= slow 时为True
+    """
+    f, s = _panel_values(fast), _panel_values(slow)
+    out = np.zeros(f.shape, dtype=bool)
+    out[1:] = (f[1:] > s[1:]) & (f[:-1] <= s[:-1])
+    return _like(fast, out)
+
+
 def get_indicator_status(df: pd.DataFrame) -> Dict[str, str]:
     """
     获取技术指标状态
@@ -202,12 +202,12 @@ def get_stock_info(symbol):
 
 # ==================== 技术指标计算 ====================
 
-from indicators import calculate_all_indicators, get_technical_status, calculate_cpv
+from indicators import CHART_COLUMNS, STATUS_COLUMNS, cached_all_indicators, get_technical_status, calculate_cpv
 
 
-def calculate_indicators(df):
-    """计算技术指标"""
-    return calculate_all_indicators(df)
+def calculate_indicators(df, symbol=None):
+    """计算K线图表与指标状态所需的技术指标（传入股票代码时，追加新K线只增量计算）"""
+    return cached_all_indicators(df, columns=CHART_COLUMNS, symbol=symbol)
 
 
 # ==================== K线图表 ====================
@@ -231,7 +231,7 @@ def plot_candlestick(df, symbol, name):
     df['日期'] = pd.to_datetime(df['日期'])
     
     # 计算均线
-    df = calculate_indicators(df)
+    df = calculate_indicators(df, symbol)
     
     # 创建图表
     fig = make_subplots(
@@ -626,7 +626,7 @@ if df is not None:
                     tech_score = 0
                     if kline_data is not None and len(kline_data) > 60:
                         # 计算技术指标
-                        tech_data = calculate_all_indicators(kline_data)
+                        tech_data = cached_all_indicators(kline_data, columns=STATUS_COLUMNS, symbol=stock_code)
                         indicator_status = get_technical_status(tech_data)
                         
                         # 均线状态
@@ -1277,7 +1277,7 @@ if df is not None:
                 
                 # 技术指标解读
                 kline = st.session_state['kline_data']
-                kline = calculate_indicators(kline)
+                kline = calculate_indicators(kline, st.session_state['symbol'])
                 
                 # 获取技术指标状态
                 indicator_status = get_technical_status(kline)
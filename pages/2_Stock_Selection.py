@@ -202,12 +202,12 @@ def get_stock_info(symbol):
 
 # ==================== 技术指标计算 ====================
 
-from indicators import calculate_all_indicators, get_technical_status, calculate_cpv
+from indicators import CHART_COLUMNS, cached_all_indicators, get_technical_status, calculate_cpv
 
 
-def calculate_indicators(df):
-    """计算技术指标"""
-    return calculate_all_indicators(df)
+def calculate_indicators(df, symbol=None):
+    """计算K线图表与指标状态所需的技术指标（传入股票代码时，追加新K线只增量计算）"""
+    return cached_all_indicators(df, columns=CHART_COLUMNS, symbol=symbol)
 
 
 # ==================== K线图表 ====================
@@ -231,7 +231,7 @@ def plot_candlestick(df, symbol, name):
     df['日期'] = pd.to_datetime(df['日期'])
     
     # 计算均线
-    df = calculate_indicators(df)
+    df = calculate_indicators(df, symbol)
     
     # 创建图表
     fig = make_subplots(
@@ -204,12 +204,12 @@ def get_stock_info(symbol):
 
 # ==================== 技术指标计算 ====================
 
-from indicators import calculate_all_indicators, get_technical_status, calculate_cpv
+from indicators import CHART_COLUMNS, cached_all_indicators, get_technical_status, calculate_cpv
 
 
-def calculate_indicators(df):
-    """计算技术指标"""
-    return calculate_all_indicators(df)
+def calculate_indicators(df, symbol=None):
+    """计算K线图表与指标状态所需的技术指标（传入股票代码时，追加新K线只增量计算）"""
+    return cached_all_indicators(df, columns=CHART_COLUMNS, symbol=symbol)
 
 
 # ==================== K线图表 ====================
@@ -233,7 +233,7 @@ def plot_candlestick(df, symbol, name):
     df['日期'] = pd.to_datetime(df['日期'])
     
     # 计算均线
-    df = calculate_indicators(df)
+    df = calculate_indicators(df, symbol)
     
     # 创建图表
     fig = make_subplots(
@@ -753,6 +753,7 @@ if st.button("🚀 开始回测", disabled=not can_backtest):
                 # 导入动态评分器和解析器
                 from score_formula_parser import ScoreFormulaParser
                 from dynamic_scorer import DynamicScorer
+                from score_cache import CachedScorer, cached_score_series
                 
                 # 创建解析器实例
                 parser = ScoreFormulaParser()
@@ -775,8 +776,8 @@ if st.button("🚀 开始回测", disabled=not can_backtest):
                     st.error("❌ 请先点击'🧠 AI优化公式'按钮生成AI优化公式")
                     st.stop()
                 
-                # 创建动态评分器实例
-                scorer = DynamicScorer(formula_info)
+                # 创建动态评分器实例（整段评分经磁盘缓存，同一公式重复回测/寻优时复用）
+                scorer = CachedScorer(DynamicScorer(formula_info), stock_code)
                 
                 # 显示评分阈值信息
                 # 优先使用AI确定的阈值
@@ -927,6 +928,29 @@ ret_pct: {recent_ret}
                 }
                 
                 horizon_for_loop = max(predict_horizon_days, int(strategy_horizon_days))
+                
+                # 一次性计算每个30日窗口的评分与触发规则位掩码（第 i+29 行即窗口 iloc[i:i+30] 的结果）
+                score_frame = scorer.scorer.score_series(kline_data, 30)
+                window_scores = score_frame['score'].to_numpy()
+                window_ends = np.arange(29, len(kline_data) - horizon_for_loop + 29)
+                window_ends = window_ends[window_ends < len(kline_data)]
+                window_masks = score_frame['triggered'].to_numpy()[window_ends]
+                
+                # 规则统计：按位计数，分类与 calculate_score_detail 相同（触发的扣分项不计入）
+                for rule in score_frame.attrs['rules']:
+                    key = f"{rule['section']} | {rule['condition']}"
+                    hit_count = int(((window_masks >> np.uint64(rule['bit'])) & np.uint64(1)).sum())
+                    counts = {}
+                    if rule['key'] is None:
+                        counts['unrecognized'] = len(window_ends)
+                    else:
+                        if rule['section'] != 'penalty_items':
+                            counts['triggered'] = hit_count
+                        counts['recognized_not_triggered'] = len(window_ends) - hit_count
+                    for category, count in counts.items():
+                        if count:
+                            rule_stats[category][key] = rule_stats[category].get(key, 0) + count
+                
                 for i in range(len(kline_data) - horizon_for_loop):
                     # 获取当前日期的数据
                     current_data = kline_data.iloc[i:i+30]  # 使用30天数据计算指标
@@ -934,19 +958,9 @@ ret_pct: {recent_ret}
                     if len(current_data) < 30:
                         continue
                     
-                    score, score_detail = scorer.calculate_score_detail(current_data)
+                    score = float(window_scores[i + 29])
                     scores.append(score)
                     
-                    for item in score_detail.get('triggered_items', []):
-                        key = f"{item.get('section')} | {item.get('condition')}"
-                        rule_stats['triggered'][key] = rule_stats['triggered'].get(key, 0) + 1
-                    for item in score_detail.get('unrecognized_items', []):
-                        key = f"{item.get('section')} | {item.get('condition')}"
-                        rule_stats['unrecognized'][key] = rule_stats['unrecognized'].get(key, 0) + 1
-                    for item in score_detail.get('recognized_not_triggered_items', []):
-                        key = f"{item.get('section')} | {item.get('condition')}"
-                        rule_stats['recognized_not_triggered'][key] = rule_stats['recognized_not_triggered'].get(key, 0) + 1
-                    
                     # 当前价格
                     current_price = current_data['收盘'].iloc[-1]
                     current_date = current_data.index[-1]
@@ -1241,27 +1255,23 @@ ret_pct: {recent_ret}
                         "市场环境：近20日上涨趋势（涨幅>3%）否则低分",
                     ]
 
+                    from abtest_engine import threshold_sweep
+
                     def _select_threshold(df: pd.DataFrame):
-                        scores_series = df['评分']
-                        candidate_thresholds = sorted(set([float(scores_series.quantile(q)) for q in np.linspace(0.5, 0.98, 25)]))
-                        best = None
-                        for th in candidate_thresholds:
-                            subset = df[df['评分'] >= th]
-                            if len(subset) < max(20, int(min_val_samples)):
-                                continue
-                            win = (subset['未来收益'] > 0).mean() * 100
-                            avg = subset['未来收益'].mean()
-                            obj = avg * (win / 100)
-                            row = {
-                                'threshold': float(th),
-                                'samples': int(len(subset)),
-                                'win_rate': float(win),
-                                'avg_return': float(avg),
-                                'objective': float(obj),
-                            }
-                            if best is None or row['objective'] > best['objective']:
-                                best = row
-                        return best
+                        # 一次排序+累计和得到全部候选阈值的样本数/胜率/平均收益，取目标最大者（并列取最低阈值）
+                        curve = threshold_sweep(df)
+                        curve = curve[curve['samples'] >= max(20, int(min_val_samples))]
+                        if curve.empty:
+                            return None
+                        objective = curve['avg_return'] * (curve['win_rate'] / 100)
+                        best = curve.loc[objective.idxmax()]
+                        return {
+                            'threshold': float(best['threshold']),
+                            'samples': int(best['samples']),
+                            'win_rate': float(best['win_rate']),
+                            'avg_return': float(best['avg_return']),
+                            'objective': float(objective.max()),
+                        }
 
                     def _eval_hit(df: pd.DataFrame, threshold: float):
                         subset = df[df['评分'] >= threshold]
@@ -1356,11 +1366,12 @@ ret_pct: {recent_ret}
                                         local_scorer = DynamicScorer(local_formula_info)
 
                                         local_eval_records = []
+                                        series_scores = cached_score_series(stock_code, local_scorer, kline_data, 30)
                                         for j in range(len(kline_data) - max_holding_days):
                                             w = kline_data.iloc[j:j+30]
                                             if len(w) < 30:
                                                 continue
-                                            s, _d = local_scorer.calculate_score_detail(w)
+                                            s = float(series_scores.iloc[j + 29])
                                             price = w['收盘'].iloc[-1]
                                             dt = w.index[-1]
                                             future_loc = j + 29 + max_holding_days
@@ -1518,15 +1529,22 @@ ret_pct: {recent_ret}
                                         eq_before = _simulate_equity_curve(base_df, float(th0['threshold']), max_holding_days)
                                     else:
                                         eq_before = pd.Series(dtype=float)
+                                    if len(train0) >= 30:
+                                        with st.expander("训练集阈值曲线（优化前公式）"):
+                                            curve0 = threshold_sweep(train0, "all").set_index('threshold')
+                                            curve0 = curve0[curve0['samples'] >= max(20, int(min_val_samples))]
+                                            st.line_chart(curve0[['win_rate', 'avg_return']], width='stretch')
+                                            st.line_chart(curve0[['samples']], width='stretch')
 
                                     best_info = parser.parse_deepseek_result(cached['best_formula_text'])
                                     best_scorer = DynamicScorer(best_info)
                                     best_eval_records = []
+                                    series_scores = cached_score_series(stock_code, best_scorer, kline_data, 30)
                                     for j in range(len(kline_data) - max_holding_days):
                                         w = kline_data.iloc[j:j+30]
                                         if len(w) < 30:
                                             continue
-                                        s, _d = best_scorer.calculate_score_detail(w)
+                                        s = float(series_scores.iloc[j + 29])
                                         price = w['收盘'].iloc[-1]
                                         dt = w.index[-1]
                                         future_loc = j + 29 + max_holding_days
@@ -1673,21 +1691,16 @@ ret_pct: {recent_ret}
                         st.markdown("### 📉 回撤曲线（风险对比）")
                         st.line_chart(dd_df, width='stretch')
 
+                        from backtest_engine import block_bootstrap_ci, random_trader_returns
                         if eval_records:
                             eval_df = pd.DataFrame(eval_records)
                             eval_df['日期'] = pd.to_datetime(eval_df['日期'])
                             eval_df = eval_df.sort_values('日期').reset_index(drop=True)
-                            rng = np.random.default_rng(20260214)
-                            random_trials = 400
+                            random_trials = 10000
                             target_trades = max(10, int(entry_stats['executed_buys'] or 0))
                             forward = eval_df['未来收益'].values.astype(float)
                             if len(forward) > 30:
-                                totals = []
-                                for _ in range(random_trials):
-                                    idx = rng.choice(len(forward), size=min(target_trades, len(forward)), replace=False)
-                                    total = float(np.prod(1 + forward[idx] / 100) - 1) * 100
-                                    totals.append(total)
-                                totals = np.array(totals)
+                                totals = random_trader_returns(forward, target_trades, n_trials=random_trials, seed=20260214)
                                 p25, p50, p75 = np.percentile(totals, [25, 50, 75])
                                 beat_pct = float((totals < (float(equity_df['策略'].iloc[-1]) - 1) * 100).mean() * 100)
                                 st.markdown("### 🧾 参考基线（随机交易者）")
@@ -1700,6 +1713,12 @@ ret_pct: {recent_ret}
                                     st.metric("随机交易者收益P75", f"{p75:.2f}%")
                                 with col_b4:
                                     st.metric("策略击败随机基线(%)", f"{beat_pct:.1f}%")
+                                st.caption(f"随机交易者：{random_trials} 次试验，每次从评估样本中无放回抽取 {min(target_trades, len(forward))} 笔")
+
+                        if len(equity_df) > 30:
+                            ci_df = block_bootstrap_ci(equity_df['策略'], n_boot=2000, ci=0.95, seed=20260214)
+                            st.markdown("### 📐 策略指标95%置信区间（块自助法）")
+                            st.dataframe(ci_df.round(3), use_container_width=True)
 
                         st.markdown("### 🔍 无交易/低收益原因")
                         col_r1, col_r2, col_r3 = st.columns(3)
@@ -1740,10 +1759,24 @@ ret_pct: {recent_ret}
 
                         from abtest_full_engine import optimize_ab_full, optimize_ab_full_walkforward
                         use_walkforward = st.checkbox("使用多折Walk-forward（更稳健）", value=True)
+                        search_labels = {"全网格": "grid", "逐次减半（更快）": "halving"}
+                        search_label = st.selectbox("参数搜索方式", list(search_labels), index=0, key="ab_full_search",
+                                                    help="逐次减半：先在训练集前段淘汰较差组合，只让幸存者回测完整训练集")
                         if use_walkforward:
                             n_splits = st.slider("折数", 2, 5, 3, 1, key="ab_full_splits")
                             val_ratio = st.slider("每折验证比例", 0.1, 0.35, 0.2, 0.05, key="ab_full_val_ratio")
                             top_k = st.slider("每折TopK候选", 5, 50, 20, 5, key="ab_full_top_k")
+                            executor_labels = {"串行": "serial", "多线程": "thread", "多进程": "process"}
+                            executor_label = st.selectbox("并行方式", list(executor_labels), index=1, key="ab_full_executor")
+                            wf_progress = st.progress(0.0, text="Walk-forward 寻优中...")
+                            finished_folds = []
+
+                            def _on_wf_progress(done, total, info):
+                                if info["fold_done"]:
+                                    finished_folds.append(info["fold"])
+                                folds_text = "、".join(f"第{f}折" for f in sorted(finished_folds)) or "无"
+                                wf_progress.progress(done / total, text=f"Walk-forward {done}/{total}，已完成：{folds_text}")
+
                             ab_full = optimize_ab_full_walkforward(
                                 kline_data,
                                 scorer,
@@ -1752,7 +1785,11 @@ ret_pct: {recent_ret}
                                 min_trades=int(min_trades),
                                 fee_bps=float(fee_bps),
                                 top_k=int(top_k),
+                                executor=executor_labels[executor_label],
+                                progress_callback=_on_wf_progress,
+                                search=search_labels[search_label],
                             )
+                            wf_progress.empty()
                         else:
                             ab_full = optimize_ab_full(
                                 kline_data,
@@ -1760,6 +1797,7 @@ ret_pct: {recent_ret}
                                 train_ratio=float(train_ratio_ab),
                                 min_trades=int(min_trades),
                                 fee_bps=float(fee_bps),
+                                search=search_labels[search_label],
                             )
 
                         a = ab_full.get("A")
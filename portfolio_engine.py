@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import BacktestParams, _compute_metrics, score_backtest_columns
+
+
+@dataclass(frozen=True)
+class PortfolioParams:
+    signal: BacktestParams
+    max_positions: int = 10
+    max_weight: float = 0.2  # 单票建仓权重上限（占当日总权益）
+    initial_capital: float = 1.0
+
+
+@dataclass(frozen=True, eq=False)
+class PortfolioPanel:
+    index: pd.DatetimeIndex
+    symbols: list[str]
+    score: np.ndarray  # (T, S) 收盘后评分，窗口不足/停牌为 NaN
+    open: np.ndarray  # (T, S) 停牌为 NaN
+    close: np.ndarray
+    recent_low: np.ndarray  # 近60根最低价，无最低价数据时为 NaN（不做价格过滤）
+    limit_pct: np.ndarray  # (S,) 涨跌停幅度%
+
+
+@dataclass(frozen=True)
+class PortfolioResult:
+    equity_curve: pd.Series
+    trades: list[dict]
+    metrics: dict
+    weights: pd.DataFrame
+
+
+def _as_limit_array(limit_pct: Union[float, dict], symbols: list[str]) -> np.ndarray:
+    # 统一涨跌停幅度，或按代码指定（创业板/科创板 20%，ST 5%），未指定的按 10%
+    if isinstance(limit_pct, dict):
+        return np.array([float(limit_pct.get(s, 10.0)) for s in symbols], dtype=np.float64)
+    return np.full(len(symbols), float(limit_pct), dtype=np.float64)
+
+
+def make_portfolio_panel(
+    score: pd.DataFrame,
+    open_: pd.DataFrame,
+    close: pd.DataFrame,
+    low: Optional[pd.DataFrame] = None,
+    limit_pct: Union[float, dict] = 10.0,
+) -> PortfolioPanel:
+    # 各面板按评分面板的 日期×代码 对齐，缺失视为停牌
+    index = pd.DatetimeIndex(pd.to_datetime(score.index))
+    symbols = [str(c) for c in score.columns]
+
+    def _aligned(frame: pd.DataFrame) -> np.ndarray:
+        out = frame.copy()
+        out.index = pd.to_datetime(out.index)
+        out.columns = [str(c) for c in out.columns]
+        return out.reindex(index=index, columns=symbols).to_numpy(dtype=np.float64)
+
+    score_arr = score.to_numpy(dtype=np.float64)
+    open_arr = _aligned(open_)
+    close_arr = _aligned(close)
+    if low is None:
+        recent_low = np.full_like(close_arr, np.nan)
+    else:
+        recent_low = pd.DataFrame(_aligned(low)).rolling(60, min_periods=1).min().to_numpy()
+    return PortfolioPanel(
+        index=index,
+        symbols=symbols,
+        score=score_arr,
+        open=open_arr,
+        close=close_arr,
+        recent_low=recent_low,
+        limit_pct=_as_limit_array(limit_pct, symbols),
+    )
+
+
+def prepare_portfolio_panel(
+    klines: dict[str, pd.DataFrame],
+    scorer,
+    lookback_days: int = 30,
+    limit_pct: Union[float, dict] = 10.0,
+) -> PortfolioPanel:
+    # 每只股票按自身K线评分（与单票回测相同），评分窗口不足的前 lookback_days-1 根不出信号
+    frames = {name: {} for name in ("score", "open", "close", "low")}
+    for symbol, kline in klines.items():
+        index, columns = score_backtest_columns(kline, scorer, lookback_days)
+        if len(index) == 0:
+            continue
+        keep = ~index.duplicated(keep="last")
+        open_, close, low, score = columns
+        score = score.copy()
+        score[:lookback_days - 1] = np.nan
+        for name, values in (("score", score), ("open", open_), ("close", close), ("low", low)):
+            frames[name][str(symbol)] = pd.Series(values[keep], index=index[keep])
+    if not frames["score"]:
+        empty = pd.DataFrame(index=pd.DatetimeIndex([]), dtype=float)
+        return make_portfolio_panel(empty, empty, empty, empty, limit_pct)
+    panels = {name: pd.DataFrame(series).sort_index() for name, series in frames.items()}
+    return make_portfolio_panel(panels["score"], panels["open"], panels["close"], panels["low"], limit_pct)
+
+
+def _limit_prices(panel: PortfolioPanel) -> tuple[np.ndarray, np.ndarray]:
+    # 涨跌停价以前一有效收盘价为基准，按分取整
+    prev_close = pd.DataFrame(panel.close).ffill().shift(1).to_numpy()
+    up = np.round(prev_close * (1 + panel.limit_pct / 100.0), 2)
+    down = np.round(prev_close * (1 - panel.limit_pct / 100.0), 2)
+    return up, down
+
+
+def simulate_portfolio(panel: PortfolioPanel, params: PortfolioParams) -> PortfolioResult:
+    n, m = panel.score.shape
+    capital = float(params.initial_capital)
+    if n < 2 or m == 0:
+        equity = pd.Series(capital, index=panel.index, dtype=float)
+        metrics = {**_compute_metrics(equity), "交易次数": 0, "胜率%": 0.0, "平均单笔%": 0.0,
+                   "平均持仓数": 0.0, "平均仓位%": 0.0}
+        return PortfolioResult(equity, [], metrics, pd.DataFrame(0.0, index=panel.index, columns=panel.symbols))
+
+    sig = params.signal
+    fee = float(sig.fee_bps) / 10000.0
+    take_profit = float(sig.take_profit_pct) / 100.0
+    stop_loss = float(sig.stop_loss_pct) / 100.0
+    max_hold = int(max(1, sig.max_holding_days))
+    max_positions = int(max(1, params.max_positions))
+    slot_weight = min(float(params.max_weight), 1.0 / max_positions)
+
+    # 与单票回测相同的买入信号（含近低点价格过滤及高分豁免），整块预先计算
+    with np.errstate(invalid="ignore", divide="ignore"):
+        buy_signal = panel.score >= float(sig.buy_threshold)
+        if sig.price_filter_enabled:
+            low = panel.recent_low
+            too_high = (low > 0) & ~((panel.close - low) / low * 100 < float(sig.price_to_low_max_pct))
+            override = panel.score >= float(sig.buy_threshold) + float(sig.high_score_override_margin)
+            buy_signal &= ~too_high | override
+        # 次日开盘成交规则：停牌不成交，开盘即涨停买不进，开盘即跌停卖不出
+        limit_up, limit_down = _limit_prices(panel)
+        valid_open = panel.open > 0
+        can_buy = valid_open & ~(panel.open >= limit_up - 1e-9)
+        can_sell = valid_open & ~(panel.open <= limit_down + 1e-9)
+        traded = ~np.isnan(panel.close)
+        mark = pd.DataFrame(panel.close).ffill().to_numpy()
+
+    shares = np.zeros(m)
+    entry_price = np.zeros(m)
+    holding_days = np.zeros(m, dtype=np.int64)
+    cash = capital
+    equity = np.empty(n)
+    equity[0] = capital
+    weights = np.zeros((n, m))
+    events: list[tuple] = []
+
+    # 信号在第 t 日收盘产生、第 t+1 日开盘成交，当日买入最早次日卖出（T+1）
+    for t in range(n - 1):
+        held = shares > 0
+        mark_t = np.where(held, mark[t], 0.0)
+        equity_t = cash + float(np.dot(shares, mark_t))
+        holding_days[held & traded[t]] += 1
+
+        if held.any():
+            with np.errstate(invalid="ignore", divide="ignore"):
+                pnl = mark[t] / np.where(held, entry_price, np.nan) - 1.0
+            kind = np.select(
+                [pnl >= take_profit, pnl <= stop_loss, panel.score[t] <= float(sig.sell_threshold),
+                 holding_days >= max_hold],
+                [1, 2, 3, 4],
+                0,
+            )
+            sell = held & (kind > 0) & can_sell[t + 1]
+            if sell.any():
+                idx = np.flatnonzero(sell)
+                price = panel.open[t + 1, idx]
+                cost = shares[idx] * entry_price[idx]
+                cash += float(np.sum(shares[idx] * price - fee * cost))
+                ret_pct = (price - entry_price[idx]) / entry_price[idx] * 100
+                events.append((t + 1, idx, kind[idx], price, shares[idx], ret_pct))
+                shares[idx] = 0.0
+                entry_price[idx] = 0.0
+                holding_days[idx] = 0
+
+        free = max_positions - int(np.count_nonzero(shares > 0))
+        if free > 0:
+            cand = ~held & buy_signal[t] & can_buy[t + 1]
+            if cand.any():
+                idx = np.flatnonzero(cand)
+                idx = idx[np.argsort(-panel.score[t, idx], kind="stable")][:free]
+                target = equity_t * slot_weight
+                alloc = np.clip(cash - target * np.arange(len(idx)), 0.0, target)
+                idx, alloc = idx[alloc > 1e-12 * equity_t], alloc[alloc > 1e-12 * equity_t]
+                if len(idx):
+                    price = panel.open[t + 1, idx]
+                    shares[idx] = alloc / price
+                    entry_price[idx] = price
+                    holding_days[idx] = 0
+                    cash -= float(alloc.sum())
+                    events.append((t + 1, idx, np.zeros(len(idx), dtype=np.int64), price, shares[idx], np.zeros(len(idx))))
+
+        value = shares * np.where(shares > 0, mark[t + 1], 0.0)
+        equity[t + 1] = cash + float(value.sum())
+        weights[t + 1] = value / equity[t + 1]
+
+    signals = ("BUY", "SELL-TP", "SELL-SL", "SELL-SCORE", "SELL-TIME")
+    trades: list[dict] = []
+    for pos, idx, kinds, prices, qty, rets in events:
+        date = panel.index[pos]
+        for i, kind, price, q, ret in zip(idx.tolist(), kinds.tolist(), prices.tolist(), qty.tolist(), rets.tolist()):
+            trades.append({"date": date, "symbol": panel.symbols[i], "signal": signals[kind],
+                           "price": price, "shares": q, "return_pct": ret})
+
+    equity_curve = pd.Series(equity, index=panel.index)
+    metrics = _compute_metrics(equity_curve)
+    rets = np.array([t["return_pct"] for t in trades if t["signal"] != "BUY"], dtype=float)
+    metrics["交易次数"] = int(len(rets))
+    metrics["胜率%"] = float((rets > 0).mean() * 100) if len(rets) else 0.0
+    metrics["平均单笔%"] = float(rets.mean()) if len(rets) else 0.0
+    metrics["平均持仓数"] = float((weights > 0).sum(axis=1).mean())
+    metrics["平均仓位%"] = float(weights.sum(axis=1).mean() * 100)
+    return PortfolioResult(
+        equity_curve=equity_curve,
+        trades=trades,
+        metrics=metrics,
+        weights=pd.DataFrame(weights, index=panel.index, columns=panel.symbols),
+    )
+
+
+def run_portfolio_backtest(
+    klines: dict[str, pd.DataFrame],
+    scorer,
+    params: PortfolioParams,
+    lookback_days: int = 30,
+    limit_pct: Union[float, dict] = 10.0,
+) -> PortfolioResult:
+    return simulate_portfolio(prepare_portfolio_panel(klines, scorer, lookback_days, limit_pct), params)
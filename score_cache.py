@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评分序列缓存模块
+按 (股票代码, 公式哈希, 回看窗口) 在磁盘上保存逐K线评分，追加新K线时只对新增尾部评分
+"""
+
+import os
+import re
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# 参与行指纹的K线列
+_KLINE_COLUMNS = ('开盘', '最高', '最低', '收盘', '成交量')
+# 行指纹中各列的乘数（奇数，保证 uint64 乘法可逆）
+_ROW_HASH_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+                                  0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD], dtype=np.uint64)
+
+
+def _normalize_kline(kline: pd.DataFrame) -> pd.DataFrame:
+    """与回测引擎相同的规范化：日期列转为索引并排序"""
+    out = kline.copy()
+    if '日期' in out.columns:
+        out['日期'] = pd.to_datetime(out['日期'])
+        out = out.set_index('日期')
+    else:
+        out.index = pd.to_datetime(out.index)
+    return out.sort_index(kind='stable')
+
+
+def _kline_order(kline: pd.DataFrame) -> np.ndarray:
+    """_normalize_kline 排序后每一行对应的原始行号"""
+    dates = pd.to_datetime(kline['日期'] if '日期' in kline.columns else kline.index)
+    return np.argsort(np.asarray(dates, dtype='datetime64[ns]'), kind='stable')
+
+
+def row_fingerprints(kline: pd.DataFrame) -> np.ndarray:
+    """
+    逐行计算K线内容指纹
+
+    用于判断缓存覆盖的K线是否被修订（如复权价格整体变化），任一价格或成交量变化即指纹不同。
+
+    Args:
+        kline: 已规范化的K线数据
+
+    Returns:
+        uint64 数组，每根K线一个指纹
+    """
+    n = len(kline)
+    acc = np.zeros(n, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for col, mult in zip(_KLINE_COLUMNS, _ROW_HASH_MULTIPLIERS):
+            if col not in kline.columns:
+                continue
+            bits = np.ascontiguousarray(kline[col].to_numpy(dtype=np.float64)).view(np.uint64)
+            acc = (acc ^ (bits * mult)) * np.uint64(0x100000001B3)
+        acc ^= acc >> np.uint64(29)
+    return acc
+
+
+class ScoreCache:
+    """
+    评分序列缓存
+
+    每个 (代码, 公式哈希, 回看窗口) 对应一个 .npz 文件，保存日期、行指纹与 float32 评分。
+    查询的K线与缓存重叠部分日期和指纹一致时直接复用，只对缓存之外的K线评分；
+    新K线接在缓存末尾时把新增评分追加写回，重叠部分被修订时按最新数据整体重建。
+    """
+
+    def __init__(self, cache_dir: str = './cache/score_series'):
+        """
+        初始化评分缓存
+
+        Args:
+            cache_dir: 缓存目录
+        """
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _get_cache_path(self, symbol: str, formula_hash: str, lookback: int) -> str:
+        """
+        获取缓存文件路径
+
+        Args:
+            symbol: 股票代码
+            formula_hash: 评分公式哈希
+            lookback: 回看窗口
+
+        Returns:
+            缓存文件路径
+        """
+        safe_symbol = re.sub(r'[^\w.-]', '_', str(symbol))
+        return os.path.join(self.cache_dir, f"{safe_symbol}_{formula_hash}_{int(lookback)}.npz")
+
+    def _load(self, path: str) -> Optional[Dict[str, np.ndarray]]:
+        """读取缓存条目，文件不存在或损坏时返回None"""
+        from logger import exception
+
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return {key: data[key] for key in ('dates', 'fingerprints', 'scores')}
+        except Exception as e:
+            exception(f"读取评分缓存失败: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _save(self, path: str, dates: np.ndarray, fingerprints: np.ndarray, scores: np.ndarray) -> None:
+        """原子写入缓存条目（先写临时文件再替换）"""
+        from logger import exception
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, dates=dates, fingerprints=fingerprints, scores=scores.astype(np.float32))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            exception(f"写入评分缓存失败: {e}")
+
+    def get_scores(self, symbol: str, scorer, kline: pd.DataFrame, lookback: int = 30) -> pd.Series:
+        """
+        获取逐K线评分（与 scorer.score_series(kline, lookback)['score'] 一致，精度为 float32）
+
+        Args:
+            symbol: 股票代码
+            scorer: DynamicScorer 实例
+            kline: K线数据
+            lookback: 回看窗口
+
+        Returns:
+            评分序列，索引为规范化后的日期
+        """
+        from logger import debug
+
+        kl = _normalize_kline(kline)
+        n = len(kl)
+        if n == 0:
+            return pd.Series(dtype=np.float64, index=kl.index, name='score')
+
+        dates = kl.index.as_unit('ns').asi8
+        fingerprints = row_fingerprints(kl)
+        path = self._get_cache_path(symbol, scorer.plan.formula_hash, lookback)
+        entry = self._load(path)
+
+        # 查询K线在缓存中的起点 pos 与可复用的重叠长度 m
+        pos, m = 0, 0
+        if entry is not None:
+            pos = int(np.searchsorted(entry['dates'], dates[0]))
+            m = min(n, len(entry['dates']) - pos)
+            if m <= 0 or not (np.array_equal(entry['dates'][pos:pos + m], dates[:m])
+                              and np.array_equal(entry['fingerprints'][pos:pos + m], fingerprints[:m])):
+                m = 0
+
+        scores = np.full(n, np.nan)
+        if m > 0:
+            scores[:m] = entry['scores'][pos:pos + m]
+            # 查询起点晚于缓存起点时，前 lookback-1 根的窗口在查询K线内不完整，需单独评分
+            if pos > 0:
+                head = min(n, lookback - 1)
+                scores[:head] = scorer.score_series(kl.iloc[:head], lookback)['score'].to_numpy()
+        if m < n:
+            start = max(0, m - lookback + 1)
+            tail = scorer.score_series(kl.iloc[start:], lookback)['score'].to_numpy()
+            scores[m:] = tail[m - start:]
+        scores = scores.astype(np.float32)
+
+        if m == n:
+            self.hits += 1
+            debug(f"评分缓存命中: {symbol}")
+        else:
+            self.misses += 1
+            debug(f"评分缓存增量评分: {symbol} {n - m} 根")
+            if m > 0 and (pos == 0 or m >= lookback - 1):
+                # 新K线接在缓存末尾：追加新增部分
+                self._save(path,
+                           np.concatenate([entry['dates'][:pos + m], dates[m:]]),
+                           np.concatenate([entry['fingerprints'][:pos + m], fingerprints[m:]]),
+                           np.concatenate([entry['scores'][:pos + m], scores[m:]]))
+            elif m == 0 and (entry is None or dates[-1] >= entry['dates'][-1]):
+                # 无缓存或缓存数据已被修订：以最新K线整体重建
+                self._save(path, dates, fingerprints, scores)
+
+        return pd.Series(scores.astype(np.float64), index=kl.index, name='score')
+
+    def clear(self, symbol: Optional[str] = None) -> int:
+        """
+        清除评分缓存
+
+        Args:
+            symbol: 股票代码，None清除所有
+
+        Returns:
+            删除的缓存文件数
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        prefix = None if symbol is None else re.sub(r'[^\w.-]', '_', str(symbol)) + '_'
+        removed = 0
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.npz') and (prefix is None or filename.startswith(prefix)):
+                os.remove(os.path.join(self.cache_dir, filename))
+                removed += 1
+        return removed
+
+
+class CachedScorer:
+    """
+    带评分缓存的评分器包装
+
+    score_series 经 ScoreCache 读取（只返回 score 列），其余属性与方法透传给原评分器，
+    可直接传给 run_backtest / optimize_ab_full_walkforward 等接受评分器的函数。
+    """
+
+    def __init__(self, scorer, symbol: str, cache: Optional[ScoreCache] = None):
+        """
+        Args:
+            scorer: DynamicScorer 实例
+            symbol: 股票代码
+            cache: 评分缓存，None使用全局实例
+        """
+        self.scorer = scorer
+        self.symbol = symbol
+        self.cache = cache if cache is not None else get_score_cache()
+
+    def score_series(self, kline_data: pd.DataFrame, lookback: int = 30) -> pd.DataFrame:
+        scores = self.cache.get_scores(self.symbol, self.scorer, kline_data, lookback).to_numpy()
+        # 缓存按日期排序返回，按原始行顺序放回
+        values = np.empty(len(scores))
+        values[_kline_order(kline_data)] = scores
+        return pd.DataFrame({'score': values}, index=kline_data.index)
+
+    def __getattr__(self, name):
+        # 反序列化时 scorer 尚未设置，避免递归
+        if name == 'scorer':
+            raise AttributeError(name)
+        return getattr(self.scorer, name)
+
+
+# 全局评分缓存实例
+score_cache = ScoreCache()
+
+
+def get_score_cache() -> ScoreCache:
+    """
+    获取评分缓存实例
+
+    Returns:
+        评分缓存实例
+    """
+    return score_cache
+
+
+def cached_score_series(symbol: str, scorer, kline: pd.DataFrame, lookback: int = 30) -> pd.Series:
+    """
+    获取带缓存的逐K线评分
+
+    Args:
+        symbol: 股票代码
+        scorer: DynamicScorer 实例
+        kline: K线数据
+        lookback: 回看窗口
+
+    Returns:
+        评分序列
+    """
+    return score_cache.get_scores(symbol, scorer, kline, lookback)
@@ -7,14 +7,18 @@
 
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional
+import threading
+from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime
 
 # 导入各模块
 from data_source import EastMoneyData, get_quotes, get_kline, get_index
 from fundamental import FundamentalSelector
-from chanlun_engine import ChanQuantEngine
+from chanlun_engine import ChanQuantEngine, IncrementalChanEngine, analyze_universe
+from chanlun_mtf import analyze_multi_timeframe, LEVEL_NAMES
 from sector_analysis import SectorAnalysis, SectorSelector
+from indicators import get_indicator_memo
 
 
 class ComprehensiveSelector:
@@ -28,6 +32,12 @@ class ComprehensiveSelector:
     - 板块效应: 强势板块领涨股
     """
     
+    # 按 (股票代码, 笔阈值, 是否用MACD) 缓存的增量缠论引擎（类级共享，页面每次新建选股器时仍可复用）
+    # 各页面会话在不同线程中运行：_chan_lock 保护 LRU 字典，每个引擎另有一把锁保护 sync 与读取结果
+    CHAN_CACHE_SIZE = 500
+    _chan_engines: "OrderedDict[tuple, Tuple[IncrementalChanEngine, threading.Lock]]" = OrderedDict()
+    _chan_lock = threading.Lock()
+    
     def __init__(self):
         self.em = EastMoneyData()
         self.fs = FundamentalSelector()
@@ -93,12 +103,13 @@ class ComprehensiveSelector:
             if kline is None or len(kline) < 60:
                 return result
             
-            # 计算技术指标
+            # 计算技术指标（均线经指标缓存复用，追加新K线时增量计算）
             close = kline['收盘']
+            cached = get_indicator_memo().get(kline, ('MA20', 'MA60'), symbol=symbol)
             
             # 均线判断
-            ma20 = close.rolling(20).mean()
-            ma60 = close.rolling(60).mean()
+            ma20 = cached['MA20']
+            ma60 = cached['MA60']
             
             if ma20.iloc[-1] > ma60.iloc[-1]:
                 result['趋势'] = '多头↑'
@@ -150,6 +161,21 @@ class ComprehensiveSelector:
         
         return result
     
+    def _get_chan_engine(self, symbol: str) -> Tuple[IncrementalChanEngine, threading.Lock]:
+        """获取股票的增量缠论引擎及其锁（LRU淘汰），使用引擎时需持有该锁"""
+        key = (symbol, self.chan.bi_threshold, self.chan.use_macd)
+        engines = ComprehensiveSelector._chan_engines
+        with ComprehensiveSelector._chan_lock:
+            cached = engines.get(key)
+            if cached is None:
+                engine = IncrementalChanEngine(bi_threshold=self.chan.bi_threshold, use_macd=self.chan.use_macd)
+                cached = engines[key] = (engine, threading.Lock())
+            else:
+                engines.move_to_end(key)
+            while len(engines) > self.CHAN_CACHE_SIZE:
+                engines.popitem(last=False)
+        return cached
+    
     def analyze_stock_chanlun(self, symbol: str) -> Dict:
         """
         分析单只股票的缠论结构
@@ -173,18 +199,19 @@ class ComprehensiveSelector:
                 '最高': 'high', '最低': 'low'
             })
             
-            # 运行缠论分析
-            self.chan.run(df)
-            
-            # 获取结果
-            summary = self.chan.get_summary()
+            # 运行缠论分析（只增量推入上次分析之后的新K线），持锁期间取出全部结果
+            chan, chan_lock = self._get_chan_engine(symbol)
+            with chan_lock:
+                chan.sync(df)
+                summary = chan.get_summary()
+                bi_list = chan.get_bi_list()
+                signals = chan.signals.copy()
             result['笔数'] = summary['bi_count']
             result['中枢数'] = summary['zhongshu_count']
             
             # 结构判断
             if summary['zhongshu_count'] > 0:
                 # 有中枢，看当前笔的方向
-                bi_list = self.chan.get_bi_list()
                 if bi_list:
                     last_bi = bi_list[-1]
                     if last_bi['direction'] == 'up':
@@ -197,7 +224,6 @@ class ComprehensiveSelector:
                 result['结构'] = '无中枢'
             
             # 买卖点信号
-            signals = self.chan.signals
             if len(signals) > 0:
                 for idx, row in signals.iterrows():
                     result['信号'].append(f"{row['signal']}:{row['price']:.2f}")
@@ -207,6 +233,75 @@ class ComprehensiveSelector:
         
         return result
     
+    def analyze_stock_chanlun_mtf(self, symbol: str, base_period: str = '5',
+                                  start_date: str = None) -> Dict:
+        """
+        多级别缠论分析：只拉取一条分钟线，本地重采样为 30分钟/60分钟/日线/周线
+        
+        Args:
+            symbol: 股票代码
+            base_period: 基础K线周期（EastMoney klt，如 '5' 为5分钟线）
+            start_date: 开始日期 'YYYYMMDD'
+        
+        Returns:
+            Dict: 各级别笔/中枢/信号数量与区间套信号列表
+        """
+        result = {'symbol': symbol, '级别': {}, '区间套': []}
+        try:
+            kline = self.em.get_stock_kline(symbol, start_date=start_date, period=base_period)
+            if kline is None or len(kline) == 0:
+                return result
+            df = kline.rename(columns={
+                '开盘': 'open', '收盘': 'close',
+                '最高': 'high', '最低': 'low',
+                '成交量': 'volume', '成交额': 'amount'
+            })
+            mtf = analyze_multi_timeframe(df, bi_threshold=self.chan.bi_threshold, use_macd=self.chan.use_macd)
+            for freq, level in mtf['levels'].items():
+                summary = level['summary']
+                result['级别'][level['name']] = {
+                    '笔数': summary['bi_count'],
+                    '中枢数': summary['zhongshu_count'],
+                    '信号数': summary['signal_count'],
+                }
+            for row in mtf['nesting'].itertuples(index=False):
+                result['区间套'].append({
+                    '级别': LEVEL_NAMES[row.level],
+                    '日期': str(row.date),
+                    '信号': row.signal,
+                    '价格': row.price,
+                    '低级别确认': [f"{LEVEL_NAMES[f]}:{s}@{d}" for f, d, s, _ in row.lower_signals],
+                })
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+    
+    def scan_chanlun(self, symbols: List[str], workers: Optional[int] = None) -> pd.DataFrame:
+        """
+        批量缠论扫描（多进程）
+        
+        Args:
+            symbols: 股票代码列表
+            workers: 进程数，默认CPU核数
+        
+        Returns:
+            DataFrame: 每只股票的缠论摘要、信号与耗时，见 chanlun_engine.analyze_universe
+        """
+        klines = {}
+        for symbol in symbols:
+            try:
+                kline = self.em.get_stock_kline(symbol, start_date='20240101')
+            except Exception:
+                kline = None
+            if kline is None or len(kline) < 100:
+                continue
+            klines[symbol] = kline.rename(columns={
+                '开盘': 'open', '收盘': 'close',
+                '最高': 'high', '最低': 'low'
+            })
+        return analyze_universe(klines, workers=workers,
+                                bi_threshold=self.chan.bi_threshold, use_macd=self.chan.use_macd)
+    
     def comprehensive_analysis(self, symbols: List[str] = None, top_n: int = 20) -> pd.DataFrame:
         """
         综合分析选股
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试阈值扫描：累计和结果与逐阈值筛选一致
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from abtest_engine import (_threshold_candidates, optimize_on_train_pick_on_val, perf_metrics,
+                           simulate_equity_from_eval_df, simulate_metrics_from_eval_df, threshold_sweep)
+
+
+def make_eval_df(n: int, seed: int = 0) -> pd.DataFrame:
+    """生成评分按5分取整（大量并列）的评估样本"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '日期': pd.bdate_range('2019-01-01', periods=n),
+        '评分': np.round(rng.uniform(0, 100, n) / 5) * 5,
+        '未来收益': rng.normal(0.2, 3, n),
+    })
+
+
+def test_sweep_matches_filtering():
+    """每个阈值的样本数、胜率、平均收益与 df[评分>=阈值] 一致"""
+    df = make_eval_df(800, seed=1)
+    df.loc[5, '评分'] = np.nan
+    df.loc[7, '未来收益'] = np.nan
+    for thresholds in (None, 'all', np.linspace(-10, 110, 241)):
+        curve = threshold_sweep(df, thresholds)
+        assert curve['threshold'].is_monotonic_increasing
+        for row in curve.itertuples():
+            subset = df[df['评分'] >= row.threshold]
+            assert row.samples == len(subset)
+            if len(subset):
+                assert np.isclose(row.win_rate, (subset['未来收益'] > 0).mean() * 100)
+                assert np.isclose(row.avg_return, subset['未来收益'].mean())
+            else:
+                assert row.win_rate == 0.0 and row.avg_return == 0.0
+
+
+def test_default_grid_matches_quantiles():
+    """默认网格为 50%~98% 分位数，候选阈值按最少样本数过滤"""
+    df = make_eval_df(500, seed=2)
+    quantiles = sorted(set(float(df['评分'].quantile(q)) for q in np.linspace(0.5, 0.98, 25)))
+    assert threshold_sweep(df)['threshold'].tolist() == quantiles
+    assert _threshold_candidates(df, 100) == [th for th in quantiles if (df['评分'] >= th).sum() >= 100]
+
+
+def test_optimize_returns_threshold_curve():
+    """寻优结果附带训练集完整阈值曲线"""
+    df = make_eval_df(600, seed=3)
+    res, grid = optimize_on_train_pick_on_val(df, '平衡')
+    curve = grid.attrs['threshold_curve']
+    assert curve['threshold'].tolist() == sorted(df.iloc[:420]['评分'].unique())
+    assert res.config.buy_threshold in set(grid['buy_threshold'])
+
+
+def test_metrics_without_equity():
+    """只求指标时与 perf_metrics(净值序列) 一致（含未来收益缺失导致的 NaN 资金）"""
+    df = make_eval_df(400, seed=4)
+    df.loc[300, '未来收益'] = np.nan
+    for th in (20, 50, 80, 101):
+        for hold in (1, 5):
+            eq, trades = simulate_equity_from_eval_df(df, th, hold)
+            m, n = simulate_metrics_from_eval_df(df, th, hold)
+            expected = perf_metrics(eq)
+            assert n == trades and m.keys() == expected.keys()
+            assert all(np.isclose(m[k], expected[k], rtol=1e-12, atol=1e-12) for k in expected)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
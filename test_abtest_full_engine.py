@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多折 Walk-forward 寻优在不同执行方式下结果一致，逐次减半搜索与全网格评分可比
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from abtest_full_engine import _search_one_range, optimize_ab_full, optimize_ab_full_walkforward, CandidateSpace
+from backtest_engine import BacktestParams, run_backtest_grid, run_backtest_grid_columns, score_backtest_columns
+from dynamic_scorer import DynamicScorer
+from test_dynamic_scorer import FORMULA, make_daily
+
+
+SPACE = CandidateSpace(buy_thresholds=[40, 50, 60], sell_gap=12, holding_days=[5, 10],
+                       take_profit_pcts=[8], stop_loss_pcts=[-4, -6])
+
+
+def _assert_same(left, right):
+    assert left["folds"] == right["folds"]
+    assert left["stability"] == right["stability"]
+    assert [left[k] for k in ("winner_high", "winner_stable", "winner_balance")] == \
+        [right[k] for k in ("winner_high", "winner_stable", "winner_balance")]
+    for side in ("A", "B"):
+        if left[side] is None:
+            assert right[side] is None
+            continue
+        for key in ("params", "train", "val"):
+            assert left[side][key] == right[side][key]
+        pd.testing.assert_series_equal(left[side]["val_equity"], right[side]["val_equity"])
+        pd.testing.assert_frame_equal(left[side]["grid"], right[side]["grid"])
+
+
+def test_columns_match_sliced_backtest():
+    """全序列评分一次后按区间截取，与对区间切片重新评分回测一致"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(360, seed=8)
+    index, columns = score_backtest_columns(kl, scorer)
+    params_list = [BacktestParams(buy, buy - 12, 7, 8, -5) for buy in (40, 55)]
+    for start, end in ((None, None), (kl.index[40], kl.index[250]), (kl.index[300], None), (kl.index[0], kl.index[20])):
+        expected = run_backtest_grid(kl, scorer, params_list, start_date=start, end_date=end)
+        actual = run_backtest_grid_columns(index, columns, params_list, start_date=start, end_date=end)
+        for e, a in zip(expected, actual):
+            assert e.trades == a.trades and e.metrics == a.metrics
+            pd.testing.assert_series_equal(e.equity_curve, a.equity_curve)
+
+
+def test_walkforward_executors_deterministic():
+    """串行、线程、进程及外部执行器结果相同，且与逐折逐侧搜索一致"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(520, seed=11)
+    kwargs = dict(n_splits=3, min_trades=3, space_a=SPACE, space_b=SPACE, objective_b="平衡", top_k=4)
+    serial = optimize_ab_full_walkforward(kl, scorer, **kwargs)
+    assert len(serial["folds"]) == 3
+
+    fold = serial["folds"][0]
+    a, _ = _search_one_range(kl, scorer, pd.Timestamp(fold["训练起"]), pd.Timestamp(fold["训练止"]),
+                             pd.Timestamp(fold["验证起"]), pd.Timestamp(fold["验证止"]),
+                             space=SPACE, objective="求高", min_trades=3, fee_bps=10.0, top_k=4)
+    assert a is not None and fold["A_buy"] == a["params"].buy_threshold
+    assert np.isclose(fold["A_年化%"], a["val"]["年化收益%"])
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for executor in ("thread", "process", pool):
+            _assert_same(serial, optimize_ab_full_walkforward(kl, scorer, executor=executor, max_workers=2, **kwargs))
+
+
+def test_walkforward_progress_callback():
+    """每个 (折, A/B) 任务完成时回调一次，每折两侧均完成时标记 fold_done"""
+    calls = []
+    optimize_ab_full_walkforward(make_daily(520, seed=11), DynamicScorer(FORMULA), n_splits=3, min_trades=3,
+                                 space_a=SPACE, space_b=SPACE, executor="thread", max_workers=2,
+                                 progress_callback=lambda done, total, info: calls.append((done, total, info)))
+    assert [(done, total) for done, total, _ in calls] == [(i, 6) for i in range(1, 7)]
+    assert sorted((info["fold"], info["side"]) for _, _, info in calls) == \
+        [(f, s) for f in (1, 2, 3) for s in ("A", "B")]
+    assert sorted(info["fold"] for _, _, info in calls if info["fold_done"]) == [1, 2, 3]
+
+
+def test_halving_scores_comparable_with_grid():
+    """逐次减半：各轮在训练集前段上淘汰，窗口递增、组合递减；幸存组合的训练评分与全网格完全一致"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(900, seed=13)
+    space = CandidateSpace(buy_thresholds=[35, 40, 45, 50, 55, 60], sell_gap=12, holding_days=[3, 5, 10],
+                           take_profit_pcts=[6, 8, 10], stop_loss_pcts=[-3, -5])
+    index, columns = score_backtest_columns(kl, scorer)
+    calls = []
+
+    def runner(params_list, start_dt, end_dt, with_equity=True):
+        calls.append((len(params_list), end_dt, with_equity))
+        return run_backtest_grid_columns(index, columns, params_list, start_date=start_dt, end_date=end_dt,
+                                         with_equity=with_equity)
+
+    dates = [kl.index[i] for i in (0, 629, 630, 899)]
+    kwargs = dict(space=space, objective="平衡", min_trades=4, fee_bps=10.0, top_k=5)
+    res, grid = _search_one_range(kl, scorer, *dates, search="halving", halving_min_bars=60,
+                                  grid_runner=runner, index=index, **kwargs)
+    _, full_grid = _search_one_range(kl, scorer, *dates, **kwargs)
+    rungs = grid.attrs["halving"]
+    assert rungs["candidates"].tolist() == [108, 36] and rungs["kept"].tolist() == [36, 12]
+    assert rungs["bars"].tolist() == [70, 210] and rungs["train_end"].tolist() == [kl.index[69], kl.index[209]]
+    assert [c[0] for c in calls[:3]] == [108, 36, 12] and calls[2][1] == dates[1]
+    assert not any(with_equity for _, _, with_equity in calls[:3])
+
+    cols = ["buy", "sell", "hold", "tp", "sl", "train_score", "train_ann", "train_sharpe", "train_mdd", "train_trades"]
+    merged = grid[cols].merge(full_grid[cols], on=["buy", "sell", "hold", "tp", "sl"], suffixes=("", "_full"))
+    assert len(merged) == len(grid) and len(grid) <= 12
+    for col in cols[5:]:
+        assert np.array_equal(merged[col].to_numpy(), merged[f"{col}_full"].to_numpy())
+    assert res["val_equity"] is not None and res["params"].buy_threshold in set(grid["buy"])
+
+
+def test_halving_small_space_equals_grid():
+    """训练集过短或组合过少、无法减半时与全网格完全一致，optimize_ab_full 与 walk-forward 均可选用"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(520, seed=11)
+    grid_res = optimize_ab_full(kl, scorer, min_trades=3, space_a=SPACE, space_b=SPACE)
+    halving_res = optimize_ab_full(kl, scorer, min_trades=3, space_a=SPACE, space_b=SPACE, search="halving")
+    for side in ("A", "B"):
+        assert grid_res[side]["params"] == halving_res[side]["params"]
+        assert grid_res[side]["val"] == halving_res[side]["val"]
+    kwargs = dict(n_splits=3, min_trades=3, space_a=SPACE, space_b=SPACE, top_k=4)
+    _assert_same(optimize_ab_full_walkforward(kl, scorer, **kwargs),
+                 optimize_ab_full_walkforward(kl, scorer, search="halving", **kwargs))
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试回测内核与原逐窗口回测结果一致
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (BacktestParams, MetricsAccumulator, _compute_metrics, block_bootstrap_ci, prepare_backtest_arrays,
+                             random_trader_returns, run_backtest, run_backtest_grid, simulate_backtest, simulate_grid)
+from dynamic_scorer import DynamicScorer
+from test_dynamic_scorer import FORMULA, make_daily
+
+
+def reference_backtest(kl, window_scores, params, lookback_days=30):
+    """原 run_backtest 的逐窗口实现，作为对照；window_scores[i] 为 kl.iloc[i:i+lookback_days] 的评分"""
+    fee = params.fee_bps / 10000.0
+    holding, entry_price, holding_days, capital = False, 0.0, 0, 1.0
+    trades, equity_points = [], [(kl.index[0], capital)]
+    for i in range(len(kl) - lookback_days - 1):
+        w = kl.iloc[i:i + lookback_days]
+        score = float(window_scores[i])
+        cur_close, cur_date = float(w["收盘"].iloc[-1]), w.index[-1]
+        next_open, next_date = float(kl["开盘"].iloc[i + lookback_days]), kl.index[i + lookback_days]
+        if not holding:
+            if score >= params.buy_threshold and next_open > 0:
+                allow_buy = True
+                if params.price_filter_enabled:
+                    recent_low = float(kl.loc[:cur_date].tail(60)["最低"].min())
+                    if recent_low > 0:
+                        allow_buy = (cur_close - recent_low) / recent_low * 100 < params.price_to_low_max_pct
+                    if not allow_buy and score >= params.buy_threshold + params.high_score_override_margin:
+                        allow_buy = True
+                if allow_buy:
+                    holding, entry_price, holding_days = True, next_open, 0
+                    trades.append({"date": next_date, "signal": "BUY", "price": entry_price, "return_pct": 0.0, "capital": capital})
+        else:
+            holding_days += 1
+            pnl = (cur_close - entry_price) / entry_price
+            reason = ("TP" if pnl >= params.take_profit_pct / 100.0 else
+                      "SL" if pnl <= params.stop_loss_pct / 100.0 else
+                      "SCORE" if score <= params.sell_threshold else
+                      "TIME" if holding_days >= max(1, params.max_holding_days) else "")
+            if reason and next_open > 0:
+                ret_pct = (next_open - entry_price) / entry_price * 100
+                capital *= (1 + ret_pct / 100.0 - fee)
+                equity_points.append((next_date, capital))
+                trades.append({"date": next_date, "signal": f"SELL-{reason}", "price": next_open, "return_pct": ret_pct, "capital": capital})
+                holding, entry_price, holding_days = False, 0.0, 0
+    equity = pd.Series([p[1] for p in equity_points], index=pd.to_datetime([p[0] for p in equity_points]))
+    equity = equity.reindex(kl.index).ffill().fillna(1.0)
+    return trades, equity, _compute_metrics(equity)
+
+
+def test_kernel_matches_reference():
+    """数组内核与逐窗口回测的交易、净值、指标完全一致"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(260, seed=2)
+    arrays = prepare_backtest_arrays(kl, scorer)
+    window_scores = [scorer.calculate_score_detail(kl.iloc[i:i + 30])[0] for i in range(len(kl) - 30)]
+    grid = itertools.product((45, 60), (35, 50), (3, 10), (5, 15), (True, False))
+    for buy, sell, hold, tp, price_filter in grid:
+        params = BacktestParams(buy_threshold=buy, sell_threshold=sell, max_holding_days=hold,
+                                take_profit_pct=tp, stop_loss_pct=-5, price_filter_enabled=price_filter,
+                                price_to_low_max_pct=12.0)
+        trades, equity, metrics = reference_backtest(kl, window_scores, params)
+        result = simulate_backtest(arrays, params)
+        assert result.trades == trades
+        pd.testing.assert_series_equal(result.equity_curve, equity, check_freq=False)
+        assert {k: result.metrics[k] for k in metrics} == metrics
+
+
+def test_prepare_arrays_recent_low():
+    """近60根最低价为截至当日（含）的滚动最低价"""
+    kl = make_daily(120, seed=5)
+    arrays = prepare_backtest_arrays(kl, DynamicScorer(FORMULA))
+    for t in (0, 30, 59, 60, 119):
+        assert arrays.recent_low[t] == kl["最低"].iloc[max(0, t - 59):t + 1].min()
+    assert np.isnan(arrays.score).sum() == 0
+
+
+def test_simulate_grid_matches_single_runs():
+    """网格一次模拟全部参数组合，与逐个回测结果一致"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(400, seed=7)
+    arrays = prepare_backtest_arrays(kl, scorer)
+    params_list = [
+        BacktestParams(buy_threshold=buy, sell_threshold=buy - 15, max_holding_days=hold,
+                       take_profit_pct=tp, stop_loss_pct=sl, fee_bps=fee, price_filter_enabled=price_filter)
+        for buy, hold, tp, sl, fee, price_filter in itertools.product(
+            (30, 45, 60, 70), (3, 7, 14), (6, 10), (-4, -6), (10.0, 0.0), (True, False))
+    ]
+    for grid_res, params in zip(simulate_grid(arrays, params_list), params_list):
+        single = simulate_backtest(arrays, params)
+        assert grid_res.trades == single.trades
+        assert grid_res.metrics == single.metrics
+        pd.testing.assert_series_equal(grid_res.equity_curve, single.equity_curve)
+
+
+def test_run_backtest_short_kline():
+    """数据不足时返回空结果"""
+    res = run_backtest(make_daily(30), DynamicScorer(FORMULA), BacktestParams(60, 45, 10, 8, -5))
+    assert res.trades == [] and res.metrics["交易次数"] == 0 and len(res.equity_curve) == 0
+    grid = run_backtest_grid(make_daily(30), DynamicScorer(FORMULA), [BacktestParams(60, 45, 10, 8, -5)] * 2)
+    assert [r.metrics for r in grid] == [res.metrics] * 2
+
+
+def test_random_trader_returns():
+    """每次试验无放回抽样并复利；全部抽中时各次试验结果相同，种子固定可复现"""
+    forward = np.random.default_rng(7).normal(0.2, 4, 300)
+    totals = random_trader_returns(forward, 25, n_trials=5000, seed=1)
+    assert totals.shape == (5000,)
+    assert np.array_equal(totals, random_trader_returns(forward, 25, n_trials=5000, seed=1))
+    assert np.allclose(random_trader_returns(forward, 500, n_trials=3, seed=2), (np.prod(1 + forward / 100) - 1) * 100)
+    # 互不相同的收益值：无放回时任一结果都不会超过最大的 25 笔之积
+    best = (np.prod(1 + np.sort(forward)[-25:] / 100) - 1) * 100
+    assert totals.max() <= best + 1e-9
+    assert np.isclose(np.median(totals), np.median([(np.prod(1 + np.random.default_rng(s).choice(forward, 25, replace=False) / 100) - 1) * 100
+                                                    for s in range(2000)]), atol=1.5)
+
+
+def test_block_bootstrap_ci():
+    """置信区间包含点估计，点估计与 _compute_metrics 一致；整段作为一块时区间退化为点估计"""
+    rng = np.random.default_rng(3)
+    equity = pd.Series(np.cumprod(1 + rng.normal(0.0005, 0.01, 500)), index=pd.bdate_range("2021-01-01", periods=500))
+    ci = block_bootstrap_ci(equity, n_boot=1000, seed=4)
+    metrics = _compute_metrics(equity)
+    assert list(ci.index) == ["总收益率%", "夏普", "最大回撤%"]
+    for name in ci.index:
+        assert ci.loc[name, "估计"] == metrics[name]
+        assert ci.loc[name, "下限"] <= ci.loc[name, "估计"] <= ci.loc[name, "上限"]
+    # 单块循环重抽只改变日收益的起点，总收益与夏普（与点估计同一日收益序列）均不变
+    whole = block_bootstrap_ci(equity, n_boot=50, block_size=500, seed=5)
+    assert np.allclose(whole.loc["总收益率%", ["下限", "上限"]], whole.loc["总收益率%", "估计"])
+    assert np.allclose(whole.loc["夏普", ["下限", "上限"]], whole.loc["夏普", "估计"], rtol=1e-9)
+    assert block_bootstrap_ci(equity.iloc[:2]).loc["夏普", ["下限", "上限"]].isna().all()
+
+
+def test_metrics_accumulator_matches_compute_metrics():
+    """在线累计（含整段净值不变的K线）与 _compute_metrics 对完整净值序列的结果一致"""
+    rng = np.random.default_rng(11)
+    index = pd.bdate_range("2020-01-01", periods=400)
+    values = np.ones(len(index))
+    acc = MetricsAccumulator.start()
+    last = 0
+    for pos in sorted(rng.choice(np.arange(1, 400), 40, replace=False)):
+        values[pos:] = values[pos - 1] * (1 + rng.normal(0, 0.03))
+        acc.hold(pos - last - 1)
+        acc.update(values[pos])
+        last = pos
+    acc.hold(len(index) - 1 - last)
+    expected = _compute_metrics(pd.Series(values, index=index))
+    got = acc.metrics(index[0], index[-1])
+    assert got.keys() == expected.keys()
+    assert all(np.isclose(got[k], expected[k], rtol=1e-12, atol=1e-12) for k in expected)
+    assert MetricsAccumulator.start().metrics(index[0], index[0]) == {k: 0.0 for k in expected}
+
+
+def test_grid_without_equity():
+    """不构造净值时交易一致、指标与构造净值的结果在浮点误差内一致，单次与网格完全一致"""
+    kl = make_daily(400, seed=12)
+    arrays = prepare_backtest_arrays(kl, DynamicScorer(FORMULA))
+    params_list = [BacktestParams(b, b - 12, h, 8, -5) for b in (45, 55, 65) for h in (3, 10)]
+    full = simulate_grid(arrays, params_list)
+    lite = simulate_grid(arrays, params_list, with_equity=False)
+    for params, f, l in zip(params_list, full, lite):
+        assert l.equity_curve is None and l.trades == f.trades
+        assert all(np.isclose(l.metrics[k], f.metrics[k], rtol=1e-12, atol=1e-12) for k in f.metrics)
+        assert simulate_backtest(arrays, params, with_equity=False).metrics == l.metrics
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
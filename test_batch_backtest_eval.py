@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量评估的结果日志：已完成的代码重跑时跳过，出错的代码重试
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import json
+import tempfile
+
+import batch_backtest_eval as bbe
+
+
+KWARGS = dict(start_date="20240101", end_date="20250101", horizon_days=7, train_ratio=0.7, min_val_samples=30)
+
+
+def _fake_eval(calls):
+    def _eval(symbol, **kwargs):
+        calls.append(symbol)
+        if symbol == "BAD":
+            raise RuntimeError("boom")
+        if symbol == "EMPTY":
+            return None
+        return bbe.EvalResult(symbol, 100, 70, 30, 65.0, 7, 1.0, 60.0, 5, 2.0, 0.5)
+    return _eval
+
+
+def test_journal_resume():
+    """重跑只评估未完成与出错的代码，中断留下的半行不影响读取"""
+    original = bbe.eval_one_symbol
+    calls = []
+    bbe.eval_one_symbol = _fake_eval(calls)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = os.path.join(tmp, "journal.jsonl")
+            res = bbe.run_batch(["A", "BAD", "EMPTY", "B"], KWARGS, journal=journal, workers=1)
+            assert [r.symbol for r in res] == ["A", "B"]
+            with open(journal, "a", encoding="utf-8") as f:
+                f.write('{"symbol": "C", "par')
+
+            calls.clear()
+            res = bbe.run_batch(["A", "BAD", "EMPTY", "B", "C"], KWARGS, journal=journal, workers=1)
+            assert calls == ["BAD", "C"]
+            assert [r.symbol for r in res] == ["A", "B", "C"]
+            assert bbe.load_journal(journal, bbe.params_hash(KWARGS))["BAD"]["error"] == "RuntimeError: boom"
+
+            # 参数变化时哈希不同，全部重新评估
+            calls.clear()
+            bbe.run_batch(["A"], {**KWARGS, "horizon_days": 5}, journal=journal, workers=1)
+            assert calls == ["A"]
+            with open(journal, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            assert [line for line in lines if not line.endswith("}")] == ['{"symbol": "C", "par']
+            assert json.loads(lines[-1])["symbol"] == "A"
+    finally:
+        bbe.eval_one_symbol = original
+
+
+def test_read_symbols_file():
+    """代码文件支持逐行、逗号分隔与注释，去重保序"""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        f.write("# 全市场\n000001\n600000, 600519  # 白酒\n\n000001，002594\n")
+    try:
+        assert bbe.read_symbols_file(f.name) == ["000001", "600000", "600519", "002594"]
+    finally:
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
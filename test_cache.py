@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试数据缓存：SQLite 存储的读写与过期、按前缀清除不反序列化、按大小淘汰最久未访问的条目
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache import CacheManager
+
+
+class Unloadable:
+    """反序列化时抛出异常的对象，用于确认清除缓存时不读取数据"""
+
+    def __reduce__(self):
+        return (_fail_on_load, ())
+
+
+def _fail_on_load():
+    raise RuntimeError("不应反序列化")
+
+
+def test_get_set_and_expiry():
+    """读写 DataFrame、读取时指定过期时间、写入时的过期时间、删除"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CacheManager(tmp, default_ttl=3600)
+        df = pd.DataFrame({'收盘': np.arange(5.0)})
+        assert cache.set('stock_kline', df, '600519', '20240101', None, '101')
+        pd.testing.assert_frame_equal(cache.get('stock_kline', '600519', '20240101', None, '101'), df)
+        assert cache.get('stock_kline', '600519', '20240102', None, '101') is None
+
+        cache.set('realtime_quotes', [1, 2], 100, ttl=0.05)
+        assert cache.get('realtime_quotes', 100) == [1, 2]
+        time.sleep(0.1)
+        assert cache.get('realtime_quotes', 100) is None
+        # 读取时的过期时间优先于写入时的默认值
+        assert cache.get('stock_kline', '600519', '20240101', None, '101', ttl=0) is None
+        assert cache.stats()['entries'] == 0
+
+        cache.set('a', 1, 'x')
+        assert cache.delete('a', 'x') and cache.get('a', 'x') is None
+        # WAL 模式
+        with sqlite3.connect(cache.db_path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_clear_prefix_without_loading():
+    """按前缀清除只删除该前缀，且不反序列化数据；损坏的数据读取时被删除"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CacheManager(tmp)
+        for i in range(3):
+            assert cache.set('indicator_state', Unloadable(), f'60000{i}')
+        cache.set('stock_kline', {'n': 1}, '600000')
+        assert cache.clear('indicator_state')
+        assert cache.stats()['prefixes'] == {'stock_kline': 1}
+        assert cache.get('stock_kline', '600000') == {'n': 1}
+
+        cache.set('indicator_state', Unloadable(), '600000')
+        assert cache.get('indicator_state', '600000') is None
+        assert cache.stats()['prefixes'] == {'stock_kline': 1}
+
+        # 清除全部时一并删除旧版 .pkl 缓存文件
+        with open(os.path.join(tmp, '0123abcd.pkl'), 'wb') as f:
+            f.write(b'stale')
+        assert cache.clear()
+        assert cache.stats()['entries'] == 0 and not any(name.endswith('.pkl') for name in os.listdir(tmp))
+
+
+def test_lru_eviction_by_size():
+    """总大小超过上限时淘汰最久未访问的条目，最近读取过的条目保留"""
+    with tempfile.TemporaryDirectory() as tmp:
+        payload = np.zeros(1000)
+        cache = CacheManager(tmp)
+        cache.set('probe', payload, 0)
+        size = cache.stats()['nbytes']
+
+        cache = CacheManager(tmp, max_bytes=size * 3)
+        cache.ACCESS_RESOLUTION = 0.0
+        cache.clear()
+        for i in range(3):
+            cache.set('blob', payload, i)
+            time.sleep(0.01)
+        assert cache.get('blob', 0) is not None
+        cache.set('blob', payload, 3)
+        assert cache.get('blob', 1) is None
+        assert all(cache.get('blob', i) is not None for i in (0, 2, 3))
+        assert cache.stats()['nbytes'] <= cache.max_bytes
+
+        # 与其他实例（如另一个进程）共用同一数据库
+        assert CacheManager(tmp).get('blob', 3) is not None
+
+
+def test_running_total_and_access_throttle():
+    """总大小随覆盖、删除、按前缀清除同步更新（含旧库升级）；短时间内重复命中不写回访问时间"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CacheManager(tmp)
+
+        def table_sum():
+            with sqlite3.connect(cache.db_path) as conn:
+                return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+        cache.set('a', np.zeros(100), 1)
+        cache.set('a', np.zeros(500), 1)
+        cache.set('b', 'x', 2)
+        assert cache.stats()['nbytes'] == table_sum() > 4000
+        cache.delete('a', 1)
+        assert cache.stats()['nbytes'] == table_sum()
+        cache.set('a', np.zeros(50), 3)
+        cache.clear('b')
+        assert cache.stats()['nbytes'] == table_sum() > 0
+
+        # 由不含 meta 表的旧库升级时按现有数据初始化
+        with sqlite3.connect(cache.db_path) as conn:
+            conn.execute("DROP TABLE meta")
+        assert CacheManager(tmp).stats()['nbytes'] == table_sum()
+
+        with sqlite3.connect(cache.db_path) as conn:
+            conn.execute("UPDATE entries SET accessed = 0")
+        cache.get('a', 3)
+        with sqlite3.connect(cache.db_path) as conn:
+            first = conn.execute("SELECT accessed FROM entries").fetchone()[0]
+        cache.get('a', 3)
+        with sqlite3.connect(cache.db_path) as conn:
+            assert conn.execute("SELECT accessed FROM entries").fetchone()[0] == first > 0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试缠论引擎数组实现与逐行参照实现的一致性
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from chanlun_engine import (
+    ChanQuantEngine, ChanTrace, IncrementalChanEngine, SparseTable, analyze_universe, build_segments,
+    merge_k_lines_array,
+)
+from bench_chanlun import LegacyChanEngine, legacy_merge_k_lines, make_kline
+
+
+def test_merge_k_lines_matches_legacy():
+    """数组版包含处理与逐行版本输出完全一致"""
+    engine = ChanQuantEngine()
+    for seed in range(5):
+        df = make_kline(600, seed=seed)
+        pd.testing.assert_frame_equal(engine.merge_k_lines(df), legacy_merge_k_lines(df))
+
+
+def test_merge_k_lines_matches_legacy_range_index():
+    """无日期索引（RangeIndex）时的输出类型与逐行版本一致"""
+    engine = ChanQuantEngine()
+    df = make_kline(300, seed=11).reset_index(drop=True)
+    pd.testing.assert_frame_equal(engine.merge_k_lines(df), legacy_merge_k_lines(df))
+
+
+def test_merge_k_lines_index_map():
+    """索引映射覆盖全部原始K线，且每根合并K线的高低点来自其覆盖区间"""
+    df = make_kline(500, seed=3)
+    keep, high, low, spans = merge_k_lines_array(
+        df['high'].to_numpy(), df['low'].to_numpy(), df['open'].to_numpy(), df['close'].to_numpy()
+    )
+    assert len(keep) == len(spans) == len(high) == len(low)
+    assert spans[0, 0] == 0 and spans[-1, 1] == len(df) - 1
+    assert np.all(spans[1:, 0] == spans[:-1, 1] + 1)
+    assert np.all((keep >= spans[:, 0]) & (keep <= spans[:, 1]))
+    for k in range(len(spans)):
+        first, last = spans[k]
+        assert df['high'].iloc[first:last + 1].max() >= high[k]
+        assert df['low'].iloc[first:last + 1].min() <= low[k]
+
+
+def test_merge_k_lines_empty():
+    """空数据直接返回"""
+    engine = ChanQuantEngine()
+    df = make_kline(0)
+    out = engine.merge_k_lines(df)
+    assert len(out) == 0
+    assert engine.k_index_map.shape == (0, 2)
+
+
+def _assert_same_run(new: ChanQuantEngine, old: ChanQuantEngine, df: pd.DataFrame):
+    new_signals = new.run(df)
+    old_signals = old.run(df)
+    assert new.fractals == old.fractals
+    assert new.bi == old.bi
+    assert new.zhongshu == old.zhongshu
+    pd.testing.assert_frame_equal(new_signals, old_signals)
+
+
+def test_fractals_and_bi_match_legacy():
+    """数组版分型与笔识别与逐个验证的版本结果一致"""
+    for seed in range(4):
+        df = make_kline(400, seed=seed)
+        for threshold in (0.001, 0.03, 0.08):
+            _assert_same_run(
+                ChanQuantEngine(bi_threshold=threshold, use_macd=True),
+                LegacyChanEngine(bi_threshold=threshold, use_macd=True),
+                df,
+            )
+
+
+def test_find_bi_unsorted_fractals():
+    """传入未排序的分型列表时与原实现一致"""
+    df = make_kline(400, seed=21)
+    engine = ChanQuantEngine(bi_threshold=0.02)
+    legacy = LegacyChanEngine(bi_threshold=0.02)
+    merged = engine.merge_k_lines(df)
+    fractals = engine.find_fractals(merged)[::-1]
+    assert engine.find_bi(merged, fractals) == legacy.find_bi(merged, fractals)
+
+
+def test_find_mmd_matches_legacy():
+    """产生买卖点的样本上信号与原实现一致"""
+    for seed in (62, 63):
+        df = make_kline(300, seed=seed)
+        for use_macd in (True, False):
+            _assert_same_run(
+                ChanQuantEngine(bi_threshold=0.02, use_macd=use_macd),
+                LegacyChanEngine(bi_threshold=0.02, use_macd=use_macd),
+                df,
+            )
+
+
+def _assert_same_state(inc: IncrementalChanEngine, ref: ChanQuantEngine, ref_signals: pd.DataFrame):
+    assert inc.fractals == ref.fractals
+    assert inc.bi == ref.bi
+    assert inc.zhongshu == ref.zhongshu
+    pd.testing.assert_frame_equal(inc.signals, ref_signals)
+    assert inc.segments == ref.segments
+    assert inc.get_summary() == ref.get_summary()
+
+
+def test_incremental_update_matches_run():
+    """逐根推入K线，每一步的结果都与对前缀数据全量计算一致"""
+    n_signal = 0
+    for seed, use_macd in ((62, False), (63, True)):
+        df = make_kline(300, seed=seed)
+        inc = IncrementalChanEngine(bi_threshold=0.02, use_macd=use_macd)
+        for k in range(len(df)):
+            inc.update(df.iloc[k])
+            ref = ChanQuantEngine(bi_threshold=0.02, use_macd=use_macd)
+            ref_signals = ref.run(df.iloc[:k + 1])
+            _assert_same_state(inc, ref, ref_signals)
+            n_signal += len(ref_signals) > 0
+        pd.testing.assert_frame_equal(inc.k_merged, ref.k_merged, check_freq=False)
+        assert np.array_equal(inc.k_index_map, ref.k_index_map)
+        if use_macd:
+            _, _, macd_bar = ref._compute_macd(ref.k_merged['close'])
+            assert macd_bar.tolist() == inc._macd_bar
+    assert n_signal > 0
+
+
+def test_incremental_extend_with_inclusions():
+    """价格取整制造大量包含关系，分批推入与全量计算一致"""
+    rng = np.random.default_rng(0)
+    for seed in range(6):
+        df = make_kline(250, seed=100 + seed)
+        df['high'] = df['high'].round(0)
+        df['low'] = df['low'].round(0)
+        threshold = (0.001, 0.02, 0.05)[seed % 3]
+        inc = IncrementalChanEngine(bi_threshold=threshold)
+        k = 0
+        while k < len(df):
+            step = int(rng.integers(1, 20))
+            inc.extend(df.iloc[k:k + step])
+            k += step
+            ref = ChanQuantEngine(bi_threshold=threshold)
+            _assert_same_state(inc, ref, ref.run(df.iloc[:k]))
+
+
+def test_incremental_sync_and_order():
+    """sync 只推入新增K线，历史变动时全量重算；乱序K线报错"""
+    df = make_kline(300, seed=62)
+    ref = ChanQuantEngine(bi_threshold=0.02)
+    ref_signals = ref.run(df)
+    
+    inc = IncrementalChanEngine(bi_threshold=0.02)
+    inc.sync(df.iloc[:200])
+    inc.sync(df)
+    _assert_same_state(inc, ref, ref_signals)
+    
+    adjusted = df * 1.1
+    inc.sync(adjusted)
+    ref_signals = ref.run(adjusted)
+    _assert_same_state(inc, ref, ref_signals)
+    
+    try:
+        inc.update(df.iloc[0])
+        assert False, "乱序K线应报错"
+    except ValueError:
+        pass
+
+
+def test_analyze_universe_matches_single_runs():
+    """多进程批量分析与逐只运行结果一致，信号时间映射回原始索引"""
+    klines = {f"S{seed}": make_kline(300, seed=seed) for seed in (60, 61, 62, 63)}
+    klines['CN'] = make_kline(300, seed=62).rename_axis('日期')
+    klines['EMPTY'] = make_kline(0)
+    klines['BAD'] = pd.DataFrame({'x': [1.0, 2.0]})
+    
+    for workers in (1, 2):
+        result = analyze_universe(klines, workers=workers, bi_threshold=0.02, use_macd=False)
+        assert list(result['symbol']) == list(klines)
+        assert 'wall_time' in result.attrs
+        for symbol in ('S60', 'S61', 'S62', 'S63'):
+            engine = ChanQuantEngine(bi_threshold=0.02, use_macd=False)
+            signals = engine.run(klines[symbol])
+            row = result.set_index('symbol').loc[symbol]
+            summary = engine.get_summary()
+            assert row['level_count'] == len(summary.pop('levels'))
+            for key, value in summary.items():
+                assert row[key] == value
+            expected = [(d, s, p) for d, s, p in zip(signals.index, signals['signal'], signals['price'])] \
+                if len(signals) > 0 else []
+            assert row['signals'] == expected
+            assert row['elapsed'] > 0
+        rows = result.set_index('symbol')
+        assert rows.loc['CN', 'signals'] == rows.loc['S62', 'signals']
+        assert rows.loc['EMPTY', 'bars'] == 0
+        assert rows.loc['BAD', 'error']
+
+
+def test_sparse_table_matches_slices():
+    """稀疏表区间最值与直接切片一致"""
+    rng = np.random.default_rng(5)
+    values = rng.normal(size=257)
+    tmax, tmin = SparseTable(values, 'max'), SparseTable(values, 'min')
+    l = rng.integers(0, len(values), 500)
+    r = np.minimum(l + rng.integers(0, 60, 500), len(values) - 1)
+    assert np.array_equal(tmax.query_many(l, r), [values[a:b + 1].max() for a, b in zip(l, r)])
+    assert np.array_equal(tmin.query_many(l, r), [values[a:b + 1].min() for a, b in zip(l, r)])
+    assert tmax.query(3, 3) == values[3]
+    assert tmin.query(0, 256) == values.min()
+
+
+def _zhongshu_from_prices(prices):
+    """按端点价格构造每根K线一笔的笔序列（K线高低点不影响笔区间）"""
+    n = len(prices)
+    merged = pd.DataFrame({'high': np.zeros(n), 'low': np.full(n, 1e9),
+                           'open': prices, 'close': prices})
+    bi = [(k, k + 1, 1 if prices[k + 1] > prices[k] else -1, prices[k], prices[k + 1])
+          for k in range(n - 1)]
+    engine = ChanQuantEngine()
+    engine.zhongshu = engine.find_zhongshu(bi, merged)
+    return engine, engine.zhongshu
+
+
+def test_zhongshu_extension_and_leave():
+    """三笔重叠形成中枢，后续重叠笔延伸，离开笔之后重新寻找中枢"""
+    engine, zhongshu = _zhongshu_from_prices([10, 20, 12, 18, 14, 30, 25, 28, 26])
+    assert zhongshu == [(0, 5, 18, 12), (5, 8, 28, 26)]
+    assert engine.zhongshu_detail[0] == [0, 4, 18, 12, 30, 10]
+    assert engine.get_zhongshu_list()[0]['bi_count'] == 5
+
+
+def test_zhongshu_merge_on_return():
+    """离开后又回到原中枢区间形成的中枢与原中枢合并"""
+    engine, zhongshu = _zhongshu_from_prices([10, 20, 12, 18, 25, 13, 17, 14])
+    assert zhongshu == [(0, 7, 18, 12)]
+    assert engine.zhongshu_detail == [[0, 6, 18, 12, 25, 10]]
+
+
+def _strokes(prices):
+    return [(k, k + 1, 1 if prices[k + 1] > prices[k] else -1, prices[k], prices[k + 1])
+            for k in range(len(prices) - 1)]
+
+
+def test_build_segments_feature_fractal():
+    """特征序列出现分型时确认线段，下一线段从分型中间元素开始"""
+    strokes = _strokes([10, 20, 15, 25, 18, 30, 22, 26, 21, 24, 16, 19, 12, 17, 14, 20])
+    assert build_segments(strokes) == [(0, 5, 1, 10, 30), (5, 12, -1, 30, 12)]
+
+
+def test_build_segments_breach_restarts():
+    """反向笔跌破起点且不足三笔时放弃该起点"""
+    strokes = _strokes([10, 20, 8, 18, 12, 16, 11, 15, 5, 9, 7, 12])
+    assert build_segments(strokes) == [(1, 8, -1, 20, 5)]
+
+
+def test_levels_shrink_and_summary():
+    """高级别由低级别线段构成，元素数逐级减少，摘要包含各级别统计"""
+    engine = ChanQuantEngine(bi_threshold=0.01)
+    engine.run(make_kline(5000, seed=4))
+    levels = engine.levels
+    assert len(levels) >= 3
+    assert levels[0]['strokes'] == engine.bi and levels[0]['zhongshu'] == engine.zhongshu
+    assert levels[1]['strokes'] == engine.segments
+    counts = [len(lv['strokes']) for lv in levels]
+    assert all(a >= 3 * b for a, b in zip(counts, counts[1:]))
+    for lower, upper in zip(levels, levels[1:]):
+        points = {s[0] for s in lower['strokes']} | {s[1] for s in lower['strokes']}
+        assert all(s[0] in points and s[1] in points for s in upper['strokes'])
+    summary = engine.get_summary()
+    assert summary['segment_count'] == len(engine.segments)
+    assert [lv['stroke_count'] for lv in summary['levels']] == counts
+
+
+
+def test_derived_attributes_read_only():
+    """线段与合并K线映射由引擎计算，两种引擎上赋值均抛出 AttributeError 而非被静默忽略"""
+    df = make_kline(800, seed=5)
+    ref = ChanQuantEngine(bi_threshold=0.01)
+    ref.run(df)
+    inc = IncrementalChanEngine(bi_threshold=0.01)
+    inc.run(df)
+    assert inc.segments == ref.segments and len(ref.segments) > 0
+    assert np.array_equal(inc.k_index_map, ref.k_index_map)
+    for engine in (ref, inc):
+        for name in ('segments', 'k_index_map'):
+            try:
+                setattr(engine, name, [])
+            except AttributeError:
+                continue
+            raise AssertionError(f"{type(engine).__name__}.{name} 赋值未报错")
+    assert ChanQuantEngine().segments == [] and ChanQuantEngine().k_index_map is None
+
+def test_trace_records_bi_and_zhongshu():
+    """追踪记录与笔、中枢结果对应，且不影响计算结果"""
+    df = make_kline(400, seed=62)
+    trace = ChanTrace(capacity=4)
+    engine = ChanQuantEngine(bi_threshold=0.02, trace=trace)
+    signals = engine.run(df)
+    plain = ChanQuantEngine(bi_threshold=0.02)
+    pd.testing.assert_frame_equal(signals, plain.run(df))
+    assert engine.bi == plain.bi and engine.zhongshu == plain.zhongshu
+    
+    events = trace.to_frame()
+    accepted = events[events['kind'] == 'bi_accept']
+    assert [tuple(r) for r in accepted[['start', 'end', 'v1', 'v2']].to_numpy()] == \
+        [(b[0], b[1], b[3], b[4]) for b in engine.bi]
+    zs_events = {tuple(r) for r in events[events['kind'].isin(['zs_form', 'zs_merge'])]
+                 [['start', 'end', 'v1', 'v2']].to_numpy()}
+    assert len(engine.zhongshu) > 0
+    assert all(zs in zs_events for zs in engine.zhongshu)
+    assert (events['kind'] == 'zs_form').sum() >= len(engine.zhongshu)
+    assert len(trace) == len(events) > len(engine.bi)
+    
+    trace.clear()
+    assert len(trace) == 0 and len(trace.to_frame()) == 0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
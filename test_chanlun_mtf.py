@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多级别缠论联立：重采样与区间套对齐
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from chanlun_engine import ChanQuantEngine
+from chanlun_mtf import analyze_multi_timeframe, build_timeframes, resample_kline
+from bench_chanlun import make_kline
+
+
+def make_minute(days: int, seed: int = 0) -> pd.DataFrame:
+    """生成A股交易时段的5分钟K线"""
+    rng = np.random.default_rng(seed)
+    sessions = list(pd.timedelta_range('09:35:00', '11:30:00', freq='5min')) + \
+        list(pd.timedelta_range('13:05:00', '15:00:00', freq='5min'))
+    index = pd.DatetimeIndex([d + t for d in pd.bdate_range('2024-01-01', periods=days) for t in sessions])
+    n = len(index)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.003, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.003, n))
+    volume = rng.integers(100, 1000, n).astype(float)
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}, index=index)
+
+
+def test_resample_intraday_sessions():
+    """60分钟线按交易时段切分为 10:30/11:30/14:00/15:00，OHLCV 聚合正确"""
+    df = make_minute(3)
+    out = resample_kline(df, '60min')
+    assert len(out) == 12
+    assert [t.strftime('%H:%M') for t in out.index[:4]] == ['10:30', '11:30', '14:00', '15:00']
+    first = df.iloc[:12]
+    row = out.iloc[0]
+    assert row['open'] == first['open'].iloc[0]
+    assert row['close'] == first['close'].iloc[-1]
+    assert row['high'] == first['high'].max()
+    assert row['low'] == first['low'].min()
+    assert row['volume'] == first['volume'].sum()
+    assert len(resample_kline(df, '30min')) == 24
+
+
+def test_resample_daily_weekly():
+    """日线、周线按自然日/自然周聚合，索引为周期内最后一根K线时间"""
+    df = make_minute(10)
+    daily = resample_kline(df, 'D')
+    assert len(daily) == 10
+    assert all(t.strftime('%H:%M') == '15:00' for t in daily.index)
+    weekly = resample_kline(df, 'W')
+    assert len(weekly) == 2
+    assert list(weekly.index.dayofweek) == [4, 4]
+    assert weekly['high'].iloc[0] == df.loc[:'2024-01-05 15:00', 'high'].max()
+    pd.testing.assert_frame_equal(resample_kline(daily, 'W'), weekly)
+
+
+def test_build_timeframes_skips_finer_levels():
+    """日线基础数据只生成日线和周线，日线级别直接复用基础数据"""
+    base = make_kline(300)
+    frames = build_timeframes(base)
+    assert list(frames) == ['D', 'W']
+    pd.testing.assert_frame_equal(frames['D'], base)
+
+
+def test_multi_timeframe_levels_and_nesting():
+    """各级别结果与单独运行引擎一致，高级别信号由区间内的低级别信号确认"""
+    df = make_minute(250, seed=19)
+    result = analyze_multi_timeframe(df, bi_threshold=0.01, use_macd=False)
+    assert list(result['levels']) == ['30min', '60min', 'D', 'W']
+    for freq, level in result['levels'].items():
+        engine = ChanQuantEngine(bi_threshold=0.01, use_macd=False)
+        pd.testing.assert_frame_equal(engine.run(resample_kline(df, freq)), level['signals'])
+
+    nesting = result['nesting']
+    daily = nesting[nesting['level'] == 'D']
+    assert len(daily) == 1 and bool(daily['confirmed'].iloc[0])
+    for row in nesting.itertuples(index=False):
+        for freq, date, signal, _ in row.lower_signals:
+            assert row.window_start < date <= row.window_end
+            assert signal[:3] == row.signal[:3]
+    lowest = nesting[nesting['level'] == '30min']
+    assert lowest['confirmed'].isna().all()
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试动态评分器的序列评分、窗口评分与逐条件参照实现一致
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from dynamic_scorer import DynamicScorer, compile_formula
+from backtest_engine import BacktestParams, run_backtest
+
+
+FORMULA = {
+    'trend_strength': {'items': [
+        {'condition': 'MA5 > MA20', 'score': 10},
+        {'condition': 'MA10 > MA30', 'score': 10},
+        {'condition': '均线多头排列（MA5>MA10>MA20）', 'score': 5},
+        {'condition': '近期5日涨幅 > 3%', 'score': 5},
+        {'condition': '无法识别的条件', 'score': 3},
+    ]},
+    'momentum_confirmation': {'items': [
+        {'condition': 'MACD金叉且柱状图扩大', 'score': 10},
+        {'condition': 'KDJ（K>D且在20-80区间）', 'score': 10},
+        {'condition': '收盘价突破布林带中轨且带宽扩张', 'score': 5},
+    ]},
+    'volume_price_coordination': {'items': [
+        {'condition': '成交量 > 20日均量1.3倍', 'score': 10},
+        {'condition': '量比（当日/5日均量）>1.2且持续2天', 'score': 10},
+    ]},
+    'risk_control': {'items': [
+        {'condition': '10日波动率 < 近期30日波动率中位数', 'score': 5},
+        {'condition': '价格处于20日均线上方且偏离度<8%', 'score': 5},
+        {'condition': 'RSI在40-60之间', 'score': 5},
+    ]},
+    'market_environment': {'items': [
+        {'condition': '近20日市场处于上涨趋势（涨幅>3%）', 'score': 10},
+        {'condition': '其他情况', 'score': 5},
+    ]},
+    'penalty_items': [
+        {'condition': '出现长上影线（单日振幅>5%且收盘低于最高点2%）', 'penalty': 5},
+        {'condition': '大宗交易折价率>3%', 'penalty': 3},
+        {'condition': '涨幅>5%但波动率同步放大', 'penalty': 3},
+        {'condition': '价涨量缩', 'penalty': 5},
+        {'condition': 'RSI>70或<30', 'penalty': 5},
+    ],
+}
+
+
+def make_daily(n: int, seed: int = 0) -> pd.DataFrame:
+    """生成带停牌式平盘段的日K线"""
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.04, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n))
+    flat = slice(n // 3, n // 3 + 12)
+    open_[flat] = high[flat] = low[flat] = close[flat] = close[n // 3]
+    volume = rng.integers(1000, 5000, n)
+    return pd.DataFrame({'开盘': open_, '最高': high, '最低': low, '收盘': close, '成交量': volume},
+                        index=pd.bdate_range('2022-01-03', periods=n))
+
+
+def _kdj_kd(w, n=9):
+    low_n = w['最低'].rolling(n, min_periods=n).min()
+    high_n = w['最高'].rolling(n, min_periods=n).max()
+    rsv = (w['收盘'] - low_n) / (high_n - low_n).replace(0, np.nan) * 100
+    k = rsv.ewm(alpha=1/3, adjust=False).mean()
+    d = k.ewm(alpha=1/3, adjust=False).mean()
+    return k.iloc[-1], d.iloc[-1]
+
+
+def _macd_expanding(w):
+    macd = w['收盘'].ewm(span=12, adjust=False).mean() - w['收盘'].ewm(span=26, adjust=False).mean()
+    histogram = macd - macd.ewm(span=9, adjust=False).mean()
+    return histogram.iloc[-1] > histogram.iloc[-2] and histogram.iloc[-1] > 0
+
+
+def _rsi(w):
+    returns = w['收盘'].pct_change().tail(14)
+    gains = returns[returns > 0].mean()
+    losses = -returns[returns < 0].mean()
+    return 100 - (100 / (1 + gains / losses)) if losses > 0 else np.nan
+
+
+def _change_pct(w, k):
+    return (w['收盘'].iloc[-1] - w['收盘'].iloc[-k]) / w['收盘'].iloc[-k] * 100
+
+
+def _volatility_rising(w):
+    returns = w['收盘'].pct_change()
+    return returns.tail(10).std() > returns.tail(30).std()
+
+
+def _ma(w, k):
+    return w['收盘'].tail(k).mean()
+
+
+def _upper_shadow(w):
+    high, close, open_price = w['最高'].iloc[-1], w['收盘'].iloc[-1], w['开盘'].iloc[-1]
+    amplitude = (high - min(open_price, close)) / min(open_price, close) * 100
+    return amplitude > 5 and (high - close) / high * 100 > 2
+
+
+def _within_ma20(w):
+    ma20, close = _ma(w, 20), w['收盘'].iloc[-1]
+    return close > ma20 and (close - ma20) / ma20 * 100 < 8
+
+
+# 规则键 -> (所需最短窗口, 逐窗口判定)：用 pandas 逐条件计算的参照实现
+REFERENCE_RULES = {
+    'ma5_gt_ma20': (20, lambda w: _ma(w, 5) > _ma(w, 20)),
+    'ma10_gt_ma30': (30, lambda w: _ma(w, 10) > _ma(w, 30)),
+    'ma_bull': (20, lambda w: _ma(w, 5) > _ma(w, 10) > _ma(w, 20)),
+    'chg5_gt_3': (5, lambda w: _change_pct(w, 5) > 3),
+    'macd_cross': (26, _macd_expanding),
+    'kdj_golden': (9, lambda w: (lambda k, d: k > d and 20 < k < 80)(*_kdj_kd(w))),
+    'boll_mid': (20, lambda w: w['收盘'].iloc[-1] > _ma(w, 20)),
+    'volume_surge': (20, lambda w: w['成交量'].iloc[-1] > w['成交量'].tail(20).mean() * 1.3),
+    'volume_ratio': (5, lambda w: w['成交量'].iloc[-1] / w['成交量'].tail(5).mean() > 1.2),
+    'low_volatility': (30, lambda w: w['收盘'].pct_change().tail(10).std() < w['收盘'].pct_change().tail(30).std()),
+    'above_ma20': (20, _within_ma20),
+    'rsi_neutral': (14, lambda w: 40 < _rsi(w) < 60),
+    'upper_shadow': (1, _upper_shadow),
+    'industry_index': (np.inf, None),
+    'block_trade': (np.inf, None),
+    'surge_volatile': (5, lambda w: _change_pct(w, 5) > 5 and _volatility_rising(w)),
+    'price_up_volume_down': (2, lambda w: w['收盘'].iloc[-1] > w['收盘'].iloc[-2]
+                             and w['成交量'].iloc[-1] < w['成交量'].iloc[-2]),
+    'rsi_extreme': (14, lambda w: _rsi(w) > 70 or _rsi(w) < 30),
+}
+
+
+def reference_score(rules, w):
+    """逐窗口参照评分，返回 (评分, 触发位掩码)；市场环境取上涨类最高分，否则取“其他”类兜底分"""
+    score, mask = 0, 0
+    for rule in rules:
+        if rule['key'] is None or rule['section'] == 'market_environment':
+            continue
+        min_window, check = REFERENCE_RULES[rule['key']]
+        if len(w) >= min_window and check(w):
+            mask |= 1 << rule['bit']
+            score += -rule['penalty'] if rule['section'] == 'penalty_items' else rule['score']
+
+    market = [r for r in rules if r['section'] == 'market_environment']
+    if market and len(w) >= 20:
+        base = w['收盘'].iloc[-20]
+        stock_ret_20 = (w['收盘'].iloc[-1] - base) / base * 100 if base else 0
+        up = [r for r in market if r['key'] == 'market_up'] if stock_ret_20 > 3 else []
+        fallback = max([r['score'] for r in market if r['key'] == 'market_fallback'], default=0)
+        best = max([r['score'] for r in up], default=0)
+        final = best if best > 0 else fallback
+        for r in market:
+            if (up and (r['condition'], r['score']) == (up[-1]['condition'], up[-1]['score'])) \
+                    or (r['key'] == 'market_fallback' and r['score'] == final):
+                mask |= 1 << r['bit']
+        score += final
+    return max(0, min(100, score)), mask
+
+
+def _detail_mask(detail, rules):
+    hits = {(item['section'], item['condition']) for item in detail['triggered_items'] + detail['penalty_items']}
+    return sum(1 << r['bit'] for r in rules if (r['section'], r['condition']) in hits)
+
+
+def test_score_series_matches_windowed():
+    """每根K线的评分和触发位掩码与逐窗口参照实现、逐窗口 calculate_score_detail 完全一致"""
+    scorer = DynamicScorer(FORMULA)
+    for seed in range(3):
+        df = make_daily(160, seed)
+        for lookback in (30, 12):
+            series = scorer.score_series(df, lookback)
+            rules = series.attrs['rules']
+            for t in range(len(df)):
+                window = df.iloc[max(0, t - lookback + 1):t + 1]
+                score, mask = reference_score(rules, window)
+                assert score == series['score'].iloc[t]
+                assert mask == int(series['triggered'].iloc[t])
+                score, detail = scorer.calculate_score_detail(window)
+                assert score == series['score'].iloc[t]
+                assert _detail_mask(detail, rules) == mask
+
+
+def test_score_detail_sections():
+    """明细按规则分类，各部分得分之和减去扣分即为评分"""
+    scorer = DynamicScorer(FORMULA)
+    rules = scorer.rule_list()
+    df = make_daily(200, seed=5)
+    seen = set()
+    for t in range(30, len(df)):
+        score, detail = scorer.calculate_score_detail(df.iloc[t - 29:t + 1])
+        sections = detail['section_scores']
+        total = sum(v for k, v in sections.items() if k != 'penalty_total') - sections['penalty_total']
+        assert score == max(0, min(100, total))
+        assert scorer.calculate_score(df.iloc[t - 29:t + 1]) == score
+        items = (detail['triggered_items'] + detail['penalty_items']
+                 + detail['recognized_not_triggered_items'] + detail['unrecognized_items'])
+        assert len(items) == len(rules)
+        assert [item['condition'] for item in detail['unrecognized_items']] == ['无法识别的条件']
+        assert all(item['penalty'] > 0 for item in detail['penalty_items'])
+        seen.update(k for k in detail if detail[k] and k != 'section_scores')
+    assert seen == {'triggered_items', 'penalty_items', 'recognized_not_triggered_items', 'unrecognized_items'}
+    # 空数据不触发任何规则
+    assert scorer.calculate_score_detail(df.iloc[:0])[0] == 0
+
+
+def test_rule_list_bits():
+    """规则按评分顺序编号，未识别条件的 key 为 None"""
+    rules = DynamicScorer(FORMULA).rule_list()
+    assert [r['bit'] for r in rules] == list(range(len(rules)))
+    assert rules[0]['key'] == 'ma5_gt_ma20'
+    assert rules[4]['key'] is None
+    assert rules[-1]['section'] == 'penalty_items' and rules[-1]['key'] == 'rsi_extreme'
+
+
+def test_compile_formula_plan():
+    """公式编译为 (特征, 比较符, 阈值, 权重) 计划，按哈希缓存，未识别规则在编译时报告"""
+    plan = compile_formula(FORMULA)
+    reordered = {key: FORMULA[key] for key in reversed(list(FORMULA))}
+    assert compile_formula(reordered) is plan
+    assert DynamicScorer(FORMULA).plan is plan
+
+    feature, comparator, threshold, weight = plan.entries[0][:4]
+    assert (feature, comparator, threshold, weight) == ('ma5_ma20_spread', '>', 0, 10)
+    assert [r['condition'] for r in plan.unrecognized] == ['无法识别的条件']
+    assert ('rsi_14', 'outside', (30, 70), -5) in [tuple(e[:4]) for e in plan.entries]
+    # 大宗交易可识别但恒不触发，不进入计划
+    assert all(e.bits != 1 << 16 for e in plan.entries)
+    assert plan.rules[16]['key'] == 'block_trade'
+
+
+def test_run_backtest_uses_series_scores():
+    """回测使用序列评分与逐窗口评分的结果相同"""
+    class WindowedScorer:
+        def __init__(self, scorer):
+            self.scorer = scorer
+
+        def calculate_score_detail(self, w):
+            return self.scorer.calculate_score_detail(w)
+
+    scorer = DynamicScorer(FORMULA)
+    params = BacktestParams(buy_threshold=60, sell_threshold=45, max_holding_days=10,
+                            take_profit_pct=8, stop_loss_pct=-5)
+    df = make_daily(300, seed=4)
+    fast = run_backtest(df, scorer, params)
+    slow = run_backtest(df, WindowedScorer(scorer), params)
+    assert fast.trades == slow.trades
+    assert fast.metrics == slow.metrics
+    pd.testing.assert_series_equal(fast.equity_curve, slow.equity_curve)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试技术指标：单遍计算与逐个指标函数结果一致，可只计算所需列；增量状态追加K线与全量重算一致；面板模式与逐股票计算一致；指标缓存命中与淘汰
+"""
+
+import sys
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from indicators import (CHART_COLUMNS, INDICATOR_COLUMNS, STATE_COLUMNS, IndicatorMemo, IndicatorState, build_indicators, build_panel, cached_all_indicators,
+                        calculate_all_indicators, calculate_cpv, calculate_kdj, calculate_ma, calculate_macd, calculate_obv, calculate_volume_indicators, cross_above, panel_cpv,
+                        panel_kdj, panel_ma, panel_macd, panel_obv, panel_volume_ratio)
+
+
+def make_kline(n: int, seed: int = 0) -> pd.DataFrame:
+    """生成含一字K线、零成交量与缺失收盘价的日K线"""
+    rng = np.random.default_rng(seed)
+    close = np.cumsum(rng.normal(0, 1, n)) + 100
+    df = pd.DataFrame({
+        '日期': pd.bdate_range('2020-01-01', periods=n),
+        '开盘': close + rng.normal(0, 0.3, n),
+        '收盘': close,
+        '最高': close + rng.uniform(0, 2, n),
+        '最低': close - rng.uniform(0, 2, n),
+        '成交量': rng.integers(1000, 10000, n),
+    })
+    if n > 40:
+        df.loc[20, ['最高', '最低']] = df.loc[20, '收盘']
+        df.loc[30:32, '成交量'] = 0
+        df.loc[35, '收盘'] = np.nan
+    return df
+
+
+def reference_all_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """原 calculate_all_indicators：依次调用各指标函数"""
+    result = calculate_ma(df)
+    result = calculate_macd(result)
+    result = calculate_kdj(result)
+    result = calculate_obv(result)
+    result = calculate_volume_indicators(result)
+    return calculate_cpv(result)
+
+
+def test_matches_chained_functions():
+    """全部指标与逐个函数链式计算逐位一致（含列顺序与整数列类型）"""
+    for n in (0, 1, 5, 300):
+        df = make_kline(n, seed=n)
+        expected = reference_all_indicators(df)
+        got = calculate_all_indicators(df)
+        pd.testing.assert_frame_equal(got, expected, check_exact=True)
+        assert list(got.columns[len(df.columns):]) == list(INDICATOR_COLUMNS)
+    # 已含指标列时原位覆盖
+    df = make_kline(120, seed=1)
+    pd.testing.assert_frame_equal(calculate_all_indicators(calculate_all_indicators(df)),
+                                  reference_all_indicators(reference_all_indicators(df)), check_exact=True)
+
+
+def test_select_columns():
+    """只计算所选列，结果与全部计算的对应列一致，输入不被修改"""
+    df = make_kline(200, seed=2)
+    before = df.copy()
+    full = calculate_all_indicators(df)
+    subset = build_indicators(df, ['J', 'CPV_STREAK', 'MA20', 'VOL_RATIO'])
+    assert list(subset.columns) == ['MA20', 'J', 'VOL_RATIO', 'CPV_STREAK']
+    pd.testing.assert_frame_equal(subset, full[list(subset.columns)], check_exact=True)
+    # 只需收盘价的指标不读取其他列
+    pd.testing.assert_frame_equal(build_indicators(df[['收盘']], ['MA5', 'DIF']), full[['MA5', 'DIF']], check_exact=True)
+    pd.testing.assert_frame_equal(df, before)
+    try:
+        build_indicators(df, ['MA7'])
+        assert False, "未知指标列应报错"
+    except ValueError:
+        pass
+
+
+def test_state_update_matches_full():
+    """分批追加K线（含缺失收盘价、一字K线），EMA/MACD/KDJ/OBV 与全量重算逐位一致，均线在浮点误差内一致"""
+    df = make_kline(700, seed=5)
+    df.loc[300:310, ['最高', '最低', '收盘']] = 90.0
+    full = build_indicators(df, STATE_COLUMNS)
+    for split in (0, 3, 260, 500):
+        state = IndicatorState.from_kline(df.iloc[:split])
+        parts = [state.update(df.iloc[lo:lo + 41]) for lo in range(split, len(df), 41)]
+        got = pd.concat(parts)
+        expected = full.iloc[split:]
+        assert state.bars == len(df)
+        for col in STATE_COLUMNS:
+            if col.startswith('MA'):
+                assert np.allclose(got[col], expected[col], rtol=1e-12, atol=1e-12, equal_nan=True), col
+            else:
+                assert np.array_equal(got[col].to_numpy(), expected[col].to_numpy(), equal_nan=True), col
+
+
+def test_state_serializable():
+    """状态可经 JSON 往返；带日期时已处理过的K线被跳过"""
+    df = make_kline(400, seed=6)
+    state = IndicatorState.from_kline(df.iloc[:350])
+    payload = json.dumps(state.to_dict())
+    restored = IndicatorState.from_dict(json.loads(payload))
+    assert json.dumps(restored.to_dict()) == payload
+    # 传入刷新后的完整K线，只计算新增的 50 根
+    got = restored.update(df)
+    assert list(got.index) == list(df.index[350:])
+    pd.testing.assert_frame_equal(got, state.update(df.iloc[350:]), check_exact=True)
+    assert len(restored.update(df)) == 0
+
+
+def test_panel_matches_single_stock():
+    """宽表面板各列与逐股票 build_indicators 逐位一致（含上市较晚与停牌造成的缺失）"""
+    klines = {f"{600000 + i}": make_kline(300, seed=i) for i in range(8)}
+    klines['600003'] = klines['600003'].iloc[50:]
+    klines['600005'] = klines['600005'].drop(index=range(100, 120))
+    close, high, low, volume = (build_panel(klines, col) for col in ('收盘', '最高', '最低', '成交量'))
+    assert list(close.columns) == list(klines) and close.index.is_monotonic_increasing
+    panels = {**panel_ma(close), **panel_macd(close), **panel_kdj(high, low, close), 'OBV': panel_obv(close, volume),
+              **panel_cpv(close, volume), 'VOL_RATIO': panel_volume_ratio(volume)}
+    assert set(panels) <= set(INDICATOR_COLUMNS)
+    for symbol in klines:
+        aligned = pd.DataFrame({'收盘': close[symbol], '最高': high[symbol], '最低': low[symbol], '成交量': volume[symbol]})
+        expected = build_indicators(aligned)
+        for col, panel in panels.items():
+            assert np.array_equal(panel[symbol].to_numpy(), expected[col].to_numpy(), equal_nan=True), (symbol, col)
+    # ndarray 输入返回 ndarray，一维视为单只股票
+    values = panel_macd(close.to_numpy())['DIF']
+    assert isinstance(values, np.ndarray) and np.array_equal(values, panels['DIF'].to_numpy(), equal_nan=True)
+    assert panel_ma(close['600000'].to_numpy(), (20,))['MA20'].shape == (len(close),)
+
+
+def test_panel_screen():
+    """面板筛选 MA5>MA20 且 MACD 金叉与逐只判断一致（耗时见 bench_indicators.py）"""
+    rng = np.random.default_rng(0)
+    close = np.cumsum(rng.normal(0, 1, (250, 300)), axis=0) + 100
+    ma = panel_ma(close, (5, 20))
+    macd = panel_macd(close)
+    picked = (ma['MA5'][-1] > ma['MA20'][-1]) & cross_above(macd['DIF'], macd['DEA'])[-1]
+    for j in range(close.shape[1]):
+        single = build_indicators(pd.DataFrame({'收盘': close[:, j]}), ['MA5', 'MA20', 'DIF', 'DEA'])
+        dif, dea = single['DIF'].to_numpy(), single['DEA'].to_numpy()
+        expected = single['MA5'].iloc[-1] > single['MA20'].iloc[-1] and dif[-1] > dea[-1] and dif[-2] <= dea[-2]
+        assert picked[j] == expected, j
+    assert picked.any()
+
+
+def test_memo_hits_and_revisions():
+    """同一K线重复计算命中缓存；修订价格、追加K线或换指标列时不命中；调用方修改结果不影响缓存"""
+    memo = IndicatorMemo()
+    df = make_kline(300, seed=7)
+    first = memo.get(df, ['MA20', 'J'], symbol='600519')
+    pd.testing.assert_frame_equal(first, build_indicators(df, ['MA20', 'J']), check_exact=True)
+    first.loc[:, 'MA20'] = 0.0
+    again = memo.get(df.copy(), ['J', 'MA20'], symbol='600519')
+    pd.testing.assert_frame_equal(again, build_indicators(df, ['MA20', 'J']), check_exact=True)
+    assert (memo.hits, memo.misses) == (1, 1)
+
+    # 索引随本次传入的K线
+    shifted = df.set_index('日期')
+    assert memo.get(shifted, ['MA20', 'J'], symbol='600519').index.equals(shifted.index)
+    revised = df.copy()
+    revised['收盘'] = revised['收盘'] * 0.98
+    memo.get(revised, ['MA20', 'J'], symbol='600519')
+    memo.get(make_kline(301, seed=7), ['MA20', 'J'], symbol='600519')
+    memo.get(df, ['MA20'], symbol='600519')
+    memo.get(df, ['MA20', 'J'], symbol='000001')
+    stats = memo.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 5, 5)
+    assert memo.clear('600519') == 4 and memo.stats()['entries'] == 1
+
+    # 带缓存的完整结果与 calculate_all_indicators 一致
+    pd.testing.assert_frame_equal(cached_all_indicators(df), calculate_all_indicators(df), check_exact=True)
+
+
+def test_memo_extends_appended_bars():
+    """同一股票追加新K线时由上一条目的状态增量计算，结果与全量计算一致；前缀被修订时全量重算"""
+    memo = IndicatorMemo()
+    df = make_kline(450, seed=8)
+    columns = ['MA5', 'MA60', 'DIF', 'DEA', 'MACD', 'K', 'D', 'J', 'OBV']
+    memo.get(df.iloc[:300], columns, symbol='600519')
+    for end in (301, 340, 400):
+        got = memo.get(df.iloc[:end], columns, symbol='600519')
+        expected = build_indicators(df.iloc[:end], columns)
+        assert got.index.equals(expected.index) and list(got.columns) == columns
+        for col in columns:
+            if col.startswith('MA'):
+                assert np.allclose(got[col], expected[col], rtol=1e-12, atol=1e-12, equal_nan=True), col
+            else:
+                assert np.array_equal(got[col].to_numpy(), expected[col].to_numpy(), equal_nan=True), col
+    assert (memo.hits, memo.extends, memo.misses) == (0, 3, 1)
+    assert memo.get(df.iloc[:340], columns, symbol='600519') is not None and memo.hits == 1
+
+    # 历史K线被修订、未指定股票代码或含非状态列时不走增量
+    revised = df.copy()
+    revised.loc[10, '收盘'] += 1
+    pd.testing.assert_frame_equal(memo.get(revised, columns, symbol='600519'), build_indicators(revised, columns), check_exact=True)
+    memo.get(df.iloc[:350], columns)
+    memo.get(df.iloc[:360], columns)
+    memo.get(df.iloc[:350], ['MA5', 'VOL_RATIO'], symbol='600519')
+    memo.get(df.iloc[:360], ['MA5', 'VOL_RATIO'], symbol='600519')
+    assert (memo.extends, memo.misses) == (3, 6)
+
+
+def test_memo_memory_budget():
+    """占用超过内存上限时淘汰最久未使用的条目"""
+    klines = [make_kline(500, seed=i) for i in range(4)]
+    size = int(build_indicators(klines[0]).memory_usage(index=False).sum())
+    memo = IndicatorMemo(max_bytes=size * 2)
+    memo.get(klines[0])
+    memo.get(klines[1])
+    memo.get(klines[0])
+    memo.get(klines[2])
+    assert memo.evictions == 1 and memo.nbytes <= memo.max_bytes
+    memo.get(klines[0])
+    memo.get(klines[1])
+    assert (memo.hits, memo.misses) == (2, 4)
+    # 单个结果超过上限时不缓存
+    tiny = IndicatorMemo(max_bytes=100)
+    tiny.get(klines[3])
+    assert tiny.stats()['entries'] == 0 and tiny.nbytes == 0
+
+
+def test_memo_shared_across_threads():
+    """多线程并发读写同一缓存（同键与不同键、追加K线、淘汰），占用字节与条目一致，结果正确"""
+    klines = [make_kline(300, seed=i) for i in range(3)]
+    size = int(build_indicators(klines[0], CHART_COLUMNS).size * 8)
+    memo = IndicatorMemo(max_bytes=size * 4)
+    expected = {(i, end): build_indicators(kl.iloc[:end], CHART_COLUMNS) for i, kl in enumerate(klines) for end in (280, 300)}
+
+    def work(n):
+        i, end = n % 3, (280, 300)[n // 3 % 2]
+        got = memo.get(klines[i].iloc[:end], CHART_COLUMNS, symbol=str(i) if n % 2 else None)
+        return np.allclose(got, expected[(i, end)], rtol=1e-12, atol=1e-12, equal_nan=True)
+
+    with ThreadPoolExecutor(8) as pool:
+        assert all(pool.map(work, range(600)))
+    stats = memo.stats()
+    assert stats['hits'] + stats['misses'] + stats['extends'] == 600
+    assert memo.nbytes == sum(entry[1] for entry in memo._entries.values()) <= memo.max_bytes
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
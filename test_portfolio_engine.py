@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试组合回测：单票退化情形与单票回测一致，仓位上限与涨跌停/T+1成交规则
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import BacktestParams, run_backtest
+from dynamic_scorer import DynamicScorer
+from portfolio_engine import PortfolioParams, make_portfolio_panel, run_portfolio_backtest, simulate_portfolio
+from test_dynamic_scorer import FORMULA, make_daily
+
+
+def _frames(close, open_=None, score=None):
+    index = pd.bdate_range("2023-01-02", periods=len(next(iter(close.values()))))
+    close = pd.DataFrame(close, index=index)
+    open_ = close.shift(1).fillna(close.iloc[0]) if open_ is None else pd.DataFrame(open_, index=index)
+    score = pd.DataFrame(50.0, index=index, columns=close.columns) if score is None else pd.DataFrame(score, index=index)
+    return score, open_, close
+
+
+def test_single_symbol_matches_run_backtest():
+    """单票、满仓、不设涨跌停时，交易与单票回测一致，平仓后权益等于单票资金"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(320, seed=6)
+    params = BacktestParams(50, 38, 7, 8, -5, price_to_low_max_pct=12.0)
+    single = run_backtest(kl, scorer, params)
+    port = run_portfolio_backtest({"X": kl.iloc[:-1]}, scorer, PortfolioParams(params, max_positions=1, max_weight=1.0),
+                                  limit_pct=1000.0)
+    key = ("date", "signal", "price", "return_pct")
+    assert [tuple(t[k] for k in key) for t in port.trades] == [tuple(t[k] for k in key) for t in single.trades]
+    sells = [t for t in single.trades if t["signal"] != "BUY"]
+    assert np.allclose([port.equity_curve[t["date"]] for t in sells], [t["capital"] for t in sells], rtol=1e-12)
+
+
+def test_max_positions_and_weight():
+    """持仓数不超过上限，建仓权重不超过单票上限，按评分从高到低选股"""
+    n, m = 40, 6
+    close = {f"S{i}": np.full(n, 10.0) for i in range(m)}
+    score = {f"S{i}": np.full(n, 60.0 + i) for i in range(m)}
+    score_df, open_df, close_df = _frames(close, score=score)
+    params = PortfolioParams(BacktestParams(55, 10, 100, 50, -50), max_positions=3, max_weight=0.25)
+    res = simulate_portfolio(make_portfolio_panel(score_df, open_df, close_df), params)
+    buys = [t for t in res.trades if t["signal"] == "BUY"]
+    assert [t["symbol"] for t in buys] == ["S5", "S4", "S3"]
+    assert (res.weights > 0).sum(axis=1).max() == 3
+    assert np.isclose(res.weights.iloc[-1].max(), 0.25)
+    assert np.isclose(res.metrics["平均仓位%"], 75.0 * (n - 1) / n)
+
+
+def test_limit_up_down_and_t_plus_one():
+    """开盘涨停不买入、开盘跌停不卖出（次日按条件重试），当日买入最早次日卖出"""
+    n = 12
+    close = np.full(n, 10.0)
+    open_ = np.full(n, 10.0)
+    close[1] = 11.0           # 第1日涨停收盘
+    open_[2:] = close[2:] = 12.1  # 第2日一字涨停：不可买入，第3日开盘买入
+    score = np.full(n, 80.0)
+    score[0] = 0.0
+    score[6:] = 0.0           # 第6日收盘评分转弱，触发卖出
+    open_[7] = close[7] = 10.89  # 第7日一字跌停：不可卖出
+    close[8:] = open_[8:] = 10.89
+    score_df, open_df, close_df = _frames({"A": close}, open_={"A": open_}, score={"A": score})
+    params = PortfolioParams(BacktestParams(70, 30, 100, 50, -50, price_filter_enabled=False),
+                             max_positions=1, max_weight=1.0)
+    res = simulate_portfolio(make_portfolio_panel(score_df, open_df, close_df), params)
+    dates = score_df.index
+    assert [(t["date"], t["signal"]) for t in res.trades] == [(dates[3], "BUY"), (dates[8], "SELL-SCORE")]
+    assert res.weights["A"].iloc[3] > 0 and res.weights["A"].iloc[8] == 0
+
+    # 买入当日收盘即触发止损，次日开盘才能卖出
+    close_sl = np.full(n, 10.0)
+    close_sl[1] = 9.0
+    score_df, open_df, close_df = _frames({"A": close_sl}, score={"A": np.full(n, 80.0)})
+    params = PortfolioParams(BacktestParams(70, 30, 100, 50, -5, price_filter_enabled=False), max_positions=1, max_weight=1.0)
+    res = simulate_portfolio(make_portfolio_panel(score_df, open_df, close_df), params)
+    assert [(t["date"], t["signal"]) for t in res.trades[:2]] == [(dates[1], "BUY"), (dates[2], "SELL-SL")]
+
+
+def test_suspended_symbol_not_filled():
+    """停牌（缺失K线）期间不成交，面板按日期并集对齐"""
+    a = make_daily(200, seed=1)
+    b = make_daily(200, seed=2).drop(index=make_daily(200, seed=2).index[80:100])
+    scorer = DynamicScorer(FORMULA)
+    res = run_portfolio_backtest({"A": a, "B": b}, scorer, PortfolioParams(BacktestParams(45, 35, 5, 8, -5), max_positions=2))
+    gap = set(a.index[80:100])
+    assert not [t for t in res.trades if t["symbol"] == "B" and t["date"] in gap]
+    assert len(res.equity_curve) == 200 and res.metrics["交易次数"] > 0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试评分序列缓存：命中、追加新K线只评分尾部、数据修订后重建
+"""
+
+import sys
+import os
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import BacktestParams, run_backtest
+from dynamic_scorer import DynamicScorer
+from score_cache import CachedScorer, ScoreCache
+from test_dynamic_scorer import FORMULA, make_daily
+
+
+class CountingScorer(DynamicScorer):
+    """记录每次 score_series 评分的K线根数"""
+
+    def __init__(self, formula_info):
+        super().__init__(formula_info)
+        self.scored = []
+
+    def score_series(self, kline_data, lookback=30):
+        self.scored.append(len(kline_data))
+        return super().score_series(kline_data, lookback)
+
+
+def _expected(scorer, kline, lookback=30):
+    return DynamicScorer.score_series(scorer, kline, lookback)['score'].to_numpy().astype(np.float32).astype(float)
+
+
+def test_append_scores_only_tail():
+    """命中时不评分，追加K线时只对尾部（含回看窗口）评分，切片查询复用缓存"""
+    scorer = CountingScorer(FORMULA)
+    kl = make_daily(500, seed=3)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ScoreCache(tmp)
+        first = cache.get_scores('600519', scorer, kl.iloc[:400])
+        assert np.array_equal(first.to_numpy(), _expected(scorer, kl.iloc[:400]))
+        assert scorer.scored == [400]
+
+        assert np.array_equal(cache.get_scores('600519', scorer, kl.iloc[:400]).to_numpy(), first.to_numpy())
+        assert np.array_equal(cache.get_scores('600519', scorer, kl.iloc[:250]).to_numpy(), first.to_numpy()[:250])
+        assert scorer.scored == [400] and cache.hits == 2
+
+        full = cache.get_scores('600519', scorer, kl)
+        assert scorer.scored == [400, 100 + 29]
+        assert np.array_equal(full.to_numpy(), _expected(scorer, kl))
+
+        # 中段切片：前 29 根窗口不完整需单独评分，其余取自缓存
+        scorer.scored.clear()
+        middle = cache.get_scores('600519', scorer, kl.iloc[120:480])
+        assert scorer.scored == [29]
+        assert np.array_equal(middle.to_numpy(), _expected(scorer, kl.iloc[120:480]))
+        assert len(os.listdir(tmp)) == 1
+
+
+def test_revised_data_rebuilds():
+    """缓存覆盖的K线被修订（如复权）时重新评分并以最新数据重建"""
+    scorer = CountingScorer(FORMULA)
+    kl = make_daily(300, seed=4)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ScoreCache(tmp)
+        cache.get_scores('000001', scorer, kl)
+        revised = kl.copy()
+        revised['收盘'] = revised['收盘'] * 0.98
+        got = cache.get_scores('000001', scorer, revised)
+        assert scorer.scored == [300, 300]
+        assert np.array_equal(got.to_numpy(), _expected(scorer, revised))
+        cache.get_scores('000001', scorer, revised)
+        assert scorer.scored == [300, 300]
+
+        # 公式或回看窗口不同则为不同条目
+        cache.get_scores('000001', scorer, revised, lookback=20)
+        assert len(os.listdir(tmp)) == 2
+        assert cache.clear('000001') == 2
+
+
+def test_cached_scorer_in_backtest():
+    """CachedScorer 可直接用于回测，结果与原评分器一致"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(300, seed=5).reset_index().rename(columns={'index': '日期'})
+    params = BacktestParams(buy_threshold=55, sell_threshold=40, max_holding_days=7, take_profit_pct=8, stop_loss_pct=-5)
+    with tempfile.TemporaryDirectory() as tmp:
+        cached = CachedScorer(scorer, '600000', ScoreCache(tmp))
+        assert cached.rule_list() == scorer.rule_list()
+        for _ in range(2):
+            res = run_backtest(kl, cached, params)
+            ref = run_backtest(kl, scorer, params)
+            assert res.trades == ref.trades and res.metrics == ref.metrics
+            pd.testing.assert_series_equal(res.equity_curve, ref.equity_curve)
+
+
+def test_cached_scorer_unsorted_input():
+    """输入K线未按日期排序时，评分仍对应到原始行"""
+    scorer = DynamicScorer(FORMULA)
+    kl = make_daily(200, seed=6)
+    shuffled = kl.iloc[np.random.default_rng(0).permutation(len(kl))]
+    expected = pd.Series(_expected(scorer, kl), index=kl.index)
+    with tempfile.TemporaryDirectory() as tmp:
+        cached = CachedScorer(scorer, '600036', ScoreCache(tmp))
+        for data in (kl.iloc[::-1], shuffled, shuffled.reset_index().rename(columns={'index': '日期'})):
+            got = cached.score_series(data)
+            assert got.index.equals(data.index)
+            dates = data['日期'] if '日期' in data.columns else data.index
+            assert np.array_equal(got['score'].to_numpy(), expected.loc[dates].to_numpy(), equal_nan=True)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")